@@ -18,21 +18,25 @@
 #
 ####################################################################################################
 
+from concurrent.futures import ProcessPoolExecutor
 from enum import Enum
 from pathlib import Path
 from pprint import pprint
 import logging
 
 import matplotlib.pyplot as plt
+import numpy as np
 
 from SnowAvalancheData.Data import AccidentRegister, Accident, AccidentDataFrame
+from SnowAvalancheData.Data.BinarySnapshot import SNAPSHOT_SUFFIX
+from SnowAvalancheData.Data.Predicate import isin
 from SnowAvalancheData.Data.DataType import *
 from SnowAvalancheData.Plot import Figure
 from SnowAvalancheData.Statistics.Histogram import (
     Histogram,
     Histogram2D,
     EnumHistogram,
-    Binning1D, Interval, BinningND,
+    Binning1D, Interval, BinningND, VariableBinning1D,
 )
 from SnowAvalancheData.Statistics.BinningAlgorithm import knuth_bin_width
 
@@ -57,6 +61,12 @@ class Analysis:
         'width': 15,   # m / 24
     }
 
+    # skewed distributions use quantile bins
+    ATTRIBUTE_NUMBER_OF_QUANTILES = {
+        'area': 20,
+        'volume': 20,
+    }
+
     ATTRIBUTE_TITLE = {
         'move_direction': 'Moving Direction',
         'orientation': 'Slope Orientation',
@@ -74,9 +84,9 @@ class Analysis:
 
     ##############################################
 
-    def __init__(self, path: Path) -> None:
+    def __init__(self, path: Path, write_snapshot: bool=False) -> None:
         self.accidents = None
-        self.load_data(path)
+        self.load_data(path, write_snapshot)
         # self.filter_data()
         # self.create_histograms()
         # self.fill_histograms()
@@ -86,39 +96,74 @@ class Analysis:
 
     ##############################################
 
-    def load_data(self, path: Path) -> None:
-        self._logger.info(f'Load {path}')
-        self.accidents = AccidentRegister.load_json(path)
+    def load_data(self, path: Path, write_snapshot: bool=False) -> None:
+        """Load the JSON data, or the binary snapshot if it is up to date
+
+        An invalid snapshot, e.g. truncated or written for another model, is ignored.  If
+        *write_snapshot* is set, a snapshot is written when the JSON data are loaded.
+
+        """
+        path = Path(path)
+        snapshot_path = path.with_suffix(SNAPSHOT_SUFFIX)
+        self.accidents = None
+        if snapshot_path.exists() and snapshot_path.stat().st_mtime >= path.stat().st_mtime:
+            self._logger.info(f'Load {snapshot_path}')
+            try:
+                self.accidents = AccidentRegister.load_binary(snapshot_path)
+            except (ValueError, KeyError, OSError) as exception:
+                self._logger.warning(f"Invalid snapshot {snapshot_path}, load the JSON data: {exception}")
+        if self.accidents is None:
+            self._logger.info(f'Load {path}')
+            self.accidents = AccidentRegister.load_json(path)
+            if write_snapshot:
+                try:
+                    self.accidents.save_binary(snapshot_path)
+                except OSError as exception:
+                    self._logger.warning(f"Cannot write snapshot {snapshot_path}: {exception}")
+        # the data were validated, the analysis only reads attributes
+        self.accidents.use_records()
 
     ##############################################
 
     def filter_data(self) -> None:
         self.filtered_accidents = self.accidents.and_filter(
-            activity=lambda _: _ in (Activity.HIKING, Activity.MOUNTAINEERING),
+            isin('activity', (Activity.HIKING, Activity.MOUNTAINEERING)),
         )
-        self.data_frame = AccidentDataFrame(self.filtered_accidents)
+        self.data_frame = self.filtered_accidents.data_frame()
 
     ##############################################
 
-    def compute_bin_width(self) -> None:
-        self._logger.info('Compute bin width histograms')
+    def compute_bin_width(self, max_workers: int=None) -> dict[str, float]:
+        """Compute the Knuth bin width of the numeric attributes, attributes run in parallel
 
-        def compute(attribute):
-            getter_attribute = self.ATTRIBUTE_MAPPER.get(attribute, attribute)
-            data = self.filtered_accidents.vectorise(getter_attribute)
-            bin_width = knuth_bin_width(data)
-            print(f'{attribute} {bin_width:.2f}')
+        If *max_workers* is 1 the computation runs in this process.
+
+        """
+        self._logger.info('Compute bin width histograms')
 
+        attributes = []
         for attribute, type_ in Accident.attribute_types():
             if (attribute in ('number_of_persons', 'departement', 'bra_level')
                 or attribute in Accident.RATIO_ATTRIBUTES
                 ):
                 continue
             if type_ in (int, float, Delay):
-                compute(attribute)
-
-        for attribute in ('area', 'volume'):
-            compute(attribute)
+                attributes.append(attribute)
+        attributes += ['area', 'volume']
+
+        data = [
+            self.filtered_accidents.vectorise(self.ATTRIBUTE_MAPPER.get(_, _))
+            for _ in attributes
+        ]
+        if max_workers == 1:
+            bin_widths = list(map(knuth_bin_width, data))
+        else:
+            with ProcessPoolExecutor(max_workers=max_workers) as executor:
+                bin_widths = list(executor.map(knuth_bin_width, data))
+
+        for attribute, bin_width in zip(attributes, bin_widths):
+            print(f'{attribute} {bin_width:.2f}')
+        return dict(zip(attributes, bin_widths))
 
     ##############################################
 
@@ -133,6 +178,12 @@ class Analysis:
         def create_histogram(attribute: str, title: str, unit: str) -> None:
             self._logger.info(f'  Scan inf/sup for {attribute}')
             getter_attribute = self.ATTRIBUTE_MAPPER.get(attribute, attribute)
+            if attribute in self.ATTRIBUTE_NUMBER_OF_QUANTILES:
+                data = self.filtered_accidents.vectorise(getter_attribute)
+                binning = VariableBinning1D.from_quantiles(data, self.ATTRIBUTE_NUMBER_OF_QUANTILES[attribute])
+                self._logger.info(f'{attribute} {binning.number_of_bins} quantile bins')
+                self.histograms[attribute] = Histogram(binning=binning, title=title, unit=unit)
+                return
             inf, sup = self.filtered_accidents.inf_sup(getter_attribute)
             sup += 1
             bin_width = self.ATTRIBUTE_BIN_WIDTH.get(attribute, 1)
@@ -197,28 +248,47 @@ class Analysis:
 
     ##############################################
 
-    def fill_histograms(self) -> None:
+    def weights_by(self, attribute: str, weights: dict) -> np.ndarray:
+        """Return weights aligned on the filtered accidents
+
+        *weights* maps a value of the attribute to a weight, e.g. an exposure estimate per activity
+        or per season.  Accidents having a null or an unlisted value weigh 0.
+
+        """
+        data, mask = self.filtered_accidents.column_arrays(attribute)
+        # enumerates are stored as their value
+        keys = np.array([_.value if isinstance(_, Enum) else _ for _ in weights.keys()])
+        values = np.array(list(weights.values()), dtype=np.float64)
+        order = np.argsort(keys)
+        keys = keys[order]
+        values = values[order]
+        indexes = np.clip(np.searchsorted(keys, data), 0, keys.size - 1)
+        found = mask & (keys[indexes] == data)
+        return np.where(found, values[indexes], 0.)
+
+    ##############################################
+
+    def fill_histograms(self, weights: np.ndarray=None) -> None:
+        """Fill the histograms, *weights* is an optional array aligned on the filtered accidents"""
         self._logger.info('Fill histograms')
-        # Fixme: also impl vectorize / vs cpu ram
-        for accident in self.filtered_accidents:
-            # self._logger.info(accident.__dict__)
-
-            for attribute, histogram in self.histograms.items():
-                getter_attribute = self.ATTRIBUTE_MAPPER.get(attribute, attribute)
-                value = getattr(accident, getter_attribute)
-                if value is not None:
-                    histogram.fill(value)
-                    if attribute in Accident.RATIO_ATTRIBUTES:
-                        value = getattr(accident, f'ratio_{attribute}')
-                        if value is not None:
-                            ratio_histogram = self.ratio_histograms[attribute]
-                            ratio_histogram.fill(value)
-
-            for attribute, histogram in self.histograms_2d.items():
-                attributes = attribute.split('/')
-                values = [_ for _ in [getattr(accident, _) for _ in attributes] if _ is not None]
-                if len(values) == len(attributes):
-                    histogram.fill(*values)
+        accidents = self.filtered_accidents
+
+        def fill(histogram, *attributes: str) -> None:
+            if weights is None:
+                histogram.fill_array(*accidents.vectorise_joint(*attributes))
+            else:
+                arrays = [accidents.column_arrays(_) for _ in attributes]
+                mask = np.logical_and.reduce([_[1] for _ in arrays])
+                histogram.fill_array(*[data[mask] for data, _ in arrays], weights=weights[mask])
+
+        for attribute, histogram in self.histograms.items():
+            getter_attribute = self.ATTRIBUTE_MAPPER.get(attribute, attribute)
+            fill(histogram, getter_attribute)
+            if attribute in Accident.RATIO_ATTRIBUTES:
+                fill(self.ratio_histograms[attribute], f'ratio_{attribute}')
+
+        for attribute, histogram in self.histograms_2d.items():
+            fill(histogram, *attribute.split('/'))
 
     ##############################################
 
@@ -357,7 +427,7 @@ class Analysis:
                 # figure.box_plot(histogram, title='')
                 figure.xy(
                     # *[self.filtered_accidents.vectorise(_) for _ in attribute],
-                    *[self.data_frame.df[_] for _ in attribute],
+                    *[self.data_frame.df[_].to_numpy(dtype=float, na_value=np.nan) for _ in attribute],
                     x_label=attribute[0],
                     y_label=attribute[1],
                 )
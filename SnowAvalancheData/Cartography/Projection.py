@@ -22,6 +22,8 @@ __all__ = [
     'UTM',
     'WGS84',
     'RGF93',
+    'web_mercator_to_wgs84',
+    'wgs84_to_rgf93',
 ]
 
 ####################################################################################################
@@ -40,6 +42,22 @@ WGS84 = pyproj.Proj(init='epsg:4326')
 # proj4:  +proj=lcc +lat_1=49 +lat_2=44 +lat_0=46.5 +lon_0=3 +x_0=700000 +y_0=6600000 +ellps=GRS80 +towgs84=0,0,0,0,0,0,0 +units=m +no_defs
 RGF93 = pyproj.Proj(init='epsg:2154')
 
+_WGS84_TO_RGF93 = pyproj.Transformer.from_crs('EPSG:4326', 'EPSG:2154', always_xy=True)
+
+# WGS 84 / Pseudo-Mercator -- used by web maps, e.g. camptocamp
+# https://epsg.io/3857
+_WEB_MERCATOR_TO_WGS84 = pyproj.Transformer.from_crs('EPSG:3857', 'EPSG:4326', always_xy=True)
+
+####################################################################################################
+
+def wgs84_to_rgf93(longitude, latitude):
+    """Project WGS84 longitudes and latitudes to Lambert 93 (x, y) in meters, arrays are supported"""
+    return _WGS84_TO_RGF93.transform(longitude, latitude)
+
+def web_mercator_to_wgs84(x, y):
+    """Unproject web mercator (x, y) in meters to WGS84 longitudes and latitudes, arrays are supported"""
+    return _WEB_MERCATOR_TO_WGS84.transform(x, y)
+
 ####################################################################################################
 
 class Utm:
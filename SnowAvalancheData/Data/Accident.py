@@ -36,7 +36,7 @@ __all__ = [
 
 from enum import Enum
 from pathlib import Path
-from typing import Iterator, ClassVar, Optional, List
+from typing import Callable, Iterator, ClassVar, Optional, List
 import datetime
 import logging
 import os
@@ -46,11 +46,23 @@ import json
 # https://github.com/ultrajson/ultrajson
 # import ujson
 # https://github.com/ijl/orjson
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 from pydantic import BaseModel
 import numpy as np
 import pandas as pd
 
+from .AccidentRecord import AccidentRecord, record_class
+from .AccidentStore import AccidentStore, ColumnKind
+from .BitmapIndex import Bitset
+from .DerivedColumn import DerivedColumn
+from .PatchJournal import Change, CodeIndex, PatchJournal
+from . import TemporalIndex
+from .Summary import RegisterSummary
+from .Predicate import Predicate, conjunction
 from .DataType import *
 
 ####################################################################################################
@@ -59,6 +71,16 @@ _module_logger = logging.getLogger(__name__)
 
 ####################################################################################################
 
+def read_json(path: Path):
+    """Read a JSON file using orjson if available"""
+    if orjson is not None:
+        with open(path, 'rb') as fh:
+            return orjson.loads(fh.read())
+    with open(path, 'r') as fh:
+        return json.load(fh)
+
+####################################################################################################
+
 class Accident(BaseModel):
     code: str
     activity: Optional[Activity] = None
@@ -245,7 +267,7 @@ class Accident(BaseModel):
 
     ##############################################
 
-    # Fixme: cache ??? __getattr__ ???
+    # Registers use the vectorised derived columns defined below
 
     @property
     def ratio_injured(self) -> float:
@@ -293,6 +315,46 @@ class Accident(BaseModel):
 
 ####################################################################################################
 
+# Derived columns, they match the properties of Accident
+
+def _ratio_column(attribute: str) -> DerivedColumn:
+    def ratio(columns: dict) -> tuple[np.ndarray, np.ndarray]:
+        value, value_mask = columns[attribute]
+        number_of_persons, number_of_persons_mask = columns['number_of_persons']
+        mask = value_mask & number_of_persons_mask & (number_of_persons != 0)
+        data = np.zeros(mask.size, dtype=np.float64)
+        np.divide(value, number_of_persons, out=data, where=mask)
+        return data * 100, mask
+    return DerivedColumn(f'ratio_{attribute}', (attribute, 'number_of_persons'), ratio)
+
+def _area(columns: dict) -> tuple[np.ndarray, np.ndarray]:
+    (length, length_mask), (width, width_mask) = columns['length'], columns['width']
+    return length.astype(np.int64) * width, length_mask & width_mask
+
+def _volume(columns: dict) -> tuple[np.ndarray, np.ndarray]:
+    (area, area_mask), (thickness, thickness_mask) = columns['area'], columns['thickness_max']
+    return area * thickness / 100, area_mask & thickness_mask
+
+def _rescue_delay_minutes(columns: dict) -> tuple[np.ndarray, np.ndarray]:
+    return columns['rescue_delay']
+
+for _ in Accident.RATIO_ATTRIBUTES:
+    DerivedColumn.register(Accident, _ratio_column(_))
+DerivedColumn.register(Accident, DerivedColumn('area', ('length', 'width'), _area))
+DerivedColumn.register(Accident, DerivedColumn('volume', ('area', 'thickness_max'), _volume))
+DerivedColumn.register(Accident, DerivedColumn('rescue_delay_minutes', ('rescue_delay',), _rescue_delay_minutes))
+
+def _date_key(function) -> Callable[[dict], tuple[np.ndarray, np.ndarray]]:
+    def key(columns: dict) -> tuple[np.ndarray, np.ndarray]:
+        dates, mask = columns['date']
+        return function(dates), mask
+    return key
+
+for _ in (TemporalIndex.season, TemporalIndex.month, TemporalIndex.day_of_season, TemporalIndex.weekday):
+    DerivedColumn.register(Accident, DerivedColumn(_.__name__, ('date',), _date_key(_)))
+
+####################################################################################################
+
 class AccidentList(BaseModel):
 
     # https://pydantic-docs.helpmanual.io/usage/models/#custom-root-types
@@ -325,21 +387,108 @@ class AccidentList(BaseModel):
 
 class AccidentRegisterMixin:
 
+    """Base class for registers, accidents are stored in a columnar :class:`AccidentStore`.
+
+    A register is a store and an optional array of row indexes, :obj:`None` means all the rows of the
+    store.
+
+    In record mode, the register yields read-only :class:`AccidentRecord` instead of model instances,
+    views inherit the mode of their parent.
+
+    Accidents are built from the store when they are accessed, thus they are detached copies: modifying
+    an accident doesn't modify the register, use :meth:`AccidentRegister.fix` or the store.
+
+    """
+
+    _data_frame = None
+    _summary = None
+    _record_mode = False
+
     ##############################################
 
     def __init___(self) -> None:
-        self._items = None
+        self._store = None
+        self._rows = None
 
     ##############################################
 
-    def __len__(self) -> int:
-        return len(self._items)
+    @property
+    def store(self) -> AccidentStore:
+        return self._store
 
-    def __iter__(self) -> Iterator[Accident]:
-        return iter(self._items)
+    @property
+    def rows(self) -> np.ndarray:
+        """Array of store rows or :obj:`None` for all the rows"""
+        return self._rows
+
+    @property
+    def bitset(self) -> Bitset:
+        """Rows as a bitset"""
+        size = len(self._store)
+        rows = self.rows
+        if rows is None:
+            return Bitset.full(size)
+        return Bitset.from_rows(rows, size)
+
+    ##############################################
+
+    @property
+    def record_mode(self) -> bool:
+        return self._record_mode
+
+    def use_records(self, enabled: bool=True) -> None:
+        """Yield lightweight read-only records, values were validated when the store was filled"""
+        self._record_mode = enabled
+
+    def _accident(self, row: int) -> Accident | AccidentRecord:
+        if self.record_mode:
+            return record_class(self._store.model)(self._store, row)
+        return self._store.accident(row)
+
+    ##############################################
+
+    def _row_iterator(self) -> Iterator[int]:
+        rows = self.rows
+        if rows is None:
+            return iter(range(len(self._store)))
+        else:
+            return iter(rows.tolist())
 
-    def __getitem__(self, i: int) -> Accident:
-        return self._items[i]
+    ##############################################
+
+    def __len__(self) -> int:
+        rows = self.rows
+        if rows is None:
+            return len(self._store)
+        else:
+            return rows.size
+
+    def __iter__(self) -> Iterator[Accident | AccidentRecord]:
+        """Yield the accidents, they are detached copies of the stored values"""
+        if self.record_mode:
+            cls = record_class(self._store.model)
+            for row in self._row_iterator():
+                yield cls(self._store, row)
+        else:
+            for row in self._row_iterator():
+                yield self._store.accident(row)
+
+    def __getitem__(self, i: int | slice) -> 'Accident | AccidentRecord | FilteredAccidentRegister':
+        """Return an accident, a detached copy, or a view for a slice
+
+        Like any view, the rows of a slice are kept in the store order.
+
+        """
+        rows = self.rows
+        if isinstance(i, slice):
+            if rows is None:
+                rows = np.arange(len(self._store), dtype=np.int64)
+            return FilteredAccidentRegister(self, rows[i])
+        if rows is not None:
+            i = int(rows[i])
+        elif i < 0:
+            i += len(self._store)
+        return self._accident(i)
 
     ##############################################
 
@@ -350,48 +499,109 @@ class AccidentRegisterMixin:
                 ensure_ascii=False,
                 sort_keys=True,
             )
-            _ = self._items.json(**dumps_kwargs)
+            accidents = [self._store.accident(_) for _ in self._row_iterator()]
+            _ = AccidentList.construct(__root__=accidents).json(**dumps_kwargs)
             fh.write(_)
 
     ##############################################
 
+    def write_json_lines(self, path: Path, append: bool=False) -> None:
+        """Write in the JSON Lines format, see :mod:`JsonLines`"""
+        from .JsonLines import JsonLinesWriter
+        with JsonLinesWriter(path, append=append) as writer:
+            writer.write_register(self)
+
+    ##############################################
+
+    def save_binary(self, path: Path) -> None:
+        """Write a memory mappable snapshot, see :mod:`BinarySnapshot`"""
+        from .BinarySnapshot import save_binary
+        save_binary(self.store, path, self.rows)
+
+    ##############################################
+
+    def describe(self) -> RegisterSummary:
+        """Return the summary statistics, they are cached until the store is modified"""
+        version = self._store.version
+        if self._summary is None or self._summary[0] != version:
+            self._summary = (version, RegisterSummary(self))
+        return self._summary[1]
+
+    ##############################################
+
     def inf_sup(self, attribute: str) -> tuple[int, int]:
-        inf = None
-        sup = None
-        for item in self:
-            value = getattr(item, attribute)
-            if value is not None:
-                if inf is None:
-                    inf = value
-                    sup = value
-                else:
-                    inf = min(inf, value)
-                    sup = max(sup, value)
-        return inf, sup
+        summary = self.describe()
+        if attribute in summary:
+            _ = summary[attribute]
+            return _.min, _.max
+        array = self.vectorise(attribute)
+        if not len(array):
+            return None, None
+        return array.min().item(), array.max().item()
 
     ##############################################
 
-    def data_frame(self) -> pd.DataFrame:
-        return AccidentDataFrame(self)
+    def check_consistency(self, rules: list['Rule']=None) -> 'ViolationTable':
+        """Run vectorised consistency rules, see :mod:`ConsistencyCheck`"""
+        from .ConsistencyCheck import ConsistencyChecker
+        return ConsistencyChecker(rules).check(self)
+
+    ##############################################
+
+    def data_frame(self) -> 'AccidentDataFrame':
+        """Return the data frame, it is cached until the store is modified"""
+        version = self._store.version
+        if self._data_frame is None or self._data_frame[0] != version:
+            self._data_frame = (version, AccidentDataFrame(self))
+        return self._data_frame[1]
 
     ##############################################
 
     def vectorise(self, attribute: str) -> np.ndarray:
+        """Return the non-null values of an attribute as an array.
+
+        For a store field, the column representation is returned: enumerate values, date as
+        datetime64, delay in minutes, coordinate as a (latitude, longitude, altitude) array.  When
+        the values cover the whole store without null, the array is a read-only zero-copy view.
+        Derived columns, e.g. ``ratio_dead`` or ``area``, are computed once and cached by the store.
+
+        """
+        if attribute in self._store or self._store.is_derived(attribute):
+            return self._store.values(attribute, self.rows)
         array = [getattr(_, attribute) for _ in self]
         array = [_ for _ in array if _ is not None]
-        try:
-            type_ = Accident.attribute_type(attribute)
-        except KeyError:
-            # Fixme: 
-            type_ = type(array[0])
-        if type_ is int:
-            dtype = np.int
-        elif type_ is float:
-            dtype = np.float
+        if array and isinstance(array[0], int):
+            dtype = np.int_
         else:
-            return array
+            dtype = np.float64
         return np.array(array, dtype=dtype)
 
+    ##############################################
+
+    def column_arrays(self, attribute: str) -> tuple[np.ndarray, np.ndarray]:
+        """Return the (data, mask) arrays of a field or a derived column for the register rows"""
+        store = self._store
+        if attribute in store:
+            data, mask = store.column(attribute), store.mask(attribute)
+        else:
+            data, mask = store.derived(attribute)
+        rows = self.rows
+        if rows is not None:
+            data, mask = data[rows], mask[rows]
+        return data, mask
+
+    ##############################################
+
+    def vectorise_joint(self, *attributes: str) -> list[np.ndarray]:
+        """Return aligned arrays of the rows where all the attributes are not null
+
+        Attributes are fields or derived columns, values use the column representation.
+
+        """
+        arrays = [self.column_arrays(_) for _ in attributes]
+        mask = np.logical_and.reduce([_[1] for _ in arrays])
+        return [data[mask] for data, _ in arrays]
+
 ####################################################################################################
 
 class AccidentRegister(AccidentRegisterMixin):
@@ -399,7 +609,16 @@ class AccidentRegister(AccidentRegisterMixin):
     ##############################################
 
     @classmethod
-    def load_json(cls, path: Path) -> 'AccidentRegister':
+    def load_json(cls, path: Path, bulk: bool=True) -> 'AccidentRegister':
+        """Load a JSON register.
+
+        The bulk path converts the columns at once and validates them in a vectorised pass, else each
+        accident is parsed by pydantic.
+
+        """
+        if bulk:
+            data = read_json(path)
+            return cls(AccidentStore.from_records(Accident, data))
         with open(path, 'r') as fh:
             data = json.load(fh)
         accidents = cls()
@@ -409,8 +628,40 @@ class AccidentRegister(AccidentRegisterMixin):
 
     ##############################################
 
-    def __init__(self) -> None:
-        self._items = AccidentList()
+    @classmethod
+    def load_json_lines(cls, path: Path) -> 'AccidentRegister':
+        """Load a JSON Lines register, see :mod:`JsonLines`"""
+        from .JsonLines import JsonLinesReader
+        return JsonLinesReader(path).load()
+
+    ##############################################
+
+    @classmethod
+    def load_binary(cls, path: Path, mmap: bool=True) -> 'AccidentRegister':
+        """Load a snapshot written by :meth:`save_binary`, see :mod:`BinarySnapshot`"""
+        from .BinarySnapshot import load_binary
+        return cls(load_binary(path, Accident, mmap))
+
+    ##############################################
+
+    def __init__(self, store: AccidentStore=None) -> None:
+        if store is None:
+            store = AccidentStore(Accident)
+        self._store = store
+        self._rows = None
+        self._code_index = None
+
+    ##############################################
+
+    @property
+    def code_index(self) -> CodeIndex:
+        """Index of the rows by accident code, it is kept up to date with the store"""
+        if self._code_index is None:
+            self._code_index = CodeIndex(self._store)
+        return self._code_index
+
+    def by_code(self, code: str) -> Accident | AccidentRecord:
+        return self._accident(self.code_index.row(code))
 
     ##############################################
 
@@ -418,87 +669,237 @@ class AccidentRegister(AccidentRegisterMixin):
     def __iadd__(self, item: Accident) -> 'AccidentRegister':
         match item:
             case Accident():
-                self._items.append(item)
+                self._store.append(item)
             case AccidentRegister():
-                self._items.extend(item)
+                self._store.extend(item.store)
         return self
 
     ##############################################
 
-    def and_filter(self, **kwargs) -> 'FilteredAccidentRegister':
-        return FilteredAccidentRegister(self, **kwargs)
+    def and_filter(self, *predicates: Predicate, **kwargs) -> 'FilteredAccidentRegister':
+        """Return a view, *kwargs* are functions or values, see :func:`Predicate.conjunction`"""
+        return FilteredAccidentRegister(self, predicate=conjunction(*predicates, **kwargs))
 
     ##############################################
 
-    def fix(self, path: Path) -> None:
-        with open(path, 'r') as fh:
-            patches = json.load(fh)
-        code_map = {_.code:_ for _ in self}
-        for code, patch in patches.items():
-            accident = code_map[code]
-            for attribute, value in patch.items():
-                setattr(accident, attribute, value)
+    def fix(self, path: Path | PatchJournal, revision: int=None) -> list[Change]:
+        """Apply a patch journal or a fixes file, see :mod:`PatchJournal`, and return the changes"""
+        journal = path if isinstance(path, PatchJournal) else PatchJournal.load(path)
+        return journal.apply(self._store, self.code_index, revision)
+
+    ##############################################
+
+    def patched(self, path: Path | PatchJournal, revision: int=None) -> 'AccidentRegister':
+        """Return a patched register, the columns which are not patched are shared with this register"""
+        register = self.__class__(self._store.overlay())
+        register.fix(path, revision)
+        return register
 
 ####################################################################################################
 
 class FilteredAccidentRegister(AccidentRegisterMixin):
 
+    """Lazy view on a register, accidents are not copied
+
+    A view is defined by its parent and a predicate, or by an explicit array of rows.  The rows are
+    only evaluated when they are required, e.g. to iterate or to export, then they are cached until
+    the store is modified.  The predicates of a chain of views are combined and evaluated at once
+    on the rows of the nearest evaluated ancestor, thus intermediate views cost nothing.
+
+    """
+
     ##############################################
 
-    def __init__(self, parent: AccidentRegister, items=None, **kwargs) -> None:
+    def __init__(self, parent: AccidentRegisterMixin, rows=None, predicate: Predicate=None) -> None:
         self._parent = parent
-        if items is not None:
-            self._items = list(items)
+        self._store = parent.store
+        # if rows are given, the predicate only describes the selection
+        self._predicate = predicate
+        if rows is not None:
+            self._selection = np.unique(np.asarray(rows, dtype=np.int64))
         else:
-            self._items = list(iter(parent))
-            if kwargs:
-                self.and_filter(**kwargs)
+            self._selection = None
+        self._rows = None
+        self._version = None
+        # inherit the record mode of the parent
+        self._record_mode = None
 
     ##############################################
 
     @property
-    def parent(self):
+    def parent(self) -> AccidentRegisterMixin:
         return self._parent
 
+    @property
+    def record_mode(self) -> bool:
+        if self._record_mode is None:
+            return self._parent.record_mode
+        return self._record_mode
+
+    @property
+    def predicate(self) -> Predicate:
+        """Predicate applied to the parent"""
+        return self._predicate
+
+    @property
+    def is_evaluated(self) -> bool:
+        return self._selection is not None or self._version == self._store.version
+
     ##############################################
 
-    def and_filter(self, **kwargs) -> None:
-        def function(accident: Accident):
-            for attribute, attribute_filter in kwargs.items():
-                value = getattr(accident, attribute)
-                if not attribute_filter(value):
-                    return False
-            return True
-        self._items = list(filter(function, self._items))
+    @property
+    def rows(self) -> np.ndarray:
+        if self._selection is not None:
+            return self._selection
+        if not self.is_evaluated:
+            self._rows = self._evaluate()
+            self._version = self._store.version
+        return self._rows
 
     ##############################################
 
-    def __ior__(self, other: 'FilteredAccidentRegister') -> 'FilteredAccidentRegister':
-        items = set(iter(self)) | set(iter(other))
-        return FilteredAccidentRegister(self.parent, items)
+    def _evaluate(self) -> np.ndarray:
+        # Walk up to an evaluated ancestor and collect the predicates
+        predicates = []
+        register = self
+        while True:
+            if register is not self and (not isinstance(register, FilteredAccidentRegister) or register.is_evaluated):
+                rows = register.rows
+                break
+            if register._predicate is not None:
+                predicates.append(register._predicate)
+            register = register._parent
+        predicate = conjunction(*reversed(predicates))
+        if predicate is None:
+            if rows is None:
+                return np.arange(len(self._store), dtype=np.int64)
+            return rows
+        return predicate.select(self._store, rows)
+
+    ##############################################
+
+    def and_filter(self, *predicates: Predicate, **kwargs) -> 'FilteredAccidentRegister':
+        """Return a sub-view, see :meth:`AccidentRegister.and_filter`"""
+        return FilteredAccidentRegister(self, predicate=conjunction(*predicates, **kwargs))
+
+    ##############################################
+
+    def _set_operation(self, other: AccidentRegisterMixin, operation: str) -> 'FilteredAccidentRegister':
+        if other.store is not self._store:
+            raise ValueError("Registers don't share the same store")
+        match operation:
+            case '|':
+                bitset = self.bitset | other.bitset
+            case '&':
+                bitset = self.bitset & other.bitset
+            case '-':
+                bitset = self.bitset - other.bitset
+        predicate = getattr(other, 'predicate', None)
+        if self._predicate is not None and predicate is not None:
+            match operation:
+                case '|':
+                    predicate = self._predicate | predicate
+                case '&':
+                    predicate = self._predicate & predicate
+                case '-':
+                    predicate = self._predicate & ~predicate
+        else:
+            predicate = None
+        return FilteredAccidentRegister(self.parent, bitset.to_rows(), predicate)
+
+    def __or__(self, other: AccidentRegisterMixin) -> 'FilteredAccidentRegister':
+        return self._set_operation(other, '|')
+
+    def __and__(self, other: AccidentRegisterMixin) -> 'FilteredAccidentRegister':
+        return self._set_operation(other, '&')
+
+    def __sub__(self, other: AccidentRegisterMixin) -> 'FilteredAccidentRegister':
+        return self._set_operation(other, '-')
+
+    __ior__ = __or__
 
 ####################################################################################################
 
 class AccidentDataFrame:
 
-    ##############################################
+    """Pandas data frame built from the store columns
 
-    def __init__(self, register: AccidentRegisterMixin) -> None:
-        attributes = [_ for _ in Accident.__fields__ if _ not in ('rescue_delay',)]
-        data = {
-            attribute: [getattr(_, attribute) for _ in register]
-            for attribute in attributes
-        }
-        df = pd.DataFrame(data)
+    * enumerates and strings are :class:`pandas.Categorical`, enumerate categories are the members,
+    * integers and booleans use the nullable extension types, e.g. ``Int16``,
+    * dates are ``datetime64[s]`` with ``NaT`` for null,
+    * the coordinate is split in ``latitude`` and ``longitude`` float columns,
+    * ``rescue_delay`` is in minutes,
+    * derived columns ``area``, ``volume``, ``ratio_*`` and the calendar keys ``season``, ``month``,
+      ``day_of_season`` and ``weekday`` are appended.
+
+    """
 
-        df['rescue_delay'] = [_.rescue_delay_minutes for _ in register]
+    NULLABLE_DTYPE = {
+        np.dtype(np.int8): pd.Int8Dtype(),
+        np.dtype(np.int16): pd.Int16Dtype(),
+        np.dtype(np.int32): pd.Int32Dtype(),
+        np.dtype(np.int64): pd.Int64Dtype(),
+    }
 
-        df['area'] = df['length'] * df['width']
-        df['volume'] = df['area'] * df['thickness_max'] / 100
-        for attribute in Accident.RATIO_ATTRIBUTES:
-            df[f'ratio_{attribute}'] = df[attribute] / df['number_of_persons'] * 100
+    ##############################################
 
-        self.df = df
+    def __init__(self, register: AccidentRegisterMixin) -> None:
+        store = register.store
+        rows = register.rows
+        if rows is None:
+            rows = slice(0, len(store))
+
+        def arrays(name: str) -> tuple[np.ndarray, np.ndarray]:
+            if name in store:
+                data, mask = store.column(name), store.mask(name)
+            else:
+                data, mask = store.derived(name)
+            return data[rows], mask[rows]
+
+        data = {}
+        for spec in store.specs():
+            name = spec.name
+            column = store.column_object(name)
+            values, mask = arrays(name)
+            match spec.kind:
+                case ColumnKind.ENUM:
+                    members = list(spec.type)
+                    code_map = np.full(max(_.value for _ in members) + 1, -1, dtype=np.int16)
+                    code_map[[_.value for _ in members]] = np.arange(len(members))
+                    codes = np.where(mask, code_map[values], -1)
+                    data[name] = pd.Categorical.from_codes(codes, categories=members)
+                case ColumnKind.STRING:
+                    codes = np.where(mask, values, -1)
+                    categorical = pd.Categorical.from_codes(codes, categories=column.vocabulary)
+                    if register.rows is not None:
+                        # the vocabulary is shared by the whole store
+                        categorical = categorical.remove_unused_categories()
+                    data[name] = categorical
+                case ColumnKind.INT | ColumnKind.DELAY:
+                    data[name] = pd.array(values, dtype=self.NULLABLE_DTYPE[spec.dtype])
+                    data[name][~mask] = pd.NA
+                case ColumnKind.BOOL:
+                    data[name] = pd.arrays.BooleanArray(values.copy(), ~mask)
+                case ColumnKind.DATE:
+                    data[name] = np.where(mask, values, np.datetime64('NaT'))
+                case ColumnKind.COORDINATE:
+                    data['latitude'] = values[:, 0].copy()
+                    data['longitude'] = values[:, 1].copy()
+
+        for name in (
+                'area', 'volume',
+                *[f'ratio_{_}' for _ in Accident.RATIO_ATTRIBUTES],
+                'season', 'month', 'day_of_season', 'weekday',
+        ):
+            values, mask = arrays(name)
+            if values.dtype.kind == 'i':
+                array = pd.array(values, dtype=self.NULLABLE_DTYPE[values.dtype])
+                array[~mask] = pd.NA
+                data[name] = array
+            else:
+                data[name] = np.where(mask, values, np.nan)
+
+        self.df = pd.DataFrame(data, copy=False)
 
     ##############################################
 
@@ -0,0 +1,171 @@
+####################################################################################################
+#
+# SnowAvalancheData -
+# Copyright (C) 2022 Fabrice Salvaire
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+####################################################################################################
+
+"""Module to implement lightweight read-only accident records.
+
+An :class:`AccidentRecord` is a proxy on a row of an :class:`AccidentStore`, it only holds the store
+and the row in slots.  Fields are decoded from the columns on access and derived properties, like
+``ratio_dead`` or ``area``, are read from the cached derived columns, thus a record exposes the same
+attributes than a model instance without the pydantic overhead.
+
+Registers yield records when the record mode is enabled, see
+:meth:`AccidentRegisterMixin.use_records`.
+
+"""
+
+####################################################################################################
+
+__all__ = [
+    'AccidentRecord',
+    'record_class',
+]
+
+####################################################################################################
+
+from typing import Any
+
+from .AccidentStore import AccidentStore
+from .DerivedColumn import DerivedColumn
+
+####################################################################################################
+
+class _Field:
+
+    """Descriptor reading a field from the store"""
+
+    __slots__ = ('_name',)
+
+    def __init__(self, name: str) -> None:
+        self._name = name
+
+    def __get__(self, instance: 'AccidentRecord', owner=None) -> Any:
+        if instance is None:
+            return self
+        return instance._store.column_object(self._name).get(instance._row)
+
+####################################################################################################
+
+class _DerivedField(_Field):
+
+    """Descriptor reading a derived column"""
+
+    __slots__ = ()
+
+    def __get__(self, instance: 'AccidentRecord', owner=None) -> Any:
+        if instance is None:
+            return self
+        data, mask = instance._store.derived(self._name)
+        row = instance._row
+        if mask[row]:
+            return data[row].item()
+        return None
+
+####################################################################################################
+
+class AccidentRecord:
+
+    """Read-only proxy on a store row"""
+
+    __slots__ = ('_store', '_row')
+
+    _model = None
+
+    ##############################################
+
+    def __init__(self, store: AccidentStore, row: int) -> None:
+        object.__setattr__(self, '_store', store)
+        object.__setattr__(self, '_row', row)
+
+    ##############################################
+
+    def __getattr__(self, name: str) -> Any:
+        # a derived column registered after the record class was built
+        if self._model is not None and name in DerivedColumn.columns(self._model):
+            return _DerivedField(name).__get__(self)
+        raise AttributeError(f"{self.__class__.__name__} has no attribute {name}")
+
+    ##############################################
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        raise AttributeError(f"{self.__class__.__name__} is read-only")
+
+    __delattr__ = __setattr__
+
+    ##############################################
+
+    @property
+    def store(self) -> AccidentStore:
+        return self._store
+
+    @property
+    def row(self) -> int:
+        return self._row
+
+    ##############################################
+
+    def __eq__(self, other: Any) -> bool:
+        if not isinstance(other, AccidentRecord):
+            return NotImplemented
+        return self._store is other._store and self._row == other._row
+
+    def __hash__(self) -> int:
+        return hash((id(self._store), self._row))
+
+    def __repr__(self) -> str:
+        return f'{self.__class__.__name__} {self._row} {self.code}'
+
+    ##############################################
+
+    def dict(self) -> dict:
+        return self._store.row_dict(self._row)
+
+    def to_model(self):
+        """Return a model instance"""
+        return self._store.accident(self._row)
+
+    ##############################################
+
+    def check(self) -> bool:
+        return self.to_model().check()
+
+####################################################################################################
+
+_record_classes = {}
+
+def record_class(model) -> type:
+    """Return the record class of a model, fields and derived columns are class descriptors
+
+    The class is built on the first call, derived columns registered later are resolved by
+    :meth:`AccidentRecord.__getattr__`.
+
+    """
+    cls = _record_classes.get(model)
+    if cls is None:
+        namespace = {'__slots__': (), '_model': model}
+        for name in model.__fields__:
+            namespace[name] = _Field(name)
+        for name in DerivedColumn.columns(model):
+            namespace[name] = _DerivedField(name)
+        # class attributes like RATIO_ATTRIBUTES
+        for name in ('ATTRIBUTE_DOC', 'ATTRIBUTE_UNIT', 'RATIO_ATTRIBUTES'):
+            if hasattr(model, name):
+                namespace[name] = getattr(model, name)
+        cls = _record_classes[model] = type(f'{model.__name__}Record', (AccidentRecord,), namespace)
+    return cls
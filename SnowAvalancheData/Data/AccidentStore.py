@@ -0,0 +1,880 @@
+####################################################################################################
+#
+# SnowAvalancheData -
+# Copyright (C) 2022 Fabrice Salvaire
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+####################################################################################################
+
+"""Module to implement a columnar storage for accidents.
+
+Each field of the accident model is stored in a typed Numpy array with an explicit validity mask,
+thus a null value is represented by a false mask entry instead of :obj:`None`.
+
+* integer fields use the smallest integer dtype suitable for the domain,
+* enumerates are stored as their integer value (it is the convention used by
+  :class:`EnumHistogram`), 0 is reserved for null,
+* strings are dictionary encoded using an :obj:`numpy.int32` code and a vocabulary,
+* dates are stored as :obj:`numpy.datetime64`,
+* coordinates are stored as a (latitude, longitude, altitude) float array,
+* delays are stored in minutes.
+
+A store can be overlaid by another store sharing its arrays, see :meth:`AccidentStore.overlay`, the
+arrays of a column are copied when the column is modified by either store.
+
+"""
+
+####################################################################################################
+
+__all__ = [
+    'AccidentStore',
+    'Column',
+    'ColumnKind',
+    'ColumnSpec',
+]
+
+####################################################################################################
+
+from enum import Enum, auto
+from typing import Any, Callable, Hashable, Iterable, Iterator
+import datetime
+import re
+
+import numpy as np
+
+from .DataType import Coordinate, Delay
+from .DerivedColumn import DerivedColumn
+
+####################################################################################################
+
+class ColumnKind(Enum):
+    BOOL = auto()
+    INT = auto()
+    ENUM = auto()
+    STRING = auto()
+    DATE = auto()
+    COORDINATE = auto()
+    DELAY = auto()
+
+####################################################################################################
+
+class ColumnSpec:
+
+    """Describe how a model field is stored in a column
+
+    Dates are stored in UTC, a date having a time zone is converted.
+
+    """
+
+    DATE_UNIT = 's'
+    DATE_DTYPE = np.dtype(f'datetime64[{DATE_UNIT}]')
+    # ISO datetimes accepted by the model which can be converted at once, a date without time is not
+    DATE_RE = re.compile(
+        r'(\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}(?::\d{2}(?:\.\d{1,12})?)?)'
+        r'(?:(Z)|([+-])(\d{2})(?::?(\d{2}))?)?'
+    )
+
+    # Default integer dtype is int32
+    INT_DTYPE = {
+        'altitude': np.int16,
+        'bra_level': np.int8,
+        'carried_away': np.int16,
+        'dead': np.int16,
+        'departement': np.int16,
+        'full_bluried': np.int16,
+        'head_bluried': np.int16,
+        'height_difference': np.int16,
+        'injured': np.int16,
+        'number_of_persons': np.int16,
+        'partial_bluried_critical': np.int16,
+        'partial_bluried_non_critical': np.int16,
+        'safe': np.int16,
+        'thickness_max': np.int16,
+    }
+
+    ##############################################
+
+    @classmethod
+    def from_type(cls, name: str, type_: type) -> 'ColumnSpec':
+        if isinstance(type_, type) and issubclass(type_, Enum):
+            return cls(name, ColumnKind.ENUM, type_, np.int8, null=0)
+        elif type_ is bool:
+            return cls(name, ColumnKind.BOOL, type_, np.bool_, null=False)
+        elif type_ is int:
+            return cls(name, ColumnKind.INT, type_, cls.INT_DTYPE.get(name, np.int32), null=0)
+        elif type_ is str:
+            return cls(name, ColumnKind.STRING, type_, np.int32, null=-1)
+        elif type_ is datetime.datetime:
+            return cls(name, ColumnKind.DATE, type_, cls.DATE_DTYPE, null=np.datetime64('NaT'))
+        elif type_ is Coordinate:
+            return cls(name, ColumnKind.COORDINATE, type_, np.float64, null=np.nan, shape=(3,))
+        elif type_ is Delay:
+            return cls(name, ColumnKind.DELAY, type_, np.int32, null=0)
+        raise NotImplementedError(f"Unsupported type {type_} for field {name}")
+
+    ##############################################
+
+    def __init__(self, name: str, kind: ColumnKind, type_: type, dtype, null, shape: tuple=()) -> None:
+        self._name = name
+        self._kind = kind
+        self._type = type_
+        self._dtype = np.dtype(dtype)
+        self._null = null
+        self._shape = shape
+
+    ##############################################
+
+    @property
+    def name(self) -> str:
+        return self._name
+
+    @property
+    def kind(self) -> ColumnKind:
+        return self._kind
+
+    @property
+    def type(self) -> type:
+        return self._type
+
+    @property
+    def dtype(self) -> np.dtype:
+        return self._dtype
+
+    @property
+    def null(self):
+        return self._null
+
+    @property
+    def shape(self) -> tuple:
+        return self._shape
+
+    @property
+    def is_number(self) -> bool:
+        return self._kind in (ColumnKind.INT, ColumnKind.DELAY)
+
+    ##############################################
+
+    def __repr__(self) -> str:
+        return f'{self.__class__.__name__} {self._name} {self._kind.name} {self._dtype}'
+
+####################################################################################################
+
+class Column:
+
+    """Typed Numpy array with a validity mask
+
+    The arrays are over-allocated, the size is managed by the store.
+
+    """
+
+    ##############################################
+
+    def __init__(self, spec: ColumnSpec, capacity: int=0) -> None:
+        self._spec = spec
+        self._data = np.full((capacity, *spec.shape), spec.null, dtype=spec.dtype)
+        self._mask = np.zeros(capacity, dtype=np.bool_)
+        if spec.kind == ColumnKind.STRING:
+            self._vocabulary = []
+            self._vocabulary_index = {}
+        else:
+            self._vocabulary = None
+            self._vocabulary_index = None
+        self._info = np.iinfo(spec.dtype) if spec.kind in (ColumnKind.INT, ColumnKind.DELAY) else None
+        # the arrays are shared with another column and must be copied before a write
+        self._shared = False
+
+    ##############################################
+
+    @property
+    def spec(self) -> ColumnSpec:
+        return self._spec
+
+    @property
+    def data(self) -> np.ndarray:
+        """Raw data array including the spare capacity"""
+        return self._data
+
+    @property
+    def mask(self) -> np.ndarray:
+        """Raw validity mask including the spare capacity"""
+        return self._mask
+
+    @property
+    def vocabulary(self) -> list[str]:
+        return self._vocabulary
+
+    @property
+    def capacity(self) -> int:
+        return self._mask.size
+
+    ##############################################
+
+    def resize(self, capacity: int) -> None:
+        size = min(capacity, self.capacity)
+        data = np.full((capacity, *self._spec.shape), self._spec.null, dtype=self._spec.dtype)
+        data[:size] = self._data[:size]
+        mask = np.zeros(capacity, dtype=np.bool_)
+        mask[:size] = self._mask[:size]
+        self._data = data
+        self._mask = mask
+        self._shared = False
+
+    ##############################################
+
+    def share(self) -> 'Column':
+        """Return a column sharing the arrays, the arrays are copied on the first write of either column"""
+        column = Column(self._spec)
+        column.set_arrays(self._data, self._mask, self._vocabulary)
+        column._shared = self._shared = True
+        return column
+
+    def _detach(self) -> None:
+        if self._shared:
+            self._data = np.array(self._data)
+            self._mask = np.array(self._mask)
+            self._shared = False
+
+    ##############################################
+
+    def set_arrays(self, data: np.ndarray, mask: np.ndarray, vocabulary: list[str]=None) -> None:
+        """Use the given arrays as storage, e.g. memory mapped arrays, the capacity is the array size"""
+        self._data = data
+        self._mask = mask
+        self._shared = False
+        if self._spec.kind == ColumnKind.STRING:
+            self._vocabulary = list(vocabulary)
+            self._vocabulary_index = {value: code for code, value in enumerate(self._vocabulary)}
+
+    ##############################################
+
+    def string_code(self, value: str) -> int:
+        """Return the code of a string, the string is added to the vocabulary if required"""
+        code = self._vocabulary_index.get(value)
+        if code is None:
+            code = len(self._vocabulary)
+            self._vocabulary.append(value)
+            self._vocabulary_index[value] = code
+        return code
+
+    def find_code(self, value: str) -> int | None:
+        """Return the code of a string or None, the vocabulary is not modified"""
+        return self._vocabulary_index.get(value)
+
+    ##############################################
+
+    def encode(self, value: Any) -> tuple[Any, bool]:
+        """Convert a validated Python value to its stored representation, return (value, valid)"""
+        if value is None:
+            return self._spec.null, False
+        match self._spec.kind:
+            case ColumnKind.BOOL:
+                return bool(value), True
+            case ColumnKind.INT | ColumnKind.DELAY:
+                if self._spec.kind == ColumnKind.DELAY:
+                    value = value.minutes
+                value = int(value)
+                if not (self._info.min <= value <= self._info.max):
+                    raise ValueError(f"{self._spec.name} value {value} is out of range for {self._spec.dtype}")
+                return value, True
+            case ColumnKind.ENUM:
+                return value.value, True
+            case ColumnKind.STRING:
+                return self.string_code(value), True
+            case ColumnKind.DATE:
+                if value.tzinfo is not None:
+                    value = value.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+                return np.datetime64(value, ColumnSpec.DATE_UNIT), True
+            case ColumnKind.COORDINATE:
+                if value.latitude is None or value.longitude is None:
+                    return self._spec.null, False
+                altitude = value.altitude if value.altitude is not None else np.nan
+                return (value.latitude, value.longitude, altitude), True
+
+    ##############################################
+
+    def decode(self, value: Any) -> Any:
+        """Convert a stored value to a Python value"""
+        match self._spec.kind:
+            case ColumnKind.BOOL:
+                return bool(value)
+            case ColumnKind.INT:
+                return int(value)
+            case ColumnKind.ENUM:
+                return self._spec.type(int(value))
+            case ColumnKind.STRING:
+                return self._vocabulary[value]
+            case ColumnKind.DATE:
+                return value.astype(datetime.datetime)
+            case ColumnKind.COORDINATE:
+                latitude, longitude, altitude = [float(_) for _ in value]
+                if np.isnan(altitude):
+                    altitude = None
+                return Coordinate(latitude=latitude, longitude=longitude, altitude=altitude)
+            case ColumnKind.DELAY:
+                return Delay(minutes=int(value))
+
+    ##############################################
+
+    def get(self, row: int) -> Any:
+        if self._mask[row]:
+            return self.decode(self._data[row])
+        return None
+
+    ##############################################
+
+    def set(self, row: int, value: Any) -> None:
+        self._detach()
+        self._data[row], self._mask[row] = self.encode(value)
+
+    ##############################################
+
+    def set_rows(self, rows: np.ndarray, values: Iterable[Any]) -> None:
+        """Set the validated Python values at *rows* in one assignment"""
+        self._detach()
+        encoded = [self.encode(_) for _ in values]
+        data = np.array([_[0] for _ in encoded], dtype=self._spec.dtype).reshape(-1, *self._spec.shape)
+        self._data[rows] = data
+        self._mask[rows] = [_[1] for _ in encoded]
+
+    ##############################################
+
+    def _remap(self, other: 'Column', data: np.ndarray, mask: np.ndarray) -> np.ndarray:
+        """Remap the string codes of *other* to our vocabulary"""
+        if self._spec.kind == ColumnKind.STRING and other._vocabulary is not self._vocabulary:
+            if not other._vocabulary:
+                return np.full(data.shape, self._spec.null, dtype=self._spec.dtype)
+            code_map = np.array([self.string_code(_) for _ in other._vocabulary], dtype=self._spec.dtype)
+            return np.where(mask, code_map[np.maximum(data, 0)], self._spec.null)
+        return data
+
+    ##############################################
+
+    def copy_from(self, other: 'Column', size: int, offset: int) -> None:
+        """Copy the *size* first rows of *other* at *offset*"""
+        self._detach()
+        mask = other._mask[:size]
+        self._data[offset:offset+size] = self._remap(other, other._data[:size], mask)
+        self._mask[offset:offset+size] = mask
+
+    ##############################################
+
+    def fill_from(self, other: 'Column', rows: np.ndarray, other_rows: np.ndarray) -> None:
+        """Fill the null values at *rows* with the values of *other* at *other_rows*"""
+        self._detach()
+        fill = ~self._mask[rows] & other._mask[other_rows]
+        rows = rows[fill]
+        other_rows = other_rows[fill]
+        self._data[rows] = self._remap(other, other._data[other_rows], np.ones(rows.size, dtype=np.bool_))
+        self._mask[rows] = True
+
+    ##############################################
+
+    def _enum_table(self) -> dict[str, int]:
+        table = {}
+        for member in self._spec.type:
+            table[member.name] = member.value
+            table[member.name.lower()] = member.value
+        return table
+
+    ##############################################
+
+    def _convert_json_values(self, values: list) -> np.ndarray | None:
+        """Convert a list of non-null JSON values at once, return None if the fast path cannot be used"""
+        match self._spec.kind:
+            case ColumnKind.BOOL:
+                array = np.array(values)
+                if array.dtype != np.bool_:
+                    return None
+                return array
+            case ColumnKind.INT | ColumnKind.DELAY:
+                array = np.array(values)
+                if array.dtype.kind not in 'iu':
+                    return None
+                inf, sup = array.min(), array.max()
+                if inf < self._info.min or sup > self._info.max:
+                    raise ValueError(f"{self._spec.name} values [{inf}, {sup}] are out of range for {self._spec.dtype}")
+                return array.astype(self._spec.dtype)
+            case ColumnKind.ENUM:
+                table = self._enum_table()
+                try:
+                    return np.fromiter((table[_] for _ in values), dtype=self._spec.dtype, count=len(values))
+                except (KeyError, TypeError):
+                    return None
+            case ColumnKind.STRING:
+                if not all(type(_) is str for _ in values):
+                    return None
+                string_code = self.string_code
+                return np.fromiter((string_code(_) for _ in values), dtype=self._spec.dtype, count=len(values))
+            case ColumnKind.DATE:
+                matches = [ColumnSpec.DATE_RE.fullmatch(_) if type(_) is str else None for _ in values]
+                if not all(matches):
+                    return None
+                try:
+                    array = np.array([_[1] for _ in matches], dtype=self._spec.dtype)
+                except ValueError:
+                    return None
+                # convert to UTC
+                offsets = np.array([
+                    (-1 if _[3] == '-' else 1) * (60*int(_[4]) + int(_[5] or 0)) if _[3] else 0
+                    for _ in matches
+                ], dtype='timedelta64[m]')
+                if offsets.any():
+                    array -= offsets
+                return array
+            case ColumnKind.COORDINATE:
+                try:
+                    # None is converted to NaN
+                    return np.array(
+                        [(_['latitude'], _['longitude'], _.get('altitude')) for _ in values],
+                        dtype=self._spec.dtype,
+                    )
+                except (KeyError, TypeError, ValueError):
+                    return None
+
+    ##############################################
+
+    def json_values(self, rows: np.ndarray | slice) -> list:
+        """Return the JSON values for the given rows, :obj:`None` is null"""
+        data = self._data[rows]
+        mask = self._mask[rows]
+        match self._spec.kind:
+            case ColumnKind.BOOL | ColumnKind.INT | ColumnKind.DELAY:
+                values = data.tolist()
+            case ColumnKind.ENUM:
+                labels = [None] * (max(_.value for _ in self._spec.type) + 1)
+                for member in self._spec.type:
+                    labels[member.value] = member.name.lower()
+                values = [labels[_] for _ in data.tolist()]
+            case ColumnKind.STRING:
+                vocabulary = self._vocabulary
+                values = [vocabulary[_] if _ >= 0 else None for _ in data.tolist()]
+            case ColumnKind.DATE:
+                values = np.datetime_as_string(data, unit=ColumnSpec.DATE_UNIT).tolist()
+            case ColumnKind.COORDINATE:
+                values = [
+                    {
+                        'latitude': round(latitude, 6),
+                        'longitude': round(longitude, 6),
+                        'altitude': None if altitude != altitude else altitude,   # NaN
+                    }
+                    for latitude, longitude, altitude in data.tolist()
+                ]
+        return [value if valid else None for value, valid in zip(values, mask.tolist())]
+
+    ##############################################
+
+    def set_json_values(self, values: list, offset: int, validate) -> None:
+        """Convert a list of JSON values and write them at *offset*, :obj:`None` is null.
+
+        The values are converted column-wise, *validate* is only called on a per-value basis when the
+        values cannot be converted at once, e.g. a date which is not in ISO format.
+
+        """
+        size = len(values)
+        mask = np.fromiter((_ is not None for _ in values), dtype=np.bool_, count=size)
+        data = np.full((size, *self._spec.shape), self._spec.null, dtype=self._spec.dtype)
+        valid_values = [_ for _ in values if _ is not None]
+        if valid_values:
+            array = self._convert_json_values(valid_values)
+            if array is None:
+                encoded = [self.encode(validate(_)) for _ in valid_values]
+                array = np.array([_[0] for _ in encoded], dtype=self._spec.dtype)
+                mask[mask] = [_[1] for _ in encoded]
+                array = array[[_[1] for _ in encoded]]
+            elif self._spec.kind == ColumnKind.COORDINATE:
+                # a coordinate without latitude or longitude is null
+                valid = ~np.isnan(array[:, :2]).any(axis=1)
+                mask[mask] = valid
+                array = array[valid]
+            data[mask] = array
+        self._data[offset:offset+size] = data
+        self._mask[offset:offset+size] = mask
+
+####################################################################################################
+
+class AccidentStore:
+
+    """Columnar storage for a pydantic accident model
+
+    The store is schema-driven: the columns are deduced from the fields of the model.
+
+    """
+
+    MIN_CAPACITY = 16
+
+    _schemas = {}
+
+    ##############################################
+
+    @classmethod
+    def schema(cls, model) -> dict[str, ColumnSpec]:
+        """Return the column specifications for a pydantic model"""
+        schema = cls._schemas.get(model)
+        if schema is None:
+            schema = {
+                name: ColumnSpec.from_type(name, field.type_)
+                for name, field in model.__fields__.items()
+            }
+            cls._schemas[model] = schema
+        return schema
+
+    ##############################################
+
+    @classmethod
+    def from_accidents(cls, model, accidents: Iterable) -> 'AccidentStore':
+        store = cls(model)
+        for accident in accidents:
+            store.append(accident)
+        return store
+
+    ##############################################
+
+    @classmethod
+    def from_records(cls, model, records: list[dict], validate: bool=True) -> 'AccidentStore':
+        """Build a store from JSON records, the columns are converted at once.
+
+        Records are not validated one by one by pydantic, instead :meth:`validate_columns` performs a
+        vectorised validation pass when *validate* is set.
+
+        """
+        size = len(records)
+        store = cls(model, capacity=size)
+        for name, column in store._columns.items():
+            values = [_.get(name) for _ in records]
+            column.set_json_values(values, 0, lambda value, name=name: store.validate(name, value))
+        store._size = size
+        if validate:
+            store.validate_columns()
+        return store
+
+    ##############################################
+
+    @classmethod
+    def from_arrays(cls, model, size: int, arrays: dict[str, tuple]) -> 'AccidentStore':
+        """Build a store from (data, mask, vocabulary) arrays, the arrays are not copied"""
+        store = cls(model)
+        for name, column in store._columns.items():
+            column.set_arrays(*arrays[name])
+        store._size = size
+        return store
+
+    ##############################################
+
+    def __init__(self, model, capacity: int=0) -> None:
+        self._model = model
+        self._schema = self.schema(model)
+        self._size = 0
+        self._columns = {name: Column(spec, capacity) for name, spec in self._schema.items()}
+        # incremented on each mutation, used to invalidate caches
+        self._version = 0
+        self._field_versions = {name: 0 for name in self._schema}
+        self._cache = {}
+        self._derived_cache = {}
+
+    ##############################################
+
+    @property
+    def model(self):
+        return self._model
+
+    @property
+    def version(self) -> int:
+        return self._version
+
+    @property
+    def capacity(self) -> int:
+        return next(iter(self._columns.values())).capacity
+
+    ##############################################
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._columns
+
+    def is_derived(self, name: str) -> bool:
+        return name in DerivedColumn.columns(self._model)
+
+    def derived_columns(self) -> Iterator[str]:
+        return iter(DerivedColumn.columns(self._model).keys())
+
+    ##############################################
+
+    def specs(self) -> Iterator[ColumnSpec]:
+        return iter(self._schema.values())
+
+    def spec(self, name: str) -> ColumnSpec:
+        return self._schema[name]
+
+    ##############################################
+
+    def column_object(self, name: str) -> Column:
+        return self._columns[name]
+
+    ##############################################
+
+    def column(self, name: str) -> np.ndarray:
+        """Return a view on the raw data of a column, null values are undefined"""
+        return self._columns[name].data[:self._size]
+
+    ##############################################
+
+    def mask(self, name: str) -> np.ndarray:
+        """Return a view on the validity mask of a column"""
+        return self._columns[name].mask[:self._size]
+
+    ##############################################
+
+    def values(self, name: str, rows: np.ndarray=None) -> np.ndarray:
+        """Return the valid values of a column for the given rows (all rows if None)
+
+        When every value is valid and no rows are given, a read-only view is returned, else a copy.
+        Strings are decoded to an object array.
+
+        """
+        column = self._columns.get(name)
+        if column is not None:
+            data = self.column(name)
+            mask = self.mask(name)
+            is_string = column.spec.kind == ColumnKind.STRING
+        else:
+            data, mask = self.derived(name)
+            is_string = False
+        if rows is not None:
+            data = data[rows]
+            mask = mask[rows]
+        elif mask.all() and not is_string:
+            view = data.view()
+            view.flags.writeable = False
+            return view
+        data = data[mask]
+        if is_string:
+            return np.array(column.vocabulary, dtype=object)[data]
+        return data
+
+    ##############################################
+
+    def derived(self, name: str) -> tuple[np.ndarray, np.ndarray]:
+        """Return the (data, mask) arrays of a derived column, see :mod:`DerivedColumn`
+
+        The arrays are cached until an input column is modified or the derived column is replaced.
+
+        """
+        derived_column = DerivedColumn.columns(self._model)[name]
+        versions = self._input_version(name)
+        entry = self._derived_cache.get(name)
+        if entry is not None and entry[0] == versions:
+            return entry[1]
+        columns = {_: self._column_arrays(_) for _ in derived_column.inputs}
+        data, mask = derived_column.compute(columns)
+        data.flags.writeable = False
+        mask.flags.writeable = False
+        self._derived_cache[name] = (versions, (data, mask))
+        return data, mask
+
+    def _input_version(self, name: str) -> tuple:
+        if name in self._columns:
+            return (self._size, self._field_versions[name])
+        # a derived column can depend on derived columns, the object identifies its definition
+        derived_column = DerivedColumn.columns(self._model)[name]
+        return (derived_column, tuple(self._input_version(_) for _ in derived_column.inputs))
+
+    def _column_arrays(self, name: str) -> tuple[np.ndarray, np.ndarray]:
+        if name in self._columns:
+            return self.column(name), self.mask(name)
+        return self.derived(name)
+
+    ##############################################
+
+    def _reserve(self, size: int) -> None:
+        capacity = self.capacity
+        if size > capacity:
+            capacity = max(self.MIN_CAPACITY, 2*capacity, size)
+            for column in self._columns.values():
+                column.resize(capacity)
+
+    ##############################################
+
+    def _touch(self, name: str=None) -> None:
+        """Record a mutation of a column, all the columns if *name* is None"""
+        self._version += 1
+        if name is None:
+            for _ in self._field_versions:
+                self._field_versions[_] += 1
+        else:
+            self._field_versions[name] += 1
+        self._cache.clear()
+
+    ##############################################
+
+    def field_version(self, name: str) -> int:
+        return self._field_versions[name]
+
+    ##############################################
+
+    def cached(self, key: Hashable, factory: Callable[[], Any]) -> Any:
+        """Return the value computed by *factory* for *key*, the cache is cleared on mutation"""
+        try:
+            return self._cache[key]
+        except KeyError:
+            value = self._cache[key] = factory()
+            return value
+
+    ##############################################
+
+    def append(self, accident) -> int:
+        """Append an accident and return its row"""
+        row = self._size
+        self._reserve(row + 1)
+        for name, column in self._columns.items():
+            column.set(row, getattr(accident, name))
+        self._size += 1
+        self._touch()
+        return row
+
+    ##############################################
+
+    def take(self, rows: np.ndarray) -> 'AccidentStore':
+        """Return a new store with a copy of the given rows"""
+        rows = np.asarray(rows, dtype=np.int64)
+        arrays = {
+            name: (column.data[rows], column.mask[rows], column.vocabulary)
+            for name, column in self._columns.items()
+        }
+        return self.from_arrays(self._model, rows.size, arrays)
+
+    ##############################################
+
+    def overlay(self) -> 'AccidentStore':
+        """Return a copy-on-write store, a column is only copied when it is modified by either store"""
+        store = self.__class__(self._model)
+        store._columns = {name: column.share() for name, column in self._columns.items()}
+        store._size = self._size
+        return store
+
+    ##############################################
+
+    def fill_from(self, other: 'AccidentStore', rows: np.ndarray, other_rows: np.ndarray) -> None:
+        """Fill the null values at *rows* with the values of *other* at *other_rows*"""
+        rows = np.asarray(rows, dtype=np.int64)
+        other_rows = np.asarray(other_rows, dtype=np.int64)
+        for name, column in self._columns.items():
+            column.fill_from(other._columns[name], rows, other_rows)
+        self._touch()
+
+    ##############################################
+
+    def extend(self, other: 'AccidentStore') -> None:
+        size = len(other)
+        offset = self._size
+        self._reserve(offset + size)
+        for name, column in self._columns.items():
+            column.copy_from(other._columns[name], size, offset)
+        self._size += size
+        self._touch()
+
+    ##############################################
+
+    def validate(self, name: str, value: Any) -> Any:
+        """Validate a value using the model field"""
+        value, errors = self._model.__fields__[name].validate(value, {}, loc=name)
+        if errors:
+            raise ValueError(f"Invalid value for {name}: {errors}")
+        return value
+
+    ##############################################
+
+    def to_records(self, rows: np.ndarray=None) -> list[dict]:
+        """Return JSON records for the given rows (all rows if None), it is the inverse of from_records"""
+        if rows is None:
+            rows = slice(0, self._size)
+        names = list(self._columns.keys())
+        columns = [column.json_values(rows) for column in self._columns.values()]
+        return [dict(zip(names, values)) for values in zip(*columns)]
+
+    ##############################################
+
+    def validate_columns(self) -> None:
+        """Validate the columns at once, raise :exc:`ValueError` on the first invalid column"""
+
+        def raise_error(name: str, message: str, invalid: np.ndarray) -> None:
+            rows = np.flatnonzero(invalid)
+            raise ValueError(f"{name}: {message} for {rows.size} rows, first rows {rows[:10].tolist()}")
+
+        for name, spec in self._schema.items():
+            data = self.column(name)
+            mask = self.mask(name)
+            if self._model.__fields__[name].required and not mask.all():
+                raise_error(name, "value is required", ~mask)
+            match spec.kind:
+                case ColumnKind.ENUM:
+                    values = np.array([_.value for _ in spec.type])
+                    invalid = mask & ~np.isin(data, values)
+                    if invalid.any():
+                        raise_error(name, f"invalid {spec.type.__name__} value", invalid)
+                case ColumnKind.DATE:
+                    invalid = mask & np.isnat(data)
+                    if invalid.any():
+                        raise_error(name, "invalid date", invalid)
+                case ColumnKind.COORDINATE:
+                    invalid = mask & ((np.abs(data[:, 0]) > 90) | (np.abs(data[:, 1]) > 180))
+                    if invalid.any():
+                        raise_error(name, "invalid latitude or longitude", invalid)
+
+    ##############################################
+
+    def get(self, row: int, name: str) -> Any:
+        return self._columns[name].get(row)
+
+    ##############################################
+
+    def set(self, row: int, name: str, value: Any) -> None:
+        if not (0 <= row < self._size):
+            raise IndexError(row)
+        self._columns[name].set(row, self.validate(name, value))
+        self._touch(name)
+
+    ##############################################
+
+    def set_rows(self, rows: np.ndarray, name: str, values: Iterable[Any]) -> None:
+        """Set the values of a column at *rows* as a batch, the values are validated"""
+        rows = np.asarray(rows, dtype=np.int64)
+        if rows.size and not (0 <= rows.min() and rows.max() < self._size):
+            raise IndexError(rows)
+        values = [self.validate(name, _) for _ in values]
+        if len(values) != rows.size:
+            raise ValueError(f"Got {len(values)} values for {rows.size} rows")
+        self._columns[name].set_rows(rows, values)
+        self._touch(name)
+
+    ##############################################
+
+    def row_dict(self, row: int) -> dict:
+        return {name: column.get(row) for name, column in self._columns.items()}
+
+    ##############################################
+
+    def accident(self, row: int):
+        """Build a model instance for a row, values were already validated"""
+        if not (0 <= row < self._size):
+            raise IndexError(row)
+        return self._model.construct(**self.row_dict(row))
+
+    ##############################################
+
+    def nbytes(self) -> int:
+        """Return the memory footprint of the arrays"""
+        return sum(column.data.nbytes + column.mask.nbytes for column in self._columns.values())
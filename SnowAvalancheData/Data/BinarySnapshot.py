@@ -0,0 +1,197 @@
+####################################################################################################
+#
+# SnowAvalancheData -
+# Copyright (C) 2022 Fabrice Salvaire
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+####################################################################################################
+
+"""Module to implement a binary snapshot format for accident stores.
+
+A snapshot is a single file made of:
+
+* a magic string and the manifest length as a little-endian uint64,
+* a JSON manifest describing the columns: dtype, shape, offsets, enumerate code tables and string
+  vocabularies,
+* the raw column arrays, each array is aligned on :attr:`ALIGNMENT` bytes.
+
+Loading a snapshot opens the arrays with :class:`numpy.memmap`, thus it is almost instantaneous and
+the pages are shared across processes through the page cache.  Arrays are mapped in copy-on-write
+mode, a mutation only affects the process.
+
+A snapshot is written to a temporary file which is then renamed, thus an interrupted write doesn't
+leave a partial snapshot.
+
+"""
+
+####################################################################################################
+
+__all__ = [
+    'load_binary',
+    'save_binary',
+    'SNAPSHOT_SUFFIX',
+]
+
+####################################################################################################
+
+from pathlib import Path
+import json
+import logging
+import os
+
+import numpy as np
+
+from .AccidentStore import AccidentStore, ColumnKind
+
+####################################################################################################
+
+_module_logger = logging.getLogger(__name__)
+
+####################################################################################################
+
+MAGIC = b'SADSNAP1'
+ALIGNMENT = 64
+FORMAT_VERSION = 1
+SNAPSHOT_SUFFIX = '.snapshot'
+
+####################################################################################################
+
+def _align(offset: int) -> int:
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+####################################################################################################
+
+def _enum_table(enum_cls) -> dict[str, int]:
+    return {member.name: member.value for member in enum_cls}
+
+####################################################################################################
+
+def save_binary(store: AccidentStore, path: Path, rows: np.ndarray=None) -> None:
+    """Write a snapshot of a store, *rows* selects a subset of the rows"""
+
+    size = len(store) if rows is None else len(rows)
+    arrays = []
+    columns = []
+    for spec in store.specs():
+        data = store.column(spec.name)
+        mask = store.mask(spec.name)
+        if rows is not None:
+            data = data[rows]
+            mask = mask[rows]
+        column = {
+            'name': spec.name,
+            'kind': spec.kind.name,
+            'dtype': spec.dtype.str,
+            'shape': list(spec.shape),
+        }
+        if spec.kind == ColumnKind.ENUM:
+            column['enum'] = _enum_table(spec.type)
+        elif spec.kind == ColumnKind.STRING:
+            column['vocabulary'] = store.column_object(spec.name).vocabulary
+        columns.append(column)
+        arrays.append((column, 'data', np.ascontiguousarray(data)))
+        arrays.append((column, 'mask', np.ascontiguousarray(mask)))
+
+    # The manifest contains the offsets, thus we iterate until its size is stable
+    manifest = {
+        'version': FORMAT_VERSION,
+        'model': store.model.__name__,
+        'size': size,
+        'columns': columns,
+    }
+    header_size = 0
+    while True:
+        offset = _align(len(MAGIC) + 8 + header_size)
+        for column, key, array in arrays:
+            column[f'{key}_offset'] = offset
+            offset = _align(offset + array.nbytes)
+        manifest_bytes = json.dumps(manifest, ensure_ascii=False).encode('utf-8')
+        if len(manifest_bytes) == header_size:
+            break
+        header_size = len(manifest_bytes)
+
+    # write a temporary file in the same directory then rename it, thus a reader never sees a partial
+    # snapshot
+    path = Path(path)
+    tmp_path = path.with_name(f'.{path.name}.{os.getpid()}.tmp')
+    try:
+        with open(tmp_path, 'wb') as fh:
+            fh.write(MAGIC)
+            fh.write(header_size.to_bytes(8, 'little'))
+            fh.write(manifest_bytes)
+            for column, key, array in arrays:
+                fh.seek(column[f'{key}_offset'])
+                array.tofile(fh)
+            fh.truncate(offset)
+        os.replace(tmp_path, path)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+
+####################################################################################################
+
+def read_manifest(path: Path) -> dict:
+    with open(path, 'rb') as fh:
+        magic = fh.read(len(MAGIC))
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a snapshot")
+        header_size = int.from_bytes(fh.read(8), 'little')
+        return json.loads(fh.read(header_size).decode('utf-8'))
+
+####################################################################################################
+
+def load_binary(path: Path, model, mmap: bool=True) -> AccidentStore:
+    """Load a snapshot, arrays are memory mapped if *mmap* is set else read in memory"""
+
+    manifest = read_manifest(path)
+    if manifest['version'] != FORMAT_VERSION:
+        raise ValueError(f"Unsupported snapshot version {manifest['version']}")
+    size = manifest['size']
+    schema = AccidentStore.schema(model)
+    columns = {_['name']: _ for _ in manifest['columns']}
+    missing = set(schema) - set(columns)
+    if missing:
+        raise ValueError(f"Snapshot {path} doesn't have columns {sorted(missing)}")
+
+    def read_array(offset: int, dtype: np.dtype, shape: tuple) -> np.ndarray:
+        if not size:
+            return np.zeros(shape, dtype=dtype)
+        if mmap:
+            return np.memmap(path, dtype=dtype, mode='c', offset=offset, shape=shape)
+        with open(path, 'rb') as fh:
+            fh.seek(offset)
+            return np.fromfile(fh, dtype=dtype, count=int(np.prod(shape))).reshape(shape)
+
+    arrays = {}
+    for name, spec in schema.items():
+        column = columns[name]
+        dtype = np.dtype(column['dtype'])
+        shape = (size, *column['shape'])
+        data = read_array(column['data_offset'], dtype, shape)
+        mask = read_array(column['mask_offset'], np.bool_, (size,))
+        if dtype != spec.dtype:
+            _module_logger.warning(f"Convert column {name} from {dtype} to {spec.dtype}")
+            data = data.astype(spec.dtype)
+        if spec.kind == ColumnKind.ENUM:
+            table = column['enum']
+            if table != _enum_table(spec.type):
+                # the enumerate was modified, remap the codes
+                code_map = np.zeros(max(table.values()) + 1, dtype=spec.dtype)
+                for label, value in table.items():
+                    code_map[value] = spec.type[label].value
+                data = code_map[data]
+        arrays[name] = (data, mask, column.get('vocabulary'))
+
+    return AccidentStore.from_arrays(model, size, arrays)
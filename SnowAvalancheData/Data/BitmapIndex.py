@@ -0,0 +1,255 @@
+####################################################################################################
+#
+# SnowAvalancheData -
+# Copyright (C) 2022 Fabrice Salvaire
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+####################################################################################################
+
+"""Module to implement bitsets and bitmap indexes on accident stores.
+
+A :class:`Bitset` stores a set of rows as an array of 64-bit words, thus set operations are
+word-parallel Numpy operations.
+
+A :class:`BitmapIndex` maps each value of a low-cardinality column (enumerates, departement and BRA
+level) to the bitset of the rows having this value.  Indexes are built in one pass and cached by the
+store until the next mutation.
+
+"""
+
+####################################################################################################
+
+__all__ = [
+    'BitmapIndex',
+    'Bitset',
+]
+
+####################################################################################################
+
+from typing import Any, Iterable, Iterator
+
+import numpy as np
+
+from .AccidentStore import AccidentStore, ColumnKind
+
+####################################################################################################
+
+# number of bits set in a byte
+_POPCOUNT = np.array([bin(_).count('1') for _ in range(256)], dtype=np.uint8)
+
+####################################################################################################
+
+class Bitset:
+
+    """Set of rows in [0, size[ stored as 64-bit words"""
+
+    WORD_SIZE = 64
+
+    ##############################################
+
+    @classmethod
+    def number_of_words(cls, size: int) -> int:
+        return (size + cls.WORD_SIZE - 1) // cls.WORD_SIZE
+
+    ##############################################
+
+    @classmethod
+    def empty(cls, size: int) -> 'Bitset':
+        return cls(size, np.zeros(cls.number_of_words(size), dtype=np.uint64))
+
+    @classmethod
+    def full(cls, size: int) -> 'Bitset':
+        return ~cls.empty(size)
+
+    ##############################################
+
+    @classmethod
+    def from_mask(cls, mask: np.ndarray) -> 'Bitset':
+        size = mask.size
+        packed = np.packbits(mask, bitorder='little')
+        words = np.zeros(cls.number_of_words(size), dtype=np.uint64)
+        words.view(np.uint8)[:packed.size] = packed
+        return cls(size, words)
+
+    ##############################################
+
+    @classmethod
+    def from_rows(cls, rows: np.ndarray, size: int) -> 'Bitset':
+        rows = np.asarray(rows, dtype=np.int64)
+        words = np.zeros(cls.number_of_words(size), dtype=np.uint64)
+        bits = np.left_shift(np.uint64(1), (rows % cls.WORD_SIZE).astype(np.uint64))
+        np.bitwise_or.at(words, rows // cls.WORD_SIZE, bits)
+        return cls(size, words)
+
+    ##############################################
+
+    def __init__(self, size: int, words: np.ndarray) -> None:
+        self._size = size
+        self._words = words
+
+    ##############################################
+
+    @property
+    def size(self) -> int:
+        """Size of the universe, i.e. the number of rows of the store"""
+        return self._size
+
+    @property
+    def words(self) -> np.ndarray:
+        return self._words
+
+    ##############################################
+
+    def to_mask(self) -> np.ndarray:
+        bits = np.unpackbits(self._words.view(np.uint8), count=self._size, bitorder='little')
+        return bits.view(np.bool_)
+
+    def to_rows(self) -> np.ndarray:
+        return np.flatnonzero(self.to_mask())
+
+    ##############################################
+
+    def __len__(self) -> int:
+        return int(_POPCOUNT[self._words.view(np.uint8)].sum(dtype=np.int64))
+
+    def __bool__(self) -> bool:
+        return bool(self._words.any())
+
+    def __contains__(self, row: int) -> bool:
+        if not (0 <= row < self._size):
+            return False
+        word = self._words[row // self.WORD_SIZE]
+        return bool((int(word) >> (row % self.WORD_SIZE)) & 1)
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self.to_rows().tolist())
+
+    def __repr__(self) -> str:
+        return f'{self.__class__.__name__}({len(self)}/{self._size})'
+
+    ##############################################
+
+    def __eq__(self, other: Any) -> bool:
+        if not isinstance(other, Bitset):
+            return NotImplemented
+        return self._size == other._size and np.array_equal(self._words, other._words)
+
+    __hash__ = None
+
+    ##############################################
+
+    def _check(self, other: 'Bitset') -> None:
+        if self._size != other._size:
+            raise ValueError(f"Bitset size mismatch {self._size} != {other._size}")
+
+    def __or__(self, other: 'Bitset') -> 'Bitset':
+        self._check(other)
+        return Bitset(self._size, self._words | other._words)
+
+    def __and__(self, other: 'Bitset') -> 'Bitset':
+        self._check(other)
+        return Bitset(self._size, self._words & other._words)
+
+    def __sub__(self, other: 'Bitset') -> 'Bitset':
+        self._check(other)
+        return Bitset(self._size, self._words & ~other._words)
+
+    def __xor__(self, other: 'Bitset') -> 'Bitset':
+        self._check(other)
+        return Bitset(self._size, self._words ^ other._words)
+
+    def __invert__(self) -> 'Bitset':
+        words = ~self._words
+        # clear the padding bits
+        padding = self._size % self.WORD_SIZE
+        if padding:
+            words[-1] &= np.uint64((1 << padding) - 1)
+        return Bitset(self._size, words)
+
+####################################################################################################
+
+class BitmapIndex:
+
+    """Index mapping the stored values of a column to bitsets, null values are indexed as None"""
+
+    INDEXED_FIELDS = ('bra_level', 'departement')
+
+    ##############################################
+
+    @classmethod
+    def is_indexable(cls, store: AccidentStore, name: str) -> bool:
+        if name not in store:
+            return False
+        return store.spec(name).kind == ColumnKind.ENUM or name in cls.INDEXED_FIELDS
+
+    ##############################################
+
+    @classmethod
+    def get(cls, store: AccidentStore, name: str) -> 'BitmapIndex':
+        """Return the index of a column, it is cached by the store"""
+        if not cls.is_indexable(store, name):
+            raise ValueError(f"Column {name} is not indexable")
+        return store.cached((cls.__name__, name), lambda: cls(store, name))
+
+    ##############################################
+
+    def __init__(self, store: AccidentStore, name: str) -> None:
+        self._name = name
+        self._size = len(store)
+        data = store.column(name)
+        mask = store.mask(name)
+        self._bitsets = {}
+        # group the rows by value in one pass
+        values = data[mask]
+        rows = np.flatnonzero(mask)
+        order = np.argsort(values, kind='stable')
+        unique_values, starts = np.unique(values[order], return_index=True)
+        for value, group in zip(unique_values.tolist(), np.split(rows[order], starts[1:])):
+            self._bitsets[value] = Bitset.from_rows(group, self._size)
+        if not mask.all():
+            self._bitsets[None] = Bitset.from_mask(~mask)
+
+    ##############################################
+
+    @property
+    def name(self) -> str:
+        return self._name
+
+    ##############################################
+
+    def values(self) -> Iterable:
+        """Return the stored values, e.g. enumerate values"""
+        return self._bitsets.keys()
+
+    def counts(self) -> dict[Any, int]:
+        return {value: len(bitset) for value, bitset in self._bitsets.items()}
+
+    ##############################################
+
+    def __getitem__(self, value: Any) -> Bitset:
+        """Return the rows having the stored value, None for null"""
+        bitset = self._bitsets.get(value)
+        if bitset is None:
+            return Bitset.empty(self._size)
+        return bitset
+
+    ##############################################
+
+    def isin(self, values: Iterable) -> Bitset:
+        bitset = Bitset.empty(self._size)
+        for value in values:
+            if value in self._bitsets:
+                bitset |= self._bitsets[value]
+        return bitset
@@ -0,0 +1,362 @@
+####################################################################################################
+#
+# SnowAvalancheData -
+# Copyright (C) 2022 Fabrice Salvaire
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+####################################################################################################
+
+"""Module to check the consistency of a register.
+
+A :class:`Rule` is a vectorised function of input columns which returns the mask of the violating
+rows, like a derived column it receives a dictionary of ``(data, mask)`` tuples.  A rule only
+applies to rows where its inputs are not null.  Inputs can be fields, derived columns and the keys
+encoded in ANENA codes, ``code_season`` and ``code_departement``, e.g. ``1516-74-11`` is an
+accident of the season 2015 in the departement 74.
+
+:class:`ConsistencyChecker` runs the rules on a register and returns a :class:`ViolationTable` which
+only stores the violating rows and rule indexes, the values are decoded on demand::
+
+    report = register.check_consistency()
+    print(report.counts())
+    report.to_data_frame()
+
+"""
+
+####################################################################################################
+
+__all__ = [
+    'ConsistencyChecker',
+    'Rule',
+    'ViolationTable',
+]
+
+####################################################################################################
+
+from typing import Any, Callable, Iterator
+import datetime
+
+import numpy as np
+import pandas as pd
+
+from .AccidentStore import AccidentStore
+from .DataType import Inclination
+
+####################################################################################################
+
+ColumnArrays = tuple[np.ndarray, np.ndarray]
+
+CODE_KEYS = ('code_season', 'code_departement')
+
+####################################################################################################
+
+def code_keys(store: AccidentStore) -> dict[str, ColumnArrays]:
+    """Decode the season and the departement of ANENA codes like ``1516-74-11``
+
+    The vocabulary is parsed at once using the UTF-32 code points, codes having another format are
+    null.
+
+    """
+
+    def compute() -> dict[str, ColumnArrays]:
+        vocabulary = store.column_object('code').vocabulary
+        size = len(vocabulary)
+        season_ = np.zeros(size, dtype=np.int16)
+        departement = np.zeros(size, dtype=np.int16)
+        valid = np.zeros(size, dtype=np.bool_)
+        strings = np.array(vocabulary, dtype=str)
+        length = strings.dtype.itemsize // 4
+        if size and length >= 9:
+            chars = strings.view(np.uint32).reshape(size, length).astype(np.int64)
+            digits = chars - ord('0')
+            is_digit = (0 <= digits) & (digits <= 9)
+            valid = (
+                is_digit[:, :4].all(axis=1) & (chars[:, 4] == ord('-')) &
+                is_digit[:, 5:7].all(axis=1) & (chars[:, 7] == ord('-')) &
+                # the number, followed by the padding
+                (is_digit[:, 8:] | (chars[:, 8:] == 0)).all(axis=1) & is_digit[:, 8]
+            )
+            start = digits[:, 0] * 10 + digits[:, 1]
+            stop = digits[:, 2] * 10 + digits[:, 3]
+            valid &= (start + 1) % 100 == stop
+            season_ = np.where(valid, 2000 + start, 0).astype(np.int16)
+            departement = np.where(valid, digits[:, 5] * 10 + digits[:, 6], 0).astype(np.int16)
+        codes = store.column('code')
+        mask = store.mask('code')
+        # strings of the vocabulary are never null
+        codes = np.where(mask, codes, 0)
+        mask = mask & valid[codes] if size else mask
+        return {
+            'code_season': (season_[codes] if size else codes, mask),
+            'code_departement': (departement[codes] if size else codes, mask),
+        }
+
+    return store.cached(('code_keys',), compute)
+
+####################################################################################################
+
+class Rule:
+
+    ##############################################
+
+    def __init__(
+            self,
+            name: str,
+            inputs: tuple[str],
+            function: Callable[[dict[str, ColumnArrays]], np.ndarray],
+            description: str='',
+            reported: tuple[str]=None,
+    ) -> None:
+        """*reported* are the values reported for a violation, the inputs by default"""
+        self._name = name
+        self._inputs = tuple(inputs)
+        self._function = function
+        self._description = description
+        self._reported = self._inputs if reported is None else tuple(reported)
+
+    ##############################################
+
+    @property
+    def name(self) -> str:
+        return self._name
+
+    @property
+    def inputs(self) -> tuple[str]:
+        return self._inputs
+
+    @property
+    def description(self) -> str:
+        return self._description
+
+    @property
+    def reported(self) -> tuple[str]:
+        return self._reported
+
+    ##############################################
+
+    def __repr__(self) -> str:
+        return f'{self.__class__.__name__} {self._name} {self._inputs}'
+
+    ##############################################
+
+    def violations(self, columns: dict[str, ColumnArrays]) -> np.ndarray:
+        """Return the mask of the violating rows, rows having a null input are ignored"""
+        mask = np.logical_and.reduce([columns[_][1] for _ in self._inputs])
+        return mask & self._function(columns)
+
+    ##############################################
+
+    @classmethod
+    def less_equal(cls, name: str, other: str) -> 'Rule':
+        """Rule ``name <= other``"""
+        def function(columns: dict) -> np.ndarray:
+            return columns[name][0] > columns[other][0]
+        return cls(f'{name}_le_{other}', (name, other), function, f'{name} <= {other}')
+
+    ##############################################
+
+    @classmethod
+    def in_range(cls, name: str, inf: Any, sup: Any) -> 'Rule':
+        """Rule ``inf <= name <= sup``"""
+        def function(columns: dict) -> np.ndarray:
+            data = columns[name][0]
+            return (data < inf) | (data > sup)
+        return cls(f'{name}_range', (name,), function, f'{inf} <= {name} <= {sup}')
+
+####################################################################################################
+
+def _coordinate_altitude(columns: dict) -> np.ndarray:
+    coordinates = columns['coordinate'][0]
+    altitude = columns['altitude'][0]
+    # the altitude of the coordinate is optional, NaN compares false
+    return np.abs(coordinates[:, 2] - altitude) > ConsistencyChecker.ALTITUDE_TOLERANCE
+
+# upper bound of the inclination classes in degree
+_MAX_INCLINATION = {
+    Inclination.SLOPE_LT_30: 30,
+    Inclination.SLOPE_30_35: 35,
+    Inclination.SLOPE_35_39: 40,
+    Inclination.SLOPE_40_44: 45,
+    Inclination.SLOPE_GT_45: 90,
+}
+
+def _inclination_slope(columns: dict) -> np.ndarray:
+    # the start zone is the steepest part of the path, thus the mean slope cannot be much steeper
+    table = np.zeros(max(_.value for _ in Inclination) + 1)
+    for inclination, value in _MAX_INCLINATION.items():
+        table[inclination.value] = value
+    max_inclination = np.take(table, columns['inclination'][0], mode='clip')
+    # the length is taken as horizontal, that underestimates the slope
+    slope = np.degrees(np.arctan2(columns['height_difference'][0], columns['length'][0]))
+    return slope > max_inclination + ConsistencyChecker.INCLINATION_TOLERANCE
+
+def _date_season(columns: dict) -> np.ndarray:
+    return columns['season'][0] != columns['code_season'][0]
+
+def _departement_code(columns: dict) -> np.ndarray:
+    return columns['departement'][0] != columns['code_departement'][0]
+
+####################################################################################################
+
+class ConsistencyChecker:
+
+    """Run consistency rules on the columns of a register"""
+
+    ALTITUDE_TOLERANCE = 500   # m
+    INCLINATION_TOLERANCE = 5   # degree
+
+    ##############################################
+
+    @classmethod
+    def default_rules(cls, model) -> list[Rule]:
+        rules = [Rule.less_equal(_, 'number_of_persons') for _ in model.RATIO_ATTRIBUTES]
+        rules += [
+            Rule.in_range('number_of_persons', 1, 100),
+            # Mont Blanc is 4808 m
+            Rule.in_range('altitude', 0, 4810),
+            Rule.in_range('height_difference', 0, 3000),
+            Rule.in_range('thickness_max', 0, 1000),   # cm
+            Rule.in_range('length', 0, 10_000),
+            Rule.in_range('width', 0, 5_000),
+            Rule.in_range('bra_level', 1, 5),
+            Rule.in_range('rescue_delay', 0, 7*24*60),   # min
+            Rule(
+                'coordinate_altitude', ('coordinate', 'altitude'), _coordinate_altitude,
+                f'|coordinate altitude - altitude| <= {cls.ALTITUDE_TOLERANCE}',
+            ),
+            # season is the derived column of the date
+            Rule(
+                'date_season', ('season', 'code_season'), _date_season, 'date in the season of the code',
+                reported=('date', 'season'),
+            ),
+            Rule('departement_code', ('departement', 'code_departement'), _departement_code,
+                 'departement of the code'),
+            Rule.in_range('date', np.datetime64('1900-01-01', 's'), np.datetime64(datetime.datetime.now(), 's')),
+            Rule(
+                'inclination_slope', ('inclination', 'height_difference', 'length'), _inclination_slope,
+                f'atan(height_difference / length) <= inclination class bound + {cls.INCLINATION_TOLERANCE}',
+            ),
+        ]
+        return rules
+
+    ##############################################
+
+    def __init__(self, rules: list[Rule]=None) -> None:
+        self._rules = rules
+
+    ##############################################
+
+    def rules(self, model) -> list[Rule]:
+        if self._rules is None:
+            return self.default_rules(model)
+        return self._rules
+
+    ##############################################
+
+    @staticmethod
+    def _arrays(store: AccidentStore, name: str) -> ColumnArrays:
+        if name in store:
+            return store.column(name), store.mask(name)
+        elif name in CODE_KEYS:
+            return code_keys(store)[name]
+        return store.derived(name)
+
+    ##############################################
+
+    def check(self, register: 'AccidentRegisterMixin') -> 'ViolationTable':
+        store = register.store
+        rows = register.rows
+        rules = self.rules(store.model)
+        arrays = {}
+        violating_rows = []
+        rule_indexes = []
+        for i, rule in enumerate(rules):
+            columns = {}
+            for name in rule.inputs:
+                if name not in arrays:
+                    data, mask = self._arrays(store, name)
+                    if rows is not None:
+                        data, mask = data[rows], mask[rows]
+                    arrays[name] = (data, mask)
+                columns[name] = arrays[name]
+            _ = np.flatnonzero(rule.violations(columns))
+            if rows is not None:
+                _ = rows[_]
+            violating_rows.append(_)
+            rule_indexes.append(np.full(_.size, i, dtype=np.int16))
+        violating_rows = np.concatenate(violating_rows)
+        rule_indexes = np.concatenate(rule_indexes)
+        order = np.lexsort((rule_indexes, violating_rows))
+        return ViolationTable(store, rules, violating_rows[order], rule_indexes[order])
+
+####################################################################################################
+
+class ViolationTable:
+
+    """Violations as (row, rule) pairs sorted by row"""
+
+    ##############################################
+
+    def __init__(self, store: AccidentStore, rules: list[Rule], rows: np.ndarray, rule_indexes: np.ndarray) -> None:
+        self._store = store
+        self._rules = rules
+        self._rows = rows
+        self._rule_indexes = rule_indexes
+
+    ##############################################
+
+    def __len__(self) -> int:
+        return self._rows.size
+
+    def __bool__(self) -> bool:
+        return bool(self._rows.size)
+
+    @property
+    def rows(self) -> np.ndarray:
+        return self._rows
+
+    @property
+    def rules(self) -> list[Rule]:
+        return self._rules
+
+    ##############################################
+
+    def counts(self) -> dict[str, int]:
+        """Return the number of violations by rule"""
+        counts = np.bincount(self._rule_indexes, minlength=len(self._rules))
+        return {rule.name: int(count) for rule, count in zip(self._rules, counts) if count}
+
+    ##############################################
+
+    def _values(self, row: int, rule: Rule) -> dict[str, Any]:
+        values = {}
+        for name in rule.reported:
+            if name in self._store:
+                values[name] = self._store.get(row, name)
+            elif name not in CODE_KEYS:
+                data, mask = self._store.derived(name)
+                values[name] = data[row].item() if mask[row] else None
+        return values
+
+    def __iter__(self) -> Iterator[tuple[str, str, dict[str, Any]]]:
+        """Yield (code, rule name, input values)"""
+        for row, i in zip(self._rows.tolist(), self._rule_indexes.tolist()):
+            rule = self._rules[i]
+            yield self._store.get(row, 'code'), rule.name, self._values(row, rule)
+
+    ##############################################
+
+    def to_data_frame(self) -> pd.DataFrame:
+        return pd.DataFrame(list(self), columns=('code', 'rule', 'values'))
@@ -0,0 +1,108 @@
+####################################################################################################
+#
+# SnowAvalancheData -
+# Copyright (C) 2022 Fabrice Salvaire
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+####################################################################################################
+
+"""Module to implement derived columns.
+
+A derived column is computed from input columns by a vectorised function, for example the ratio of
+injured persons.  It is computed on demand and cached by the store, the cache entry is invalidated
+when an input column is modified.
+
+The function receives a dictionary of ``(data, mask)`` tuples for the input columns, where dates are
+:obj:`numpy.datetime64` and delays are in minutes, and returns a ``(data, mask)`` tuple::
+
+    def altitude_km(columns):
+        data, mask = columns['altitude']
+        return data / 1000, mask
+
+    DerivedColumn.register(Accident, DerivedColumn('altitude_km', ('altitude',), altitude_km))
+
+"""
+
+####################################################################################################
+
+__all__ = [
+    'DerivedColumn',
+]
+
+####################################################################################################
+
+from typing import Callable
+
+import numpy as np
+
+####################################################################################################
+
+ColumnArrays = tuple[np.ndarray, np.ndarray]
+
+####################################################################################################
+
+class DerivedColumn:
+
+    _registry = {}
+
+    ##############################################
+
+    @classmethod
+    def register(cls, model, column: 'DerivedColumn') -> None:
+        """Register a derived column for a model, it replaces a column having the same name"""
+        if column.name in model.__fields__:
+            raise ValueError(f"{column.name} is a field of {model.__name__}")
+        cls._registry.setdefault(model, {})[column.name] = column
+
+    ##############################################
+
+    @classmethod
+    def columns(cls, model) -> dict[str, 'DerivedColumn']:
+        return cls._registry.get(model, {})
+
+    ##############################################
+
+    def __init__(
+            self,
+            name: str,
+            inputs: tuple[str],
+            function: Callable[[dict[str, ColumnArrays]], ColumnArrays],
+    ) -> None:
+        self._name = name
+        self._inputs = tuple(inputs)
+        self._function = function
+
+    ##############################################
+
+    @property
+    def name(self) -> str:
+        return self._name
+
+    @property
+    def inputs(self) -> tuple[str]:
+        return self._inputs
+
+    ##############################################
+
+    def __repr__(self) -> str:
+        return f'{self.__class__.__name__} {self._name} {self._inputs}'
+
+    ##############################################
+
+    def compute(self, columns: dict[str, ColumnArrays]) -> ColumnArrays:
+        data, mask = self._function(columns)
+        if data.shape[0] != mask.size:
+            raise ValueError(f"Derived column {self._name} has wrong shape")
+        return data, mask
@@ -0,0 +1,192 @@
+####################################################################################################
+#
+# SnowAvalancheData -
+# Copyright (C) 2022 Fabrice Salvaire
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+####################################################################################################
+
+"""Module to stream accident registers in the `JSON Lines <https://jsonlines.org>`_ format.
+
+Each line is the JSON record of an accident.  Files with a :file:`.gz` or :file:`.xz` suffix are
+transparently compressed.
+
+The reader yields accidents or register chunks, thus the memory usage is bounded by the chunk size.
+For example, to filter a register without loading it::
+
+    with JsonLinesWriter('hiking.jsonl.gz', append=False) as writer:
+        for chunk in JsonLinesReader('accidents.jsonl.xz').chunks():
+            writer.write_register(chunk.and_filter(activity=lambda _: _ is Activity.HIKING))
+
+"""
+
+####################################################################################################
+
+__all__ = [
+    'JsonLinesReader',
+    'JsonLinesWriter',
+]
+
+####################################################################################################
+
+from pathlib import Path
+from typing import IO, Iterator
+import gzip
+import json
+import lzma
+
+from .Accident import Accident, AccidentRegister, AccidentRegisterMixin, orjson
+from .AccidentStore import AccidentStore
+
+####################################################################################################
+
+def open_json_lines(path: Path, mode: str) -> IO:
+    """Open a text file, compression is selected by the file suffix"""
+    path = Path(path)
+    match path.suffix:
+        case '.gz':
+            return gzip.open(path, mode + 't', encoding='utf-8')
+        case '.xz':
+            return lzma.open(path, mode + 't', encoding='utf-8')
+        case _:
+            return open(path, mode, encoding='utf-8')
+
+####################################################################################################
+
+class JsonLinesReader:
+
+    DEFAULT_CHUNK_SIZE = 10_000
+
+    ##############################################
+
+    def __init__(self, path: Path) -> None:
+        self._path = Path(path)
+
+    ##############################################
+
+    @property
+    def path(self) -> Path:
+        return self._path
+
+    ##############################################
+
+    def records(self) -> Iterator[dict]:
+        loads = orjson.loads if orjson is not None else json.loads
+        with open_json_lines(self._path, 'r') as fh:
+            for line in fh:
+                if line.strip():
+                    yield loads(line)
+
+    ##############################################
+
+    def __iter__(self) -> Iterator[Accident]:
+        for record in self.records():
+            yield Accident.parse_obj(record)
+
+    ##############################################
+
+    def chunks(self, chunk_size: int=DEFAULT_CHUNK_SIZE) -> Iterator[AccidentRegister]:
+        """Yield registers of at most *chunk_size* accidents, columns are converted at once"""
+        records = []
+        for record in self.records():
+            records.append(record)
+            if len(records) == chunk_size:
+                yield AccidentRegister(AccidentStore.from_records(Accident, records))
+                records = []
+        if records:
+            yield AccidentRegister(AccidentStore.from_records(Accident, records))
+
+    ##############################################
+
+    def load(self, chunk_size: int=DEFAULT_CHUNK_SIZE) -> AccidentRegister:
+        register = AccidentRegister()
+        for chunk in self.chunks(chunk_size):
+            register += chunk
+        return register
+
+####################################################################################################
+
+class JsonLinesWriter:
+
+    """Append-only writer
+
+    Usage::
+
+        with JsonLinesWriter(path) as writer:
+            writer.write(accident)
+            writer.write_register(register)
+
+    """
+
+    ##############################################
+
+    def __init__(self, path: Path, append: bool=True) -> None:
+        self._path = Path(path)
+        self._append = append
+        self._fh = None
+
+    ##############################################
+
+    @property
+    def path(self) -> Path:
+        return self._path
+
+    ##############################################
+
+    def open(self) -> None:
+        if self._fh is None:
+            self._fh = open_json_lines(self._path, 'a' if self._append else 'w')
+
+    def close(self) -> None:
+        if self._fh is not None:
+            self._fh.close()
+            self._fh = None
+
+    ##############################################
+
+    def __enter__(self) -> 'JsonLinesWriter':
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
+
+    ##############################################
+
+    def _write_records(self, records: list[dict]) -> None:
+        self.open()
+        dumps = lambda _: json.dumps(_, ensure_ascii=False, sort_keys=True)
+        self._fh.writelines(dumps(_) + '\n' for _ in records)
+
+    ##############################################
+
+    def write(self, accident: Accident) -> None:
+        self.open()
+        self._fh.write(accident.json(ensure_ascii=False, sort_keys=True) + '\n')
+
+    ##############################################
+
+    def write_register(self, register: AccidentRegisterMixin, chunk_size: int=JsonLinesReader.DEFAULT_CHUNK_SIZE) -> None:
+        """Write a register or a view, records are generated from the columns by chunks"""
+        store = register.store
+        rows = register.rows
+        size = len(register)
+        for start in range(0, size, chunk_size):
+            stop = min(start + chunk_size, size)
+            if rows is None:
+                chunk_rows = slice(start, stop)
+            else:
+                chunk_rows = rows[start:stop]
+            self._write_records(store.to_records(chunk_rows))
@@ -0,0 +1,320 @@
+####################################################################################################
+#
+# SnowAvalancheData -
+# Copyright (C) 2022 Fabrice Salvaire
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+####################################################################################################
+
+"""Module to implement a versioned journal of patches applied to accidents.
+
+A patch sets field values of an accident identified by its code, a revision is a set of patches.
+The journal is stored in JSON::
+
+    {
+        "format": 1,
+        "revisions": [
+            {
+                "revision": 1,
+                "comment": "...",
+                "patches": {
+                    "1516-74-11": {"number_of_persons": 3}
+                }
+            }
+        ]
+    }
+
+A file without revisions, like :file:`data/anena-accidents-fixes.json`, is loaded as a single
+revision.
+
+Patches are applied as batched column updates: rows are found using a :class:`CodeIndex` and the
+values of a field are validated then assigned at once.  The applied changes are returned with the
+previous values.
+
+To keep the unpatched register, patches can be applied to a copy-on-write overlay of the store, see
+:meth:`AccidentRegister.patched`, thus only the patched columns are copied.
+
+"""
+
+####################################################################################################
+
+__all__ = [
+    'Change',
+    'CodeIndex',
+    'PatchJournal',
+    'Revision',
+]
+
+####################################################################################################
+
+from pathlib import Path
+from typing import Any, Iterable, Iterator
+import json
+import logging
+
+import numpy as np
+
+from .AccidentStore import AccidentStore
+
+####################################################################################################
+
+_module_logger = logging.getLogger(__name__)
+
+####################################################################################################
+
+class CodeIndex:
+
+    """Map the accident codes to the store rows
+
+    The index is rebuilt in a vectorised pass when the store size or the code column changed.
+
+    """
+
+    ##############################################
+
+    def __init__(self, store: AccidentStore, name: str='code') -> None:
+        self._store = store
+        self._name = name
+        self._key = None
+        self._rows = None
+        self.refresh()
+
+    ##############################################
+
+    def refresh(self) -> None:
+        key = (len(self._store), self._store.field_version(self._name))
+        if key == self._key:
+            return
+        column = self._store.column_object(self._name)
+        mask = self._store.mask(self._name)
+        rows = np.flatnonzero(mask)
+        codes = self._store.column(self._name)[rows]
+        size = len(column.vocabulary)
+        counts = np.bincount(codes, minlength=size)
+        if (counts > 1).any():
+            duplicates = [column.vocabulary[_] for _ in np.flatnonzero(counts > 1)[:10]]
+            _module_logger.warning(f"Duplicated codes, the last row is indexed: {duplicates}")
+        # string code -> row, -1 for unused strings
+        self._rows = np.full(size, -1, dtype=np.int64)
+        # for duplicates, the last assignment wins
+        self._rows[codes] = rows
+        self._key = key
+
+    ##############################################
+
+    def __len__(self) -> int:
+        self.refresh()
+        return int(np.count_nonzero(self._rows >= 0))
+
+    def _row(self, code: str) -> int:
+        string_code = self._store.column_object(self._name).find_code(code)
+        if string_code is None or string_code >= self._rows.size:
+            return -1
+        return int(self._rows[string_code])
+
+    def __contains__(self, code: str) -> bool:
+        self.refresh()
+        return self._row(code) >= 0
+
+    ##############################################
+
+    def row(self, code: str) -> int:
+        self.refresh()
+        row = self._row(code)
+        if row < 0:
+            raise KeyError(code)
+        return row
+
+    ##############################################
+
+    def rows(self, codes: Iterable[str]) -> np.ndarray:
+        """Return the rows of the codes, raise :exc:`KeyError` for unknown codes"""
+        self.refresh()
+        rows = np.array([self._row(_) for _ in codes], dtype=np.int64)
+        if (rows < 0).any():
+            codes = list(codes)
+            raise KeyError([codes[_] for _ in np.flatnonzero(rows < 0)])
+        return rows
+
+####################################################################################################
+
+class Change:
+
+    """Record a value changed by a patch"""
+
+    ##############################################
+
+    def __init__(self, revision: int, code: str, name: str, old_value: Any, new_value: Any) -> None:
+        self.revision = revision
+        self.code = code
+        self.name = name
+        self.old_value = old_value
+        self.new_value = new_value
+
+    ##############################################
+
+    def __repr__(self) -> str:
+        return f'r{self.revision} {self.code}.{self.name}: {self.old_value!r} -> {self.new_value!r}'
+
+####################################################################################################
+
+class Revision:
+
+    ##############################################
+
+    def __init__(self, revision: int, patches: dict[str, dict[str, Any]], comment: str=None) -> None:
+        self.revision = revision
+        self.patches = patches
+        self.comment = comment
+
+    ##############################################
+
+    def __len__(self) -> int:
+        return len(self.patches)
+
+    ##############################################
+
+    @classmethod
+    def from_json(cls, data: dict) -> 'Revision':
+        return cls(data['revision'], data['patches'], data.get('comment'))
+
+    def to_json(self) -> dict:
+        return {
+            'revision': self.revision,
+            'comment': self.comment,
+            'patches': self.patches,
+        }
+
+####################################################################################################
+
+class PatchJournal:
+
+    FORMAT = 1
+
+    ##############################################
+
+    @classmethod
+    def load(cls, path: Path) -> 'PatchJournal':
+        with open(path, 'r') as fh:
+            data = json.load(fh)
+        journal = cls()
+        if 'revisions' in data:
+            if data.get('format', cls.FORMAT) > cls.FORMAT:
+                raise ValueError(f"Unsupported patch journal format {data['format']}")
+            journal._revisions = [Revision.from_json(_) for _ in data['revisions']]
+        else:
+            # an unversioned fixes file
+            journal.add(data, comment=Path(path).name)
+        return journal
+
+    ##############################################
+
+    def __init__(self) -> None:
+        self._revisions = []
+
+    ##############################################
+
+    def write(self, path: Path) -> None:
+        data = {
+            'format': self.FORMAT,
+            'revisions': [_.to_json() for _ in self._revisions],
+        }
+        with open(path, 'w') as fh:
+            json.dump(data, fh, indent=4, ensure_ascii=False)
+
+    ##############################################
+
+    def __len__(self) -> int:
+        return len(self._revisions)
+
+    def __iter__(self) -> Iterator[Revision]:
+        return iter(self._revisions)
+
+    @property
+    def revision(self) -> int:
+        """Last revision number, 0 if the journal is empty"""
+        return self._revisions[-1].revision if self._revisions else 0
+
+    ##############################################
+
+    def add(self, patches: dict[str, dict[str, Any]], comment: str=None) -> Revision:
+        """Add a revision, *patches* maps a code to a dict of field values"""
+        revision = Revision(self.revision + 1, patches, comment)
+        self._revisions.append(revision)
+        return revision
+
+    ##############################################
+
+    def _merge(self, revision: int=None, since: int=0) -> dict[str, dict[tuple[str, str], tuple[int, Any]]]:
+        """Merge the revisions in ]since, revision], group the patches by field"""
+        fields = {}
+        for _ in self._revisions:
+            if _.revision <= since or (revision is not None and _.revision > revision):
+                continue
+            for code, patch in _.patches.items():
+                for name, value in patch.items():
+                    fields.setdefault(name, {})[code] = (_.revision, value)
+        return fields
+
+    def patches(self, revision: int=None, since: int=0) -> dict[str, dict[str, Any]]:
+        """Return the patches merged for the revisions in ]since, revision]"""
+        patches = {}
+        for name, values in self._merge(revision, since).items():
+            for code, (_, value) in values.items():
+                patches.setdefault(code, {})[name] = value
+        return patches
+
+    ##############################################
+
+    def apply(
+            self,
+            store: AccidentStore,
+            code_index: CodeIndex=None,
+            revision: int=None,
+            since: int=0,
+    ) -> list[Change]:
+        """Apply the revisions in ]since, revision] to the store and return the changes
+
+        The patch is applied entirely or not at all: the rows of every code are resolved and every
+        value is validated before the store is modified, then the values of a field are updated in
+        one batch.  If an update fails, the fields already updated are restored.
+
+        """
+        if code_index is None:
+            code_index = CodeIndex(store)
+        # resolve and validate everything first
+        batches = []
+        for name, values in self._merge(revision, since).items():
+            codes = list(values.keys())
+            rows = code_index.rows(codes)
+            new_values = [store.validate(name, _[1]) for _ in values.values()]
+            column = store.column_object(name)
+            old_values = [column.get(_) for _ in rows.tolist()]
+            batches.append((name, codes, rows, values, old_values, new_values))
+        applied = []
+        try:
+            for name, codes, rows, values, old_values, new_values in batches:
+                store.set_rows(rows, name, new_values)
+                applied.append((name, rows, old_values))
+        except Exception:
+            for name, rows, old_values in reversed(applied):
+                store.set_rows(rows, name, old_values)
+            raise
+        changes = []
+        for name, codes, rows, values, old_values, _ in batches:
+            for code, (revision_, new_value), old_value in zip(codes, values.values(), old_values):
+                changes.append(Change(revision_, code, name, old_value, new_value))
+        _module_logger.info(f"Applied {len(changes)} changes")
+        return changes
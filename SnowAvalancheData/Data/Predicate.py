@@ -0,0 +1,523 @@
+####################################################################################################
+#
+# SnowAvalancheData -
+# Copyright (C) 2022 Fabrice Salvaire
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+####################################################################################################
+
+"""Module to implement declarative predicates on accident stores.
+
+A predicate is evaluated as a Numpy boolean mask over the columns of an :class:`AccidentStore`,
+values are converted once to the stored representation.  Predicates are immutable and hashable,
+thus they can be used as cache keys, and are combined using ``&``, ``|`` and ``~``::
+
+    predicate = isin('activity', (Activity.HIKING, Activity.MOUNTAINEERING)) & between('altitude', 2000, 3000)
+    hiking = register.and_filter(predicate)
+
+Like in SQL, a null value never matches a comparison, but note ``~eq(name, value)`` matches null
+values whereas ``ne(name, value)`` doesn't.
+
+"""
+
+####################################################################################################
+
+__all__ = [
+    'Predicate',
+    'between',
+    'conjunction',
+    'date_range',
+    'eq',
+    'ge',
+    'gt',
+    'isin',
+    'isnull',
+    'le',
+    'lt',
+    'ne',
+    'notnull',
+    'where',
+]
+
+####################################################################################################
+
+from typing import Any, Callable, Iterable
+import datetime
+import operator
+
+import numpy as np
+
+from .AccidentStore import AccidentStore, Column, ColumnKind, ColumnSpec
+from .BitmapIndex import BitmapIndex
+from .TemporalIndex import TemporalIndex
+from .DataType import Delay
+
+####################################################################################################
+
+class Predicate:
+
+    """Base class for predicates"""
+
+    ##############################################
+
+    def _key(self) -> tuple:
+        raise NotImplementedError
+
+    def __hash__(self) -> int:
+        return hash(self._key())
+
+    def __eq__(self, other: Any) -> bool:
+        return isinstance(other, Predicate) and self._key() == other._key()
+
+    def __repr__(self) -> str:
+        return f'{self.__class__.__name__}{self._key()[1:]}'
+
+    ##############################################
+
+    @property
+    def names(self) -> frozenset[str]:
+        """Fields used by the predicate"""
+        raise NotImplementedError
+
+    ##############################################
+
+    def __and__(self, other: 'Predicate') -> 'Predicate':
+        return And(self, other)
+
+    def __or__(self, other: 'Predicate') -> 'Predicate':
+        return Or(self, other)
+
+    def __invert__(self) -> 'Predicate':
+        return Not(self)
+
+    ##############################################
+
+    def mask(self, store: AccidentStore, rows: np.ndarray=None) -> np.ndarray:
+        """Return a boolean mask for the given rows (all rows if None)"""
+        raise NotImplementedError
+
+    ##############################################
+
+    def select(self, store: AccidentStore, rows: np.ndarray=None) -> np.ndarray:
+        """Return the selected rows"""
+        mask = self.mask(store, rows)
+        if rows is None:
+            return np.flatnonzero(mask)
+        return np.asarray(rows)[mask]
+
+####################################################################################################
+
+class FieldPredicate(Predicate):
+
+    """Predicate on a field"""
+
+    ##############################################
+
+    def __init__(self, name: str) -> None:
+        self._name = name
+
+    ##############################################
+
+    @property
+    def name(self) -> str:
+        return self._name
+
+    @property
+    def names(self) -> frozenset[str]:
+        return frozenset((self._name,))
+
+    ##############################################
+
+    def mask(self, store: AccidentStore, rows: np.ndarray=None) -> np.ndarray:
+        if self._name in store:
+            column = store.column_object(self._name)
+            data = store.column(self._name)
+            valid = store.mask(self._name)
+        else:
+            # derived column
+            column = None
+            data, valid = store.derived(self._name)
+        if rows is not None:
+            data = data[rows]
+            valid = valid[rows]
+        return self._evaluate(column, data, valid)
+
+    ##############################################
+
+    def _evaluate(self, column: Column | None, data: np.ndarray, valid: np.ndarray) -> np.ndarray:
+        """Evaluate the predicate, *column* is None for a derived column"""
+        raise NotImplementedError
+
+    ##############################################
+
+    @staticmethod
+    def _kind(column: Column | None) -> ColumnKind | None:
+        return column.spec.kind if column is not None else None
+
+    ##############################################
+
+    @staticmethod
+    def _encode(column: Column, value: Any) -> Any:
+        """Convert a value to the stored representation"""
+        if column is None:
+            return value
+        spec = column.spec
+        match spec.kind:
+            case ColumnKind.ENUM:
+                return spec.type.validate(value).value
+            case ColumnKind.DATE:
+                return np.datetime64(value, ColumnSpec.DATE_UNIT)
+            case ColumnKind.DELAY:
+                if isinstance(value, Delay):
+                    return value.minutes
+                return int(value)
+            case ColumnKind.COORDINATE:
+                raise TypeError(f"Cannot compare coordinate {spec.name}")
+            case _:
+                return value
+
+####################################################################################################
+
+class Compare(FieldPredicate):
+
+    OPERATORS = {
+        'eq': operator.eq,
+        'ne': operator.ne,
+        'lt': operator.lt,
+        'le': operator.le,
+        'gt': operator.gt,
+        'ge': operator.ge,
+    }
+
+    ##############################################
+
+    def __init__(self, name: str, operator_: str, value: Any) -> None:
+        super().__init__(name)
+        if operator_ not in self.OPERATORS:
+            raise ValueError(f"Unknown operator {operator_}")
+        if value is None:
+            raise ValueError("Use isnull or notnull to test null values")
+        self._operator = operator_
+        self._value = value
+
+    def _key(self) -> tuple:
+        return (self.__class__.__name__, self._name, self._operator, self._value)
+
+    ##############################################
+
+    def mask(self, store: AccidentStore, rows: np.ndarray=None) -> np.ndarray:
+        if rows is None and self._operator == 'eq' and BitmapIndex.is_indexable(store, self._name):
+            index = BitmapIndex.get(store, self._name)
+            return index[self._encode(store.column_object(self._name), self._value)].to_mask()
+        return super().mask(store, rows)
+
+    ##############################################
+
+    def _evaluate(self, column: Column, data: np.ndarray, valid: np.ndarray) -> np.ndarray:
+        function = self.OPERATORS[self._operator]
+        if self._kind(column) == ColumnKind.STRING:
+            # evaluate the vocabulary and look up the codes, the null code -1 maps to the last entry
+            vocabulary = np.array(column.vocabulary + [''], dtype=object)
+            table = np.asarray(function(vocabulary, self._value), dtype=np.bool_)
+            return table[data] & valid
+        value = self._encode(column, self._value)
+        return function(data, value) & valid
+
+####################################################################################################
+
+class IsIn(FieldPredicate):
+
+    def __init__(self, name: str, values: Iterable) -> None:
+        super().__init__(name)
+        self._values = frozenset(values)
+        if None in self._values:
+            raise ValueError("Use isnull or notnull to test null values")
+
+    def _key(self) -> tuple:
+        return (self.__class__.__name__, self._name, self._values)
+
+    ##############################################
+
+    def mask(self, store: AccidentStore, rows: np.ndarray=None) -> np.ndarray:
+        if rows is None and BitmapIndex.is_indexable(store, self._name):
+            index = BitmapIndex.get(store, self._name)
+            column = store.column_object(self._name)
+            return index.isin(self._stored_values(column, store.column(self._name).dtype)).to_mask()
+        return super().mask(store, rows)
+
+    def _stored_values(self, column: Column, dtype: np.dtype) -> list:
+        """Return the encoded values, without the values that cannot be stored using *dtype*
+
+        Else an integer out of range would wrap around when it is cast and match other values.
+
+        """
+        values = [self._encode(column, _) for _ in self._values]
+        if dtype.kind in 'iu':
+            info = np.iinfo(dtype)
+            values = [_ for _ in values if float(_).is_integer() and info.min <= _ <= info.max]
+        return values
+
+    ##############################################
+
+    def _evaluate(self, column: Column, data: np.ndarray, valid: np.ndarray) -> np.ndarray:
+        if self._kind(column) == ColumnKind.STRING:
+            table = np.array([_ in self._values for _ in column.vocabulary] + [False], dtype=np.bool_)
+            return table[data] & valid
+        values = np.array(self._stored_values(column, data.dtype), dtype=data.dtype)
+        return np.isin(data, values) & valid
+
+####################################################################################################
+
+class Between(FieldPredicate):
+
+    """Test ``low <= value <= high``, or ``low <= value < high`` if *closed* is false
+
+    A bound set to None is ignored.
+
+    """
+
+    ##############################################
+
+    def __init__(self, name: str, low: Any, high: Any, closed: bool=True) -> None:
+        super().__init__(name)
+        self._low = low
+        self._high = high
+        self._closed = closed
+
+    def _key(self) -> tuple:
+        return (self.__class__.__name__, self._name, self._low, self._high, self._closed)
+
+    ##############################################
+
+    def mask(self, store: AccidentStore, rows: np.ndarray=None) -> np.ndarray:
+        if rows is None and self._name in store and store.spec(self._name).kind == ColumnKind.DATE:
+            index = TemporalIndex.get(store, self._name)
+            mask = np.zeros(len(store), dtype=np.bool_)
+            mask[index.range_by_date(self._low, self._high, self._closed)] = True
+            return mask
+        return super().mask(store, rows)
+
+    ##############################################
+
+    def _evaluate(self, column: Column, data: np.ndarray, valid: np.ndarray) -> np.ndarray:
+        if self._kind(column) == ColumnKind.STRING:
+            data = np.array(column.vocabulary + [''], dtype=object)[data]
+            encode = lambda _: _
+        else:
+            encode = lambda _: self._encode(column, _)
+        mask = valid.copy()
+        if self._low is not None:
+            mask &= data >= encode(self._low)
+        if self._high is not None:
+            if self._closed:
+                mask &= data <= encode(self._high)
+            else:
+                mask &= data < encode(self._high)
+        return mask
+
+####################################################################################################
+
+class IsNull(FieldPredicate):
+
+    def __init__(self, name: str, null: bool=True) -> None:
+        super().__init__(name)
+        self._null = null
+
+    def _key(self) -> tuple:
+        return (self.__class__.__name__, self._name, self._null)
+
+    def _evaluate(self, column: Column, data: np.ndarray, valid: np.ndarray) -> np.ndarray:
+        return ~valid if self._null else valid.copy()
+
+####################################################################################################
+
+class Where(FieldPredicate):
+
+    """Predicate defined by a function called with the Python value, None for null
+
+    For enumerate, string and boolean columns, the function is called once per distinct value, else
+    once per row.  The key is the function identity.
+
+    """
+
+    ##############################################
+
+    def __init__(self, name: str, function: Callable[[Any], bool]) -> None:
+        super().__init__(name)
+        self._function = function
+
+    def _key(self) -> tuple:
+        return (self.__class__.__name__, self._name, self._function)
+
+    ##############################################
+
+    def _evaluate(self, column: Column, data: np.ndarray, valid: np.ndarray) -> np.ndarray:
+        function = self._function
+        match self._kind(column):
+            case ColumnKind.ENUM:
+                enum_type = column.spec.type
+                table = np.zeros(max(_.value for _ in enum_type) + 1, dtype=np.bool_)
+                for member in enum_type:
+                    table[member.value] = bool(function(member))
+                mask = table[data]
+            case ColumnKind.STRING:
+                table = np.array([bool(function(_)) for _ in column.vocabulary] + [False], dtype=np.bool_)
+                mask = table[data]
+            case ColumnKind.BOOL:
+                mask = np.where(data, bool(function(True)), bool(function(False)))
+            case None:
+                mask = np.array([bool(function(_)) for _ in data.tolist()], dtype=np.bool_)
+            case _:
+                mask = np.array([bool(function(column.decode(_))) for _ in data], dtype=np.bool_)
+                mask = mask.reshape(valid.shape)
+        if not valid.all():
+            mask[~valid] = bool(function(None))
+        return mask
+
+####################################################################################################
+
+class BooleanPredicate(Predicate):
+
+    def __init__(self, *operands: Predicate) -> None:
+        # flatten nested operations, e.g. (a & b) & c
+        flattened = []
+        for operand in operands:
+            if not isinstance(operand, Predicate):
+                raise TypeError(f"{operand} is not a predicate")
+            if type(operand) is type(self):
+                flattened.extend(operand._operands)
+            else:
+                flattened.append(operand)
+        self._operands = tuple(flattened)
+
+    def _key(self) -> tuple:
+        return (self.__class__.__name__, *[_._key() for _ in self._operands])
+
+    @property
+    def operands(self) -> tuple[Predicate]:
+        return self._operands
+
+    @property
+    def names(self) -> frozenset[str]:
+        return frozenset().union(*[_.names for _ in self._operands])
+
+####################################################################################################
+
+class And(BooleanPredicate):
+
+    def __repr__(self) -> str:
+        return '(' + ' & '.join(repr(_) for _ in self._operands) + ')'
+
+    def mask(self, store: AccidentStore, rows: np.ndarray=None) -> np.ndarray:
+        mask = self._operands[0].mask(store, rows)
+        for operand in self._operands[1:]:
+            mask &= operand.mask(store, rows)
+        return mask
+
+####################################################################################################
+
+class Or(BooleanPredicate):
+
+    def __repr__(self) -> str:
+        return '(' + ' | '.join(repr(_) for _ in self._operands) + ')'
+
+    def mask(self, store: AccidentStore, rows: np.ndarray=None) -> np.ndarray:
+        mask = self._operands[0].mask(store, rows)
+        for operand in self._operands[1:]:
+            mask |= operand.mask(store, rows)
+        return mask
+
+####################################################################################################
+
+class Not(Predicate):
+
+    def __init__(self, operand: Predicate) -> None:
+        self._operand = operand
+
+    def _key(self) -> tuple:
+        return (self.__class__.__name__, self._operand._key())
+
+    @property
+    def names(self) -> frozenset[str]:
+        return self._operand.names
+
+    def __repr__(self) -> str:
+        return f'~{self._operand!r}'
+
+    def __invert__(self) -> Predicate:
+        return self._operand
+
+    def mask(self, store: AccidentStore, rows: np.ndarray=None) -> np.ndarray:
+        return ~self._operand.mask(store, rows)
+
+####################################################################################################
+
+def eq(name: str, value: Any) -> Predicate:
+    return Compare(name, 'eq', value)
+
+def ne(name: str, value: Any) -> Predicate:
+    return Compare(name, 'ne', value)
+
+def lt(name: str, value: Any) -> Predicate:
+    return Compare(name, 'lt', value)
+
+def le(name: str, value: Any) -> Predicate:
+    return Compare(name, 'le', value)
+
+def gt(name: str, value: Any) -> Predicate:
+    return Compare(name, 'gt', value)
+
+def ge(name: str, value: Any) -> Predicate:
+    return Compare(name, 'ge', value)
+
+def isin(name: str, values: Iterable) -> Predicate:
+    return IsIn(name, values)
+
+def between(name: str, low: Any, high: Any) -> Predicate:
+    """Test ``low <= value <= high``"""
+    return Between(name, low, high)
+
+def date_range(name: str, start: datetime.date | str=None, stop: datetime.date | str=None) -> Predicate:
+    """Test ``start <= date < stop``, dates can be ISO strings"""
+    return Between(name, start, stop, closed=False)
+
+def isnull(name: str) -> Predicate:
+    return IsNull(name)
+
+def notnull(name: str) -> Predicate:
+    return IsNull(name, null=False)
+
+def where(name: str, function: Callable[[Any], bool]) -> Predicate:
+    return Where(name, function)
+
+####################################################################################################
+
+def conjunction(*predicates: Predicate, **kwargs) -> Predicate | None:
+    """Combine predicates and keyword filters using a logical and, return None if there is nothing
+
+    A keyword filter is a function as for :func:`where` or a value as for :func:`eq`.
+
+    """
+    operands = list(predicates)
+    for name, value in kwargs.items():
+        if callable(value) and not isinstance(value, type):
+            operands.append(where(name, value))
+        else:
+            operands.append(eq(name, value))
+    if not operands:
+        return None
+    elif len(operands) == 1:
+        return operands[0]
+    return And(*operands)
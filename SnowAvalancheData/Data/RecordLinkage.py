@@ -0,0 +1,326 @@
+####################################################################################################
+#
+# SnowAvalancheData -
+# Copyright (C) 2022 Fabrice Salvaire
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+####################################################################################################
+
+"""Module to link the accidents of two registers, e.g. ANENA and SERAC, and to merge them.
+
+The linkage avoids an all-pairs comparison using blocking: two accidents are candidates if their
+days differ by at most the date window and their Lambert 93 grid cells are neighbours.  If one of
+them doesn't have a coordinate, the candidates are only blocked on the date.  Blocking keys are
+integers, thus the candidates are found by a sort and binary searches.
+
+Candidate pairs are scored at once on the date, the distance, the elevation, the number of persons
+and the activity.  Each criterion gives a score in [0, 1], a missing value gives 0.5.  The score is
+the weighted mean of the criteria.  A link is a pair above the threshold where each accident is the
+best candidate of the other.
+
+Usage::
+
+    linkage = RecordLinkage(anena_register, serac_register)
+    links = linkage.link()
+    merged, provenance = linkage.merge(links)
+
+"""
+
+####################################################################################################
+
+__all__ = [
+    'Links',
+    'RecordLinkage',
+]
+
+####################################################################################################
+
+import logging
+
+import numpy as np
+
+from SnowAvalancheData.Cartography.Projection import wgs84_to_rgf93
+from .Accident import AccidentRegister, AccidentRegisterMixin
+from .AccidentStore import AccidentStore
+
+####################################################################################################
+
+_module_logger = logging.getLogger(__name__)
+
+####################################################################################################
+
+class Links:
+
+    """Links between the rows of the left and right stores"""
+
+    ##############################################
+
+    def __init__(self, left: np.ndarray, right: np.ndarray, score: np.ndarray, number_of_candidates: int) -> None:
+        self.left = left
+        self.right = right
+        self.score = score
+        self.number_of_candidates = number_of_candidates
+
+    ##############################################
+
+    def __len__(self) -> int:
+        return self.left.size
+
+    def __iter__(self):
+        return zip(self.left.tolist(), self.right.tolist(), self.score.tolist())
+
+    def __repr__(self) -> str:
+        return f'{self.__class__.__name__} {len(self)} links / {self.number_of_candidates} candidates'
+
+####################################################################################################
+
+class _Side:
+
+    """Arrays used for the blocking and the scoring"""
+
+    ##############################################
+
+    def __init__(self, register: AccidentRegisterMixin, cell_size: float) -> None:
+        store = register.store
+        rows = register.rows
+        if rows is None:
+            rows = np.arange(len(store), dtype=np.int64)
+        self.rows = rows
+
+        def column(name: str) -> tuple[np.ndarray, np.ndarray]:
+            return store.column(name)[rows], store.mask(name)[rows]
+
+        dates, self.has_date = column('date')
+        self.day = dates.astype('datetime64[D]').astype(np.int64)
+
+        coordinates, self.has_coordinate = column('coordinate')
+        self.x = np.full(rows.size, np.nan)
+        self.y = np.full(rows.size, np.nan)
+        if self.has_coordinate.any():
+            _ = coordinates[self.has_coordinate]
+            x, y = wgs84_to_rgf93(_[:, 1], _[:, 0])
+            self.x[self.has_coordinate] = x
+            self.y[self.has_coordinate] = y
+        self.cell_x = np.where(self.has_coordinate, np.floor(np.nan_to_num(self.x) / cell_size), 0).astype(np.int64)
+        self.cell_y = np.where(self.has_coordinate, np.floor(np.nan_to_num(self.y) / cell_size), 0).astype(np.int64)
+
+        self.altitude, self.has_altitude = column('altitude')
+        self.number_of_persons, self.has_number_of_persons = column('number_of_persons')
+        self.activity, self.has_activity = column('activity')
+
+####################################################################################################
+
+class RecordLinkage:
+
+    DEFAULT_WEIGHTS = {
+        'date': 1.,
+        'distance': 2.,
+        'altitude': 1.,
+        'number_of_persons': 1.,
+        'activity': .5,
+    }
+
+    # scales for the exponential decay of the scores
+    DISTANCE_SCALE = 2_000   # m
+    ALTITUDE_SCALE = 200   # m
+    NUMBER_OF_PERSONS_SCALE = 2
+
+    # Lambert 93 cells are lower than 2**21 * cell_size
+    _KEY_BITS = 21
+
+    ##############################################
+
+    def __init__(
+            self,
+            left: AccidentRegisterMixin,
+            right: AccidentRegisterMixin,
+            date_window: int=1,
+            cell_size: float=5_000,
+            weights: dict[str, float]=None,
+            threshold: float=.7,
+    ) -> None:
+        """*date_window* is in days and *cell_size* in meters"""
+        if left.store.model is not right.store.model:
+            raise ValueError("Registers don't have the same model")
+        self._left = left
+        self._right = right
+        self._date_window = int(date_window)
+        self._cell_size = float(cell_size)
+        self._weights = dict(self.DEFAULT_WEIGHTS)
+        if weights is not None:
+            self._weights.update(weights)
+        self._threshold = threshold
+
+    ##############################################
+
+    @classmethod
+    def _key(cls, day: np.ndarray, cell_x: np.ndarray, cell_y: np.ndarray) -> np.ndarray:
+        mask = (1 << cls._KEY_BITS) - 1
+        return (day << (2*cls._KEY_BITS)) | ((cell_x & mask) << cls._KEY_BITS) | (cell_y & mask)
+
+    ##############################################
+
+    @staticmethod
+    def _join(left_keys: np.ndarray, right_keys: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """Return the index pairs having equal keys"""
+        order = np.argsort(right_keys, kind='stable')
+        sorted_keys = right_keys[order]
+        starts = np.searchsorted(sorted_keys, left_keys, side='left')
+        stops = np.searchsorted(sorted_keys, left_keys, side='right')
+        lengths = stops - starts
+        left = np.repeat(np.arange(left_keys.size), lengths)
+        # concatenate the ranges [start, stop[
+        offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+        right = order[np.arange(lengths.sum()) + offsets]
+        return left, right
+
+    ##############################################
+
+    def candidates(self, left: _Side=None, right: _Side=None) -> tuple[np.ndarray, np.ndarray]:
+        """Return the candidate pairs as indexes in the left and right rows"""
+        if left is None:
+            left = _Side(self._left, self._cell_size)
+            right = _Side(self._right, self._cell_size)
+        pairs = []
+
+        # both have a coordinate: block on the day and the neighbour cells
+        left_indexes = np.flatnonzero(left.has_date & left.has_coordinate)
+        right_indexes = np.flatnonzero(right.has_date & right.has_coordinate)
+        right_keys = self._key(right.day[right_indexes], right.cell_x[right_indexes], right.cell_y[right_indexes])
+        for day_offset in range(-self._date_window, self._date_window + 1):
+            for dx in (-1, 0, 1):
+                for dy in (-1, 0, 1):
+                    left_keys = self._key(
+                        left.day[left_indexes] + day_offset,
+                        left.cell_x[left_indexes] + dx,
+                        left.cell_y[left_indexes] + dy,
+                    )
+                    i, j = self._join(left_keys, right_keys)
+                    pairs.append((left_indexes[i], right_indexes[j]))
+
+        # else block on the day
+        for left_mask, right_mask in (
+                (left.has_date & ~left.has_coordinate, right.has_date),
+                (left.has_date & left.has_coordinate, right.has_date & ~right.has_coordinate),
+        ):
+            left_indexes = np.flatnonzero(left_mask)
+            right_indexes = np.flatnonzero(right_mask)
+            for day_offset in range(-self._date_window, self._date_window + 1):
+                i, j = self._join(left.day[left_indexes] + day_offset, right.day[right_indexes])
+                pairs.append((left_indexes[i], right_indexes[j]))
+
+        left_indexes = np.concatenate([_[0] for _ in pairs])
+        right_indexes = np.concatenate([_[1] for _ in pairs])
+        return left_indexes, right_indexes
+
+    ##############################################
+
+    def score(self, left: _Side, right: _Side, i: np.ndarray, j: np.ndarray) -> np.ndarray:
+        """Score the candidate pairs (i, j)"""
+
+        def criterion(has_left: np.ndarray, has_right: np.ndarray, score: np.ndarray) -> np.ndarray:
+            return np.where(has_left[i] & has_right[j], score, .5)
+
+        scores = {}
+        delta_day = np.abs(left.day[i] - right.day[j])
+        scores['date'] = 1 - delta_day / (self._date_window + 1)
+        distance = np.hypot(left.x[i] - right.x[j], left.y[i] - right.y[j])
+        scores['distance'] = criterion(
+            left.has_coordinate, right.has_coordinate,
+            np.exp(-np.nan_to_num(distance) / self.DISTANCE_SCALE),
+        )
+        delta = np.abs(left.altitude[i].astype(np.int64) - right.altitude[j])
+        scores['altitude'] = criterion(left.has_altitude, right.has_altitude, np.exp(-delta / self.ALTITUDE_SCALE))
+        delta = np.abs(left.number_of_persons[i].astype(np.int64) - right.number_of_persons[j])
+        scores['number_of_persons'] = criterion(
+            left.has_number_of_persons, right.has_number_of_persons,
+            np.exp(-delta / self.NUMBER_OF_PERSONS_SCALE),
+        )
+        scores['activity'] = criterion(
+            left.has_activity, right.has_activity,
+            (left.activity[i] == right.activity[j]).astype(np.float64),
+        )
+
+        total_weight = sum(self._weights.values())
+        score = sum(self._weights[name] * value for name, value in scores.items())
+        return score / total_weight
+
+    ##############################################
+
+    def link(self) -> Links:
+        """Return the links, rows refer to the stores"""
+        left = _Side(self._left, self._cell_size)
+        right = _Side(self._right, self._cell_size)
+        i, j = self.candidates(left, right)
+        # a pair can be found by several blocking passes
+        pair_keys = np.unique(i * right.rows.size + j)
+        i, j = np.divmod(pair_keys, right.rows.size)
+        number_of_candidates = i.size
+        _module_logger.info(f'{number_of_candidates} candidate pairs')
+        score = self.score(left, right, i, j)
+
+        selected = score >= self._threshold
+        i, j, score = i[selected], j[selected], score[selected]
+        # keep the pairs where each side is the best candidate of the other
+        order = np.lexsort((-score, i))
+        best_of_left = np.zeros(i.size, dtype=np.bool_)
+        best_of_left[order[np.r_[True, i[order][1:] != i[order][:-1]]] if i.size else order] = True
+        order = np.lexsort((-score, j))
+        best_of_right = np.zeros(j.size, dtype=np.bool_)
+        best_of_right[order[np.r_[True, j[order][1:] != j[order][:-1]]] if j.size else order] = True
+        selected = best_of_left & best_of_right
+
+        return Links(left.rows[i[selected]], right.rows[j[selected]], score[selected], number_of_candidates)
+
+    ##############################################
+
+    def merge(self, links: Links=None) -> tuple[AccidentRegister, np.ndarray]:
+        """Merge the registers
+
+        The merged register contains the left accidents, their null values are filled by the linked
+        right accident, followed by the right accidents which are not linked.
+
+        The provenance is a structured array with a row per merged accident: the ``left`` and the
+        ``right`` store rows, -1 if missing, and the link ``score``, NaN if not linked.
+
+        """
+        if links is None:
+            links = self.link()
+        left_store = self._left.store
+        right_store = self._right.store
+        left_rows = self._left.rows
+        if left_rows is None:
+            left_rows = np.arange(len(left_store), dtype=np.int64)
+        right_rows = self._right.rows
+        if right_rows is None:
+            right_rows = np.arange(len(right_store), dtype=np.int64)
+
+        store = left_store.take(left_rows)
+        # map the linked left store rows to merged rows
+        merged_rows = np.searchsorted(left_rows, links.left)
+        store.fill_from(right_store, merged_rows, links.right)
+        unlinked = np.setdiff1d(right_rows, links.right)
+        store.extend(right_store.take(unlinked))
+
+        provenance = np.zeros(len(store), dtype=[('left', np.int64), ('right', np.int64), ('score', np.float64)])
+        provenance['left'][:left_rows.size] = left_rows
+        provenance['left'][left_rows.size:] = -1
+        provenance['right'] = -1
+        provenance['right'][merged_rows] = links.right
+        provenance['right'][left_rows.size:] = unlinked
+        provenance['score'] = np.nan
+        provenance['score'][merged_rows] = links.score
+
+        return AccidentRegister(store), provenance
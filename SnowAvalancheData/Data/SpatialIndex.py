@@ -0,0 +1,255 @@
+####################################################################################################
+#
+# SnowAvalancheData -
+# Copyright (C) 2022 Fabrice Salvaire
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+####################################################################################################
+
+"""Module to implement a spatial index on accident coordinates.
+
+Coordinates are projected to Lambert 93, thus distances are in meters, and the points are bucketed
+in a uniform grid.  Points are sorted by cell, thus a query only scans the cells overlapping the
+query area, then the candidates are filtered exactly using vectorised operations.
+
+Queries return store rows, the predicates :func:`within_bbox` and :func:`within_radius` plug into
+filtered views::
+
+    x, y = wgs84_to_rgf93(6.8652, 45.8326)   # Mont Blanc
+    mont_blanc = register.and_filter(within_radius(x, y, 5_000))
+
+"""
+
+####################################################################################################
+
+__all__ = [
+    'SpatialIndex',
+    'within_bbox',
+    'within_radius',
+]
+
+####################################################################################################
+
+import numpy as np
+
+from SnowAvalancheData.Cartography.Projection import wgs84_to_rgf93
+from SnowAvalancheData.Statistics.IntervalArithmetic import Interval2D
+from .AccidentStore import AccidentStore
+from .Predicate import Predicate
+
+####################################################################################################
+
+class SpatialIndex:
+
+    """Uniform grid index over the Lambert 93 coordinates of a store"""
+
+    DEFAULT_CELL_SIZE = 5_000   # m
+    MAX_CELLS_PER_AXIS = 2048
+
+    ##############################################
+
+    @classmethod
+    def get(cls, store: AccidentStore, name: str='coordinate', cell_size: float=DEFAULT_CELL_SIZE) -> 'SpatialIndex':
+        """Return the index of a coordinate column, it is cached by the store"""
+        return store.cached((cls.__name__, name, cell_size), lambda: cls(store, name, cell_size))
+
+    ##############################################
+
+    def __init__(self, store: AccidentStore, name: str='coordinate', cell_size: float=DEFAULT_CELL_SIZE) -> None:
+        self._size = len(store)
+        self._cell_size = float(cell_size)
+        mask = store.mask(name)
+        coordinates = store.column(name)[mask]
+        rows = np.flatnonzero(mask)
+        if rows.size:
+            x, y = wgs84_to_rgf93(coordinates[:, 1], coordinates[:, 0])
+            x = np.asarray(x, dtype=np.float64)
+            y = np.asarray(y, dtype=np.float64)
+            self._origin = (x.min(), y.min())
+            # enlarge the cells if outliers make the grid too large
+            extent = max(x.max() - x.min(), y.max() - y.min())
+            self._cell_size = max(self._cell_size, extent / self.MAX_CELLS_PER_AXIS)
+            ix, iy = self._cell(x, y)
+            self._shape = (int(ix.max()) + 1, int(iy.max()) + 1)
+        else:
+            x = y = np.zeros(0)
+            self._origin = (0., 0.)
+            ix = iy = np.zeros(0, dtype=np.int64)
+            self._shape = (1, 1)
+        cell_ids = ix * self._shape[1] + iy
+        order = np.argsort(cell_ids, kind='stable')
+        self._x = x[order]
+        self._y = y[order]
+        self._rows = rows[order]
+        # points of cell i are in [cell_start[i], cell_start[i+1][
+        number_of_cells = self._shape[0] * self._shape[1]
+        self._cell_start = np.searchsorted(cell_ids[order], np.arange(number_of_cells + 1))
+
+    ##############################################
+
+    @property
+    def cell_size(self) -> float:
+        return self._cell_size
+
+    def __len__(self) -> int:
+        """Number of indexed points"""
+        return self._rows.size
+
+    ##############################################
+
+    @property
+    def bounding_box(self) -> Interval2D:
+        if not self._rows.size:
+            return None
+        return Interval2D((self._x.min(), self._x.max()), (self._y.min(), self._y.max()))
+
+    ##############################################
+
+    def _cell(self, x: np.ndarray, y: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        ix = np.floor((x - self._origin[0]) / self._cell_size).astype(np.int64)
+        iy = np.floor((y - self._origin[1]) / self._cell_size).astype(np.int64)
+        return ix, iy
+
+    ##############################################
+
+    def _candidates(self, x_inf: float, x_sup: float, y_inf: float, y_sup: float) -> np.ndarray:
+        """Return the indexes of the points in the cells overlapping the box"""
+        (ix_inf, ix_sup), (iy_inf, iy_sup) = [
+            np.clip(_, 0, n - 1)
+            for _, n in zip(self._cell(np.array([x_inf, x_sup]), np.array([y_inf, y_sup])), self._shape)
+        ]
+        # cells of a column ix are contiguous
+        columns = np.arange(ix_inf, ix_sup + 1) * self._shape[1]
+        starts = self._cell_start[columns + iy_inf]
+        stops = self._cell_start[columns + iy_sup + 1]
+        lengths = stops - starts
+        if not lengths.sum():
+            return np.zeros(0, dtype=np.int64)
+        # concatenate the ranges [start, stop[
+        offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+        return np.arange(lengths.sum()) + offsets
+
+    ##############################################
+
+    def _empty(self, x_inf: float, x_sup: float, y_inf: float, y_sup: float) -> bool:
+        if not self._rows.size:
+            return True
+        x_max = self._origin[0] + self._shape[0] * self._cell_size
+        y_max = self._origin[1] + self._shape[1] * self._cell_size
+        return x_sup < self._origin[0] or y_sup < self._origin[1] or x_inf > x_max or y_inf > y_max
+
+    ##############################################
+
+    def bbox(self, bbox: Interval2D) -> np.ndarray:
+        """Return the sorted rows in the Lambert 93 bounding box"""
+        x_inf, x_sup, y_inf, y_sup = bbox.x.inf, bbox.x.sup, bbox.y.inf, bbox.y.sup
+        if self._empty(x_inf, x_sup, y_inf, y_sup):
+            return np.zeros(0, dtype=np.int64)
+        indexes = self._candidates(x_inf, x_sup, y_inf, y_sup)
+        x = self._x[indexes]
+        y = self._y[indexes]
+        inside = (x_inf <= x) & (x <= x_sup) & (y_inf <= y) & (y <= y_sup)
+        return np.sort(self._rows[indexes[inside]])
+
+    ##############################################
+
+    def _radius(self, x: float, y: float, radius: float) -> tuple[np.ndarray, np.ndarray]:
+        """Return the indexes and the distances of the points in the disk"""
+        if self._empty(x - radius, x + radius, y - radius, y + radius):
+            return np.zeros(0, dtype=np.int64), np.zeros(0)
+        indexes = self._candidates(x - radius, x + radius, y - radius, y + radius)
+        distances = np.hypot(self._x[indexes] - x, self._y[indexes] - y)
+        inside = distances <= radius
+        return indexes[inside], distances[inside]
+
+    def radius(self, x: float, y: float, radius: float) -> np.ndarray:
+        """Return the sorted rows at a distance <= *radius* of the Lambert 93 point (*x*, *y*)"""
+        indexes, _ = self._radius(x, y, radius)
+        return np.sort(self._rows[indexes])
+
+    ##############################################
+
+    def nearest(self, x: float, y: float, k: int=1) -> tuple[np.ndarray, np.ndarray]:
+        """Return the rows and the distances of the *k* nearest points, sorted by distance"""
+        k = min(k, self._rows.size)
+        if k <= 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0)
+        # the search radius is doubled until it contains k points, these points are the nearest
+        # since every point within the radius is found
+        x_inf, y_inf = self._origin
+        x_sup = x_inf + self._shape[0] * self._cell_size
+        y_sup = y_inf + self._shape[1] * self._cell_size
+        max_radius = np.hypot(max(abs(x - x_inf), abs(x - x_sup)), max(abs(y - y_inf), abs(y - y_sup)))
+        radius = self._cell_size
+        while True:
+            indexes, distances = self._radius(x, y, radius)
+            if indexes.size >= k or radius > max_radius:
+                break
+            radius *= 2
+        order = np.argsort(distances, kind='stable')[:k]
+        return self._rows[indexes[order]], distances[order]
+
+####################################################################################################
+
+class WithinBbox(Predicate):
+
+    def __init__(self, bbox: Interval2D, name: str='coordinate') -> None:
+        self._bounds = (float(bbox.x.inf), float(bbox.x.sup), float(bbox.y.inf), float(bbox.y.sup))
+        self._name = name
+
+    def _key(self) -> tuple:
+        return (self.__class__.__name__, self._name, self._bounds)
+
+    @property
+    def names(self) -> frozenset[str]:
+        return frozenset((self._name,))
+
+    def mask(self, store: AccidentStore, rows: np.ndarray=None) -> np.ndarray:
+        x_inf, x_sup, y_inf, y_sup = self._bounds
+        bbox = Interval2D((x_inf, x_sup), (y_inf, y_sup))
+        mask = np.zeros(len(store), dtype=np.bool_)
+        mask[SpatialIndex.get(store, self._name).bbox(bbox)] = True
+        return mask if rows is None else mask[rows]
+
+####################################################################################################
+
+class WithinRadius(Predicate):
+
+    def __init__(self, x: float, y: float, radius: float, name: str='coordinate') -> None:
+        self._center = (float(x), float(y))
+        self._radius = float(radius)
+        self._name = name
+
+    def _key(self) -> tuple:
+        return (self.__class__.__name__, self._name, self._center, self._radius)
+
+    @property
+    def names(self) -> frozenset[str]:
+        return frozenset((self._name,))
+
+    def mask(self, store: AccidentStore, rows: np.ndarray=None) -> np.ndarray:
+        mask = np.zeros(len(store), dtype=np.bool_)
+        mask[SpatialIndex.get(store, self._name).radius(*self._center, self._radius)] = True
+        return mask if rows is None else mask[rows]
+
+####################################################################################################
+
+def within_bbox(bbox: Interval2D, name: str='coordinate') -> Predicate:
+    """Test the Lambert 93 coordinate is in the bounding box"""
+    return WithinBbox(bbox, name)
+
+def within_radius(x: float, y: float, radius: float, name: str='coordinate') -> Predicate:
+    """Test the Lambert 93 coordinate is at a distance <= *radius* in meters of (*x*, *y*)"""
+    return WithinRadius(x, y, radius, name)
@@ -0,0 +1,192 @@
+####################################################################################################
+#
+# SnowAvalancheData -
+# Copyright (C) 2022 Fabrice Salvaire
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+####################################################################################################
+
+"""Module to compute summary statistics of registers.
+
+:class:`RegisterSummary` computes for each numeric field, enumerate field and numeric derived column:
+the count of values, the count of null values, the minimum, the maximum, the mean, the unbiased
+variance and the number of distinct values.  Each column is processed by vectorised Numpy
+operations.  For enumerates, the minimum and the maximum are the members having the lowest and the
+highest value, the mean and the variance are not defined.
+
+"""
+
+####################################################################################################
+
+__all__ = [
+    'AttributeSummary',
+    'RegisterSummary',
+]
+
+####################################################################################################
+
+from typing import Any, Iterator
+import math
+
+import numpy as np
+import pandas as pd
+
+from .AccidentStore import ColumnKind
+
+####################################################################################################
+
+class AttributeSummary:
+
+    ##############################################
+
+    def __init__(
+            self,
+            name: str,
+            count: int,
+            null_count: int,
+            min: Any=None,
+            max: Any=None,
+            mean: float=None,
+            variance: float=None,
+            distinct_count: int=0,
+    ) -> None:
+        self.name = name
+        self.count = count
+        self.null_count = null_count
+        self.min = min
+        self.max = max
+        self.mean = mean
+        self.variance = variance
+        self.distinct_count = distinct_count
+
+    ##############################################
+
+    @property
+    def standard_deviation(self) -> float:
+        if self.variance is None:
+            return None
+        return math.sqrt(self.variance)
+
+    ##############################################
+
+    def to_json(self) -> dict:
+        return {
+            'count': self.count,
+            'null_count': self.null_count,
+            'min': self.min,
+            'max': self.max,
+            'mean': self.mean,
+            'variance': self.variance,
+            'distinct_count': self.distinct_count,
+        }
+
+    ##############################################
+
+    def __repr__(self) -> str:
+        return f'{self.__class__.__name__} {self.name} {self.to_json()}'
+
+####################################################################################################
+
+class RegisterSummary:
+
+    """Summary statistics of a register or a view"""
+
+    SUMMARISED_KINDS = (ColumnKind.INT, ColumnKind.DELAY, ColumnKind.ENUM)
+
+    ##############################################
+
+    def __init__(self, register: 'AccidentRegisterMixin') -> None:
+        store = register.store
+        rows = register.rows
+        self._summaries = {}
+
+        def arrays(data: np.ndarray, mask: np.ndarray) -> tuple[np.ndarray, int]:
+            if rows is None:
+                valid = mask
+            else:
+                data = data[rows]
+                valid = mask[rows]
+            return data[valid], valid.size - int(np.count_nonzero(valid))
+
+        for spec in store.specs():
+            if spec.kind not in self.SUMMARISED_KINDS:
+                continue
+            values, null_count = arrays(store.column(spec.name), store.mask(spec.name))
+            if spec.kind == ColumnKind.ENUM:
+                summary = self._summarise_enum(spec.name, spec.type, values, null_count)
+            else:
+                summary = self._summarise_number(spec.name, values, null_count)
+            self._summaries[spec.name] = summary
+
+        for name in store.derived_columns():
+            data, mask = store.derived(name)
+            if data.ndim != 1 or data.dtype.kind not in 'iuf':
+                continue
+            values, null_count = arrays(data, mask)
+            self._summaries[name] = self._summarise_number(name, values, null_count)
+
+    ##############################################
+
+    @staticmethod
+    def _summarise_number(name: str, values: np.ndarray, null_count: int) -> AttributeSummary:
+        count = values.size
+        if not count:
+            return AttributeSummary(name, count, null_count)
+        x = values.astype(np.float64)
+        mean = x.mean()
+        variance = ((x - mean)**2).sum() / (count - 1) if count > 1 else None
+        return AttributeSummary(
+            name, count, null_count,
+            min=values.min().item(),
+            max=values.max().item(),
+            mean=float(mean),
+            variance=None if variance is None else float(variance),
+            distinct_count=int(np.unique(values).size),
+        )
+
+    ##############################################
+
+    @staticmethod
+    def _summarise_enum(name: str, enum_type, values: np.ndarray, null_count: int) -> AttributeSummary:
+        count = values.size
+        if not count:
+            return AttributeSummary(name, count, null_count)
+        counts = np.bincount(values.astype(np.intp))
+        present = np.flatnonzero(counts)
+        return AttributeSummary(
+            name, count, null_count,
+            min=enum_type(int(present[0])),
+            max=enum_type(int(present[-1])),
+            distinct_count=int(present.size),
+        )
+
+    ##############################################
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._summaries
+
+    def __getitem__(self, name: str) -> AttributeSummary:
+        return self._summaries[name]
+
+    def __iter__(self) -> Iterator[AttributeSummary]:
+        return iter(self._summaries.values())
+
+    def names(self) -> Iterator[str]:
+        return iter(self._summaries.keys())
+
+    ##############################################
+
+    def to_data_frame(self) -> pd.DataFrame:
+        return pd.DataFrame({_.name: _.to_json() for _ in self}).T
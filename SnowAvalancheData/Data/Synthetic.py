@@ -0,0 +1,101 @@
+####################################################################################################
+#
+# SnowAvalancheData -
+# Copyright (C) 2022 Fabrice Salvaire
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+####################################################################################################
+
+"""Module to generate synthetic accident data for benchmarks.
+
+Values are random but plausible, records use the JSON format written by
+:meth:`AccidentRegister.write_json`.
+
+"""
+
+####################################################################################################
+
+__all__ = [
+    'random_records',
+    'random_register',
+]
+
+####################################################################################################
+
+import numpy as np
+
+from .Accident import Accident, AccidentRegister
+from .AccidentStore import AccidentStore, ColumnKind
+
+####################################################################################################
+
+def random_records(number_of_records: int, seed: int=0, null_probability: float=.2) -> list[dict]:
+    rng = np.random.default_rng(seed)
+    size = number_of_records
+
+    def null_mask() -> np.ndarray:
+        return rng.random(size) < null_probability
+
+    def nullify(values: list) -> list:
+        return [None if null else value for value, null in zip(values, null_mask())]
+
+    columns = {}
+    columns['code'] = [f'synthetic-{i}' for i in range(size)]
+
+    # dates in winter seasons
+    start = np.datetime64('2000-11-01T00:00:00').astype(np.int64)
+    day = 24*3600
+    season = rng.integers(0, 20, size)
+    offset = rng.integers(0, 200*day, size)
+    dates = (start + season*365*day + offset).astype('datetime64[s]')
+    columns['date'] = nullify([str(_) for _ in dates])
+
+    altitude = np.clip(rng.normal(2400, 500, size), 800, 4800).astype(int)
+    columns['altitude'] = nullify(altitude.tolist())
+    latitude = rng.uniform(44, 46.5, size).round(6)
+    longitude = rng.uniform(5.5, 7.5, size).round(6)
+    columns['coordinate'] = nullify([
+        {'latitude': x, 'longitude': y, 'altitude': None}
+        for x, y in zip(latitude.tolist(), longitude.tolist())
+    ])
+
+    number_of_persons = rng.integers(1, 11, size)
+    columns['number_of_persons'] = nullify(number_of_persons.tolist())
+    for name in Accident.RATIO_ATTRIBUTES:
+        columns[name] = nullify(rng.integers(0, number_of_persons + 1).tolist())
+
+    columns['bra_level'] = nullify(rng.integers(1, 6, size).tolist())
+    columns['departement'] = nullify(rng.choice((4, 5, 6, 9, 38, 64, 65, 66, 73, 74), size).tolist())
+    columns['length'] = nullify(rng.lognormal(5, 1, size).astype(int).tolist())
+    columns['width'] = nullify(rng.lognormal(4, .7, size).astype(int).tolist())
+    columns['height_difference'] = nullify(rng.lognormal(4.5, .8, size).astype(int).tolist())
+    columns['thickness_max'] = nullify(rng.integers(10, 300, size).tolist())
+    columns['rescue_delay'] = nullify(rng.lognormal(3.5, .8, size).astype(int).tolist())
+    columns['doctor_on_site'] = nullify((rng.random(size) < .5).tolist())
+    columns['mountain_area'] = nullify(rng.choice(('chablais', 'mont-blanc', 'vanoise', 'oisans', 'queyras'), size).tolist())
+
+    for name, spec in AccidentStore.schema(Accident).items():
+        if spec.kind == ColumnKind.ENUM:
+            labels = [_.name.lower() for _ in spec.type]
+            columns[name] = nullify(rng.choice(labels, size).tolist())
+
+    names = list(columns.keys())
+    return [dict(zip(names, values)) for values in zip(*columns.values())]
+
+####################################################################################################
+
+def random_register(number_of_records: int, seed: int=0, null_probability: float=.2) -> AccidentRegister:
+    records = random_records(number_of_records, seed, null_probability)
+    return AccidentRegister(AccidentStore.from_records(Accident, records))
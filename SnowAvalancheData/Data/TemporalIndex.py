@@ -0,0 +1,172 @@
+####################################################################################################
+#
+# SnowAvalancheData -
+# Copyright (C) 2022 Fabrice Salvaire
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+####################################################################################################
+
+"""Module to implement a temporal index and calendar keys on accident dates.
+
+A winter season starts on November 1st and ends on October 31th, it is identified by its start
+year, like the Anena XLS files :file:`tableau-accidents-2012-2013.xls` for the season 2012.
+
+The functions :func:`season`, :func:`month`, :func:`day_of_season` and :func:`weekday` compute
+keys from :obj:`numpy.datetime64` arrays, they are registered as derived columns of the accidents.
+
+"""
+
+####################################################################################################
+
+__all__ = [
+    'TemporalIndex',
+    'day_of_season',
+    'month',
+    'season',
+    'season_start',
+    'weekday',
+]
+
+####################################################################################################
+
+import datetime
+
+import numpy as np
+
+from .AccidentStore import AccidentStore, ColumnSpec
+
+####################################################################################################
+
+SEASON_START_MONTH = 11
+
+####################################################################################################
+
+def month(dates: np.ndarray) -> np.ndarray:
+    """Return the month in [1, 12]"""
+    return (dates.astype('datetime64[M]').astype(np.int64) % 12 + 1).astype(np.int8)
+
+def season(dates: np.ndarray) -> np.ndarray:
+    """Return the season, i.e. the year of the November 1st starting the season"""
+    # a single datetime64 conversion, months since 1970
+    months = dates.astype('datetime64[M]').astype(np.int64)
+    year = months // 12 + 1970
+    return (year - (months % 12 + 1 < SEASON_START_MONTH)).astype(np.int16)
+
+def season_start(seasons: np.ndarray) -> np.ndarray:
+    """Return the first day of the seasons"""
+    years = (np.asarray(seasons, dtype=np.int64) - 1970).astype('datetime64[Y]')
+    return (years.astype('datetime64[M]') + SEASON_START_MONTH - 1).astype('datetime64[D]')
+
+def day_of_season(dates: np.ndarray) -> np.ndarray:
+    """Return the number of days since the start of the season"""
+    days = dates.astype('datetime64[D]') - season_start(season(dates))
+    return days.astype(np.int16)
+
+def weekday(dates: np.ndarray) -> np.ndarray:
+    """Return the day of the week, Monday is 0 like :meth:`datetime.date.weekday`"""
+    # 1970-01-01 is a Thursday
+    return ((dates.astype('datetime64[D]').astype(np.int64) + 3) % 7).astype(np.int8)
+
+####################################################################################################
+
+class TemporalIndex:
+
+    """Index of the rows sorted by date, range queries are binary searches"""
+
+    ##############################################
+
+    @classmethod
+    def get(cls, store: AccidentStore, name: str='date') -> 'TemporalIndex':
+        """Return the index of a date column, it is cached by the store"""
+        return store.cached((cls.__name__, name), lambda: cls(store, name))
+
+    ##############################################
+
+    def __init__(self, store: AccidentStore, name: str='date') -> None:
+        mask = store.mask(name)
+        rows = np.flatnonzero(mask)
+        dates = store.column(name)[mask]
+        order = np.argsort(dates, kind='stable')
+        self._rows = rows[order]
+        self._dates = dates[order]
+
+    ##############################################
+
+    def __len__(self) -> int:
+        return self._rows.size
+
+    @property
+    def dates(self) -> np.ndarray:
+        """Sorted dates"""
+        return self._dates
+
+    @property
+    def first(self) -> np.datetime64:
+        return self._dates[0] if self._dates.size else None
+
+    @property
+    def last(self) -> np.datetime64:
+        return self._dates[-1] if self._dates.size else None
+
+    ##############################################
+
+    @staticmethod
+    def _to_datetime64(date: datetime.date | str) -> np.datetime64:
+        return np.datetime64(date, ColumnSpec.DATE_UNIT)
+
+    ##############################################
+
+    def _slice(self, start=None, stop=None, closed: bool=False) -> slice:
+        if start is None:
+            i = 0
+        else:
+            i = np.searchsorted(self._dates, self._to_datetime64(start), side='left')
+        if stop is None:
+            j = self._dates.size
+        else:
+            j = np.searchsorted(self._dates, self._to_datetime64(stop), side='right' if closed else 'left')
+        return slice(i, j)
+
+    def range(self, start=None, stop=None, closed: bool=False) -> np.ndarray:
+        """Return the sorted rows for ``start <= date < stop``, ``<= stop`` if *closed* is set
+
+        A bound set to None is ignored, dates can be ISO strings.
+
+        """
+        return np.sort(self._rows[self._slice(start, stop, closed)])
+
+    def range_by_date(self, start=None, stop=None, closed: bool=False) -> np.ndarray:
+        """Like :meth:`range` but the rows are sorted by date"""
+        return self._rows[self._slice(start, stop, closed)]
+
+    ##############################################
+
+    def season(self, season_: int) -> np.ndarray:
+        start, stop = season_start([season_, season_ + 1])
+        return self.range(start, stop)
+
+    ##############################################
+
+    def seasons(self) -> dict[int, np.ndarray]:
+        """Group the rows by season, the rows of a season are sorted by date"""
+        if not self._dates.size:
+            return {}
+        seasons = np.arange(season(self._dates[:1])[0], season(self._dates[-1:])[0] + 2)
+        bounds = np.searchsorted(self._dates, season_start(seasons).astype(self._dates.dtype))
+        return {
+            int(_): self._rows[bounds[i]:bounds[i+1]]
+            for i, _ in enumerate(seasons[:-1])
+            if bounds[i] < bounds[i+1]
+        }
@@ -46,6 +46,8 @@ import re
 
 # import csv
 # import pandas as pd   # requires xlrd
+import numpy as np
+import pandas as pd
 import xlrd
 
 from SnowAvalancheData.Data import Accident as DataAccident
@@ -77,6 +79,21 @@ def translate_from_fr(string: str) -> str:
 
 ####################################################################################################
 
+def parse_fr_dates(dates: list[str | None], hours: list[str | None]) -> np.ndarray:
+    """Parse French dates "dd/mm/yyyy" and optional hours "hh:mm" at once, return datetime64 values
+
+    Missing dates are returned as NaT.
+
+    """
+    strings = [
+        f"{date.replace('-', '/')} {hour or '0:0'}" if date else None
+        for date, hour in zip(dates, hours)
+    ]
+    series = pd.Series(strings, dtype=object)
+    return pd.to_datetime(series, format='%d/%m/%Y %H:%M').to_numpy('datetime64[s]')
+
+####################################################################################################
+
 def fr_to_bool(value: str) -> bool:
     match value:
        case 'non':
@@ -519,7 +536,7 @@ class AccidentSheetContextManager:
 
     ##############################################
 
-    def convert(self, values: list) -> 'Accident':
+    def _convert_values(self, values: list) -> dict:
         kwargs = {name: None for name, cls in Accident._MAP.values()}
         for i, value in enumerate(values):
             attribute, cls = self._column_map[i]
@@ -536,16 +553,6 @@ class AccidentSheetContextManager:
                     value = cls(value)
             kwargs[attribute] = value
 
-        date = kwargs['date']
-        hour = kwargs['hour']
-        if date:
-            date = date.replace('-', '/')
-            if hour:
-                kwargs['date'] = datetime.datetime.strptime(f"{date} {hour}", '%d/%m/%Y %H:%M')
-            else:
-                kwargs['date'] = datetime.datetime.strptime(date, '%d/%m/%Y')
-            del kwargs['hour']
-
         rescue_delay = kwargs['rescue_delay']
         if rescue_delay:
             hours = int(rescue_delay)
@@ -560,8 +567,27 @@ class AccidentSheetContextManager:
                 self._logger.warning(f"Wrong coordinate for {kwargs['code']}")
             kwargs['coordinate'] = coordinate.to_json()
 
+        return kwargs
+
+    ##############################################
+
+    def convert_rows(self, rows: list[list]) -> list['Accident']:
+        """Convert rows, the dates are parsed at once"""
+        rows_kwargs = [self._convert_values(_) for _ in rows]
+        dates = parse_fr_dates(
+            [_['date'] for _ in rows_kwargs],
+            [_.pop('hour') for _ in rows_kwargs],
+        )
+        # NaT is converted to None
+        for kwargs, date in zip(rows_kwargs, dates.astype(object)):
+            kwargs['date'] = date
         # pprint(kwargs)
-        return Accident(**kwargs)
+        return [Accident(**_) for _ in rows_kwargs]
+
+    ##############################################
+
+    def convert(self, values: list) -> 'Accident':
+        return self.convert_rows([values])[0]
 
 ####################################################################################################
 
@@ -747,8 +773,8 @@ class AccidentBook:
         accidents = AccidentRegister()
         sheet = self[0]
         with AccidentSheetContextManager(sheet) as cm:
-            for row in sheet:
-                # Skip total line
-                if row[0]:
-                    accidents += cm.convert(row)
+            # Skip total line
+            rows = [row for row in sheet if row[0]]
+            for accident in cm.convert_rows(rows):
+                accidents += accident
         return accidents
@@ -27,10 +27,14 @@ from typing import Optional
 import json
 import math
 
+import numpy as np
 import requests
 
 ####################################################################################################
 
+from SnowAvalancheData.Cartography.Projection import web_mercator_to_wgs84
+from SnowAvalancheData.Data import Accident, AccidentRegister
+from SnowAvalancheData.Data.AccidentStore import AccidentStore
 from SnowAvalancheData.Json.JsonSchema import JsonSchemaInspector
 
 ####################################################################################################
@@ -331,6 +335,18 @@ class SeracDocument:
 
 ####################################################################################################
 
+# Map SERAC event activities to the Accident activity and gear
+SERAC_ACTIVITY = {
+    'alpine_climbing': ('mountaineering', 'on_foot'),
+    'ice_climbing': ('mountaineering', 'on_foot'),
+    'other': ('other', None),
+    'skitouring': ('hiking', 'ski'),
+    'snow_ice_mixed': ('mountaineering', 'on_foot'),
+    'snowshoeing': ('hiking', 'snowshoe'),
+}
+
+####################################################################################################
+
 class SeracQuery:
 
     # Fixme: name
@@ -414,6 +430,42 @@ class SeracQuery:
 
     ##############################################
 
+    def to_register(self, event_types: tuple[str]=('avalanche',)) -> AccidentRegister:
+        """Convert the documents to an accident register, the code is "serac-<document_id>"
+
+        Only the date, elevation, number of participants, activity and coordinate are mapped.
+
+        """
+        documents = [_ for _ in self if _.json.get('event_type') in event_types]
+        records = []
+        points = []
+        for document in documents:
+            data = document.json
+            activity = data.get('event_activity')
+            if isinstance(activity, list):
+                activity = activity[0] if activity else None
+            activity, gear = SERAC_ACTIVITY.get(activity, (None, None))
+            records.append({
+                'code': f'serac-{document.document_id}',
+                'date': data.get('date'),
+                'altitude': data.get('elevation'),
+                'number_of_persons': data.get('nb_participants'),
+                'activity': activity,
+                'gear': gear,
+            })
+            coordinate = document.coordinate
+            points.append(coordinate if coordinate is not None else (np.nan, np.nan))
+        if records:
+            # project the coordinates at once
+            x, y = np.array(points, dtype=np.float64).T
+            longitudes, latitudes = web_mercator_to_wgs84(x, y)
+            for record, longitude, latitude in zip(records, longitudes.tolist(), latitudes.tolist()):
+                if not math.isnan(longitude):
+                    record['coordinate'] = {'latitude': latitude, 'longitude': longitude, 'altitude': None}
+        return AccidentRegister(AccidentStore.from_records(Accident, records))
+
+    ##############################################
+
     def inspect(self) -> None:
         inspector = JsonSchemaInspector()
         json_objects = [_.json for _ in self]
@@ -168,9 +168,9 @@ class Figure:
 
         binning = histogram.binning
         # x_ticks = np.arange(binning.interval.inf, binning.interval.sup, binning.bin_width)
-        offset = binning.bin_width / 2
-        inf = x[0]-offset
-        sup = x[-1]+3*offset
+        # x errors are the half bin widths, bins can have different widths
+        inf = x[0]-x_errors[0]
+        sup = x[-1]+3*x_errors[-1]
         x_ticks = binning.bins()   # np.arange(inf, sup, step=binning.bin_width)
         ax.set_xticks(x_ticks)
         # Fixme: inf!
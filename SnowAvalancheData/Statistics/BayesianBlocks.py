@@ -0,0 +1,146 @@
+####################################################################################################
+#
+# Avalanche -
+# Copyright (C) 2021 Fabrice Salvaire
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+####################################################################################################
+
+"""Module to implement the Bayesian blocks adaptive binning for event data.
+
+The algorithm finds the partition of the data in blocks of constant density maximising the sum of
+the block fitness ``N_k (log N_k - log T_k)``, where ``N_k`` is the number of values and ``T_k`` the
+length of the block, minus a prior on the number of blocks.  It is solved by dynamic programming
+over the N cells around the sorted unique values: the fitness of all the blocks ending at a cell is
+computed at once using cumulative sums, thus each step is a NumPy operation and the algorithm is
+O(N²).
+
+For large N, the approximation groups the sorted values in cells having the same number of values,
+the dynamic programming then runs on these cells, thus the cost is the sort plus O(M²) for M cells.
+
+References
+----------
+.. Scargle, J. et al. "Studies in Astronomical Time Series Analysis. VI. Bayesian Block
+   Representations", ApJ 764, 167, 2013.  arXiv:1207.5578
+.. https://docs.astropy.org/en/stable/api/astropy.stats.bayesian_blocks.html
+
+"""
+
+####################################################################################################
+
+__all__ = [
+    'bayesian_blocks',
+    'ncp_prior',
+]
+
+####################################################################################################
+
+import numpy as np
+
+####################################################################################################
+
+def ncp_prior(number_of_values: int, p0: float=.05) -> float:
+    """Return the prior on the number of change points for a false alarm probability *p0*
+
+    Empirical formula of Scargle 2013, eq. 21, for event data.
+
+    """
+    return 4 - np.log(73.53 * p0 * number_of_values**-0.478)
+
+####################################################################################################
+
+def _cells(data: np.ndarray, max_number_of_cells: int=None) -> tuple[np.ndarray, np.ndarray]:
+    """Return the cell edges and the number of values per cell"""
+    values, counts = np.unique(data, return_counts=True)
+    if max_number_of_cells is not None and values.size > max_number_of_cells:
+        # group the unique values in cells having about the same number of values
+        cumulative_counts = np.cumsum(counts)
+        targets = np.linspace(0, cumulative_counts[-1], int(max_number_of_cells) + 1)[1:-1]
+        # index of the last unique value of each cell
+        stops = np.unique(np.searchsorted(cumulative_counts, targets))
+        stops = stops[stops < values.size - 1]
+        edges = np.concatenate((values[:1], .5*(values[stops] + values[stops + 1]), values[-1:]))
+        counts = np.diff(np.concatenate(([0], cumulative_counts[stops], cumulative_counts[-1:])))
+    else:
+        edges = np.concatenate((values[:1], .5*(values[1:] + values[:-1]), values[-1:]))
+    return edges, counts
+
+####################################################################################################
+
+def bayesian_blocks(
+        data: np.ndarray,
+        p0: float=.05,
+        prior: float=None,
+        max_number_of_cells: int=None,
+) -> np.ndarray:
+    """Return the edges of the Bayesian blocks of event data
+
+    Parameters
+    ----------
+    data : array-like, ndim=1
+        observed (one-dimensional) data
+    p0 : float, optional
+        false alarm probability used to compute the prior
+    prior : float, optional
+        prior on the number of change points, overrides *p0*
+    max_number_of_cells : int, optional
+        if the data have more unique values, group them in this number of cells, the result is an
+        approximation
+
+    Returns
+    -------
+    edges : ndarray
+        block edges, the first and the last edges are the minimum and the maximum of the data
+
+    """
+    data = np.asarray(data, dtype=np.float64)
+    if data.ndim != 1:
+        raise ValueError("data should be one-dimensional")
+    if not data.size:
+        raise ValueError("data is empty")
+    if np.isnan(data).any():
+        raise ValueError("NaN value")
+
+    edges, counts = _cells(data, max_number_of_cells)
+    number_of_cells = counts.size
+    if number_of_cells == 1:
+        return edges[[0, -1]]
+    if prior is None:
+        prior = ncp_prior(number_of_cells, p0)
+
+    # length of the block from the lower edge of a cell to the upper edge
+    block_length = edges[-1] - edges
+    # cumulative_counts[i] is the number of values in the cells before the cell i
+    cumulative_counts = np.concatenate(([0], np.cumsum(counts)))
+
+    best = np.zeros(number_of_cells)
+    last = np.zeros(number_of_cells, dtype=np.int64)
+    for r in range(number_of_cells):
+        # fitness of the blocks [k, r] for k in [0, r]
+        length = block_length[:r + 1] - block_length[r + 1]
+        number_of_values = cumulative_counts[r + 1] - cumulative_counts[:r + 1]
+        fitness = number_of_values * (np.log(number_of_values) - np.log(length)) - prior
+        fitness[1:] += best[:r]
+        k = int(np.argmax(fitness))
+        last[r] = k
+        best[r] = fitness[k]
+
+    # backtrack the change points
+    change_points = [number_of_cells]
+    k = number_of_cells
+    while k > 0:
+        k = last[k - 1]
+        change_points.append(k)
+    return edges[change_points[::-1]]
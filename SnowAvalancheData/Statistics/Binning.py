@@ -23,6 +23,7 @@
 __all__ = [
     'Binning1D',
     'BinningND',
+    'VariableBinning1D',
     'Interval',
     'NDMixin',
 ]
@@ -92,6 +93,8 @@ class Binning1D:
 
     @classmethod
     def from_json(cls, data: dict) -> 'Binning1D':
+        if 'edges' in data:
+            return VariableBinning1D.from_json(data)
         return cls(Interval(data['inf'], data['sup']), bin_width=data['bin_width'])
 
     ##############################################
@@ -222,6 +225,17 @@ class Binning1D:
 
     ##############################################
 
+    def bin_widths(self) -> np.ndarray:
+        return np.full(self._number_of_bins, self._bin_width)
+
+    ##############################################
+
+    def rebin(self, factor: int) -> 'Binning1D':
+        """Return a binning with bins *factor* times larger"""
+        return self.__class__(self._interval, bin_width=self._bin_width*factor)
+
+    ##############################################
+
     def bin_slice(self, xflow: bool=False) -> slice:
         if xflow:
             return slice(self.UNDER_FLOW_BIN, self._array_size)
@@ -249,13 +263,31 @@ class Binning1D:
 
    ###############################################
 
-    def __str__(self) -> str:
-        text = f"""
-Binning 1D
-  interval: {self._interval}
+    def find_bins(self, x: np.ndarray) -> np.ndarray:
+        """Vectorised :meth:`find_bin`, return the bin indexes of an array"""
+        x = np.asarray(x, dtype=np.float64)
+        if np.isnan(x).any():
+            raise ValueError("NaN value")
+        inf = self._interval.inf
+        # computed like find_bin to get the same bins
+        with np.errstate(invalid='ignore'):
+            bins = (self._inverse_bin_width * (x - inf)).astype(np.int64) + 1
+        bins[x < inf] = self.UNDER_FLOW_BIN
+        bins[x >= self._interval.sup] = self._over_flow_bin
+        return bins
+
+   ###############################################
+
+    def _text_header(self) -> str:
+        return f"""  interval: {self._interval}
   number of bins: {self._number_of_bins}
   bin width: {self._bin_width:g}
 """
+
+    def __str__(self) -> str:
+        text = """
+Binning 1D
+""" + self._text_header()
         for i in self.bin_iterator(xflow=True):
             # Fixme: 3u count number of digits
             text += '  %3u ' % i + str(self.bin_interval(i)) + '\n'
@@ -276,6 +308,168 @@ Binning 1D
 
 ####################################################################################################
 
+class VariableBinning1D(Binning1D):
+
+    """Binning defined by an array of increasing edges
+
+    Bins are right open like :class:`Binning1D`, values lower than the first edge go to the
+    underflow bin and values greater or equal to the last edge go to the overflow bin.
+
+    """
+
+    ##############################################
+
+    def __init__(self, edges: np.ndarray) -> None:
+        edges = np.array(edges, dtype=np.float64)
+        if edges.ndim != 1 or edges.size < 2:
+            raise ValueError("Edges must be a 1D array of at least two values")
+        if not np.isfinite(edges).all() or (np.diff(edges) <= 0).any():
+            raise ValueError("Edges must be finite and strictly increasing")
+        self._edges = edges
+        self._interval = Interval(edges[0], edges[-1], right_open=True)
+        self._number_of_bins = edges.size - 1
+        self._last_bin = self._number_of_bins
+        self._over_flow_bin = self._number_of_bins +1
+        self._array_size = self._over_flow_bin +1
+        # bins don't have the same width
+        self._bin_width = None
+
+    ##############################################
+
+    @classmethod
+    def from_quantiles(cls, data: np.ndarray, number_of_bins: int) -> 'VariableBinning1D':
+        """Return a binning having about the same number of values per bin
+
+        Duplicated quantiles of discrete data are merged, thus the binning can have less bins.  The
+        last edge is moved after the maximum so it is not in the overflow bin.
+
+        """
+        data = np.asarray(data, dtype=np.float64)
+        if not data.size:
+            raise ValueError("Empty data")
+        edges = np.unique(np.quantile(data, np.linspace(0, 1, int(number_of_bins) + 1)))
+        if edges.size == 1:
+            edges = np.append(edges, edges[0] + 1)
+        else:
+            edges[-1] = np.nextafter(edges[-1], np.inf)
+        return cls(edges)
+
+    ##############################################
+
+    @classmethod
+    def from_log(cls, interval: Interval, number_of_bins: int) -> 'VariableBinning1D':
+        """Return a binning having log spaced edges, *interval* must be positive"""
+        if interval.inf <= 0:
+            raise ValueError("Log binning requires a positive interval")
+        return cls(np.geomspace(interval.inf, interval.sup, int(number_of_bins) + 1))
+
+    ##############################################
+
+    @classmethod
+    def from_bayesian_blocks(cls, data: np.ndarray, **kwargs) -> 'VariableBinning1D':
+        """Return a binning on the Bayesian blocks of the data, see :func:`bayesian_blocks`
+
+        The last edge is moved after the maximum so it is not in the overflow bin.
+
+        """
+        from .BayesianBlocks import bayesian_blocks
+        edges = bayesian_blocks(data, **kwargs)
+        if edges[0] == edges[-1]:
+            edges = np.array((edges[0], edges[0] + 1))
+        else:
+            edges[-1] = np.nextafter(edges[-1], np.inf)
+        return cls(edges)
+
+    ##############################################
+
+    def clone(self) -> 'VariableBinning1D':
+        return self.__class__(self._edges)
+
+    ##############################################
+
+    def to_json(self) -> dict:
+        return {
+            'edges': self._edges.tolist(),
+        }
+
+    ##############################################
+
+    @classmethod
+    def from_json(cls, data: dict) -> 'VariableBinning1D':
+        return cls(data['edges'])
+
+    ##############################################
+
+    @property
+    def edges(self) -> np.ndarray:
+        return self._edges
+
+    ##############################################
+
+    def __eq__(self, other: Binning1D) -> bool:
+        return (isinstance(other, VariableBinning1D)
+                and self._number_of_bins == other._number_of_bins
+                and np.array_equal(self._edges, other._edges))
+
+    ###############################################
+
+    def _bin_edge(self, i: int, offset: float=0) -> float:
+        self._check_bin_index(i, xflow=False)
+        inf = self._edges[i - 1]
+        return float(inf + offset*(self._edges[i] - inf))
+
+    ##############################################
+
+    def bins(self) -> np.ndarray:
+        return self._edges.copy()
+
+    def bin_lower_edges(self) -> np.ndarray:
+        return self._edges[:-1].copy()
+
+    def bin_centers(self) -> np.ndarray:
+        return .5*(self._edges[:-1] + self._edges[1:])
+
+    def bin_widths(self) -> np.ndarray:
+        return np.diff(self._edges)
+
+    ##############################################
+
+    def rebin(self, factor: int) -> 'VariableBinning1D':
+        """Merge *factor* consecutive bins, the last bin merges the remaining bins"""
+        edges = self._edges[::factor]
+        if edges[-1] != self._edges[-1]:
+            edges = np.append(edges, self._edges[-1])
+        return self.__class__(edges)
+
+   ###############################################
+
+    def find_bin(self, x: float) -> int:
+        return int(np.searchsorted(self._edges, x, side='right'))
+
+    def find_bins(self, x: np.ndarray) -> np.ndarray:
+        x = np.asarray(x, dtype=np.float64)
+        if np.isnan(x).any():
+            raise ValueError("NaN value")
+        # side right gives 0 for the underflow and the number of edges for the overflow
+        return np.searchsorted(self._edges, x, side='right').astype(np.int64)
+
+   ###############################################
+
+    def _text_header(self) -> str:
+        widths = self.bin_widths()
+        return f"""  interval: {self._interval}
+  number of bins: {self._number_of_bins}
+  bin width: {widths.min():g} - {widths.max():g}
+"""
+
+   ###############################################
+
+    def sub_binning(self, interval: Interval) -> 'VariableBinning1D':
+        edges = self._edges
+        return self.__class__(edges[(interval.inf <= edges) & (edges <= interval.sup)])
+
+####################################################################################################
+
 class NDMixin:
 
     ##############################################
@@ -314,6 +508,11 @@ class BinningND(NDMixin):
 
     ##############################################
 
+    def __eq__(self, other: 'BinningND') -> bool:
+        return self.dimension == other.dimension and all(a == b for a, b in zip(self, other))
+
+    ##############################################
+
     def find_bin(self, *args) -> tuple[int]:
         # Numpy index must be a tuple
         return tuple([binning.find_bin(x) for binning, x in zip(self, args)])
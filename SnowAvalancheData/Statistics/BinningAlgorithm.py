@@ -29,11 +29,12 @@
 
 import numpy as np
 
-# from . import bayesian_blocks
+from .BayesianBlocks import bayesian_blocks
 
 ####################################################################################################
 
 __all__ = [
+    'bayesian_blocks',
     'scott_bin_width',
     'freedman_bin_width',
     'knuth_bin_width',
@@ -180,7 +181,12 @@ def freedman_bin_width(data: np.ndarray, return_bins: bool=False) -> float:
 
 ####################################################################################################
 
-def knuth_bin_width(data: np.ndarray, return_bins: float=False, quiet: float=True) -> float:
+def knuth_bin_width(
+        data: np.ndarray,
+        return_bins: bool=False,
+        quiet: bool=True,
+        max_number_of_bins: int=None,
+) -> float:
     r"""Return the optimal histogram bin width using Knuth's rule.
 
     Knuth's rule is a fixed-width, Bayesian approach to determining the optimal bin width of a
@@ -193,12 +199,16 @@ def knuth_bin_width(data: np.ndarray, return_bins: float=False, quiet: float=Tru
     return_bins : bool, optional
         if True, then return the bin edges
     quiet : bool, optional
-        if True (default) then suppress stdout output from scipy.optimize
+        unused, kept for compatibility
+    max_number_of_bins : int, optional
+        upper bound of the search, ``MAX_NUMBER_OF_BINS`` or the number of data points by default,
+        bins are never narrower than the data resolution
 
     Returns
     -------
     dx : float
-        optimal bin width. Bins are measured starting at the first data point.
+        optimal bin width. Bins are measured starting at the first data point, or half a resolution
+        step before on quantised data.
     bins : ndarray
         bin edges: returned if ``return_bins`` is True
 
@@ -215,6 +225,11 @@ def knuth_bin_width(data: np.ndarray, return_bins: float=False, quiet: float=Tru
     where :math:`\Gamma` is the Gamma function, :math:`n` is the number of data points, :math:`n_k`
     is the number of measurements in bin :math:`k` [1]_.
 
+    Unlike astroML, which runs a simplex minimisation on a continuous variable, every number of bins
+    in [1, max_number_of_bins] is evaluated, thus the global optimum is returned.  The search is
+    bounded by the data resolution, on quantised data, e.g. integers, the bin width is a whole
+    multiple of the resolution.
+
     References
     ----------
     .. [1] Knuth, K.H. "Optimal Data-Based Binning for Histograms".
@@ -227,15 +242,10 @@ def knuth_bin_width(data: np.ndarray, return_bins: float=False, quiet: float=Tru
 
     """
 
-    # import here because of optional scipy dependency
-    from scipy import optimize
-
     knuth_function = KnuthFunction(data)
-    dx0, bins0 = freedman_bin_width(data, True)
-    # print(dx0, bins0)
-    number_of_bins = optimize.fmin(knuth_function, len(bins0), disp=not quiet)[0]
+    number_of_bins = knuth_function.optimum(max_number_of_bins)
     bins = knuth_function.bins(number_of_bins)
-    dx = bins[1] - bins[0]
+    dx = knuth_function.bin_width(number_of_bins)
 
     if return_bins:
         return dx, bins
@@ -274,16 +284,23 @@ class KnuthFunction:
 
     ##############################################
 
+    MAX_NUMBER_OF_BINS = 1000
+
+    ##############################################
+
     def __init__(self, data: np.ndarray) -> None:
         self.data = np.array(data, copy=True)
         if self.data.ndim != 1:
             raise ValueError("data should be 1-dimensional")
+        if not self.data.size:
+            raise ValueError("data is empty")
         self.data.sort()
         self._number_of_elements = self.data.size
+        self._init_resolution()
+        # number of bins -> value
+        self._cache = {}
 
         # import here rather than globally: scipy is an optional dependency.
-        # Note that scipy is imported in the function which calls this,
-        # so there shouldn't be any issue importing here.
         from scipy import special
 
         # create a reference to gammaln to use in self.eval()
@@ -291,9 +308,68 @@ class KnuthFunction:
 
     ##############################################
 
+    def _init_resolution(self) -> None:
+        """Find the resolution of the data, i.e. the smallest gap between two values
+
+        Data are quantised, e.g. integers, if every value is on the grid of the resolution starting at
+        the minimum, the grid has :attr:`_number_of_cells` cells centred on the values.
+
+        """
+        self._resolution = None
+        self._number_of_cells = None
+        unique_values = np.unique(self.data)
+        if unique_values.size < 2:
+            return
+        self._resolution = float(np.diff(unique_values).min())
+        steps = (unique_values - unique_values[0]) / self._resolution
+        if np.allclose(steps, np.round(steps), rtol=0, atol=1e-6):
+            self._number_of_cells = int(round(steps[-1])) + 1
+
+    @property
+    def is_quantised(self) -> bool:
+        return self._number_of_cells is not None
+
+    ##############################################
+
+    def _cells_per_bin(self, number_of_bins: int) -> int:
+        """Return the smallest number of grid cells per bin such that the bins cover the grid"""
+        return -(-self._number_of_cells // int(number_of_bins))
+
+    def bin_width(self, number_of_bins: int) -> float:
+        if self.is_quantised:
+            return self._cells_per_bin(number_of_bins) * self._resolution
+        return (self.data[-1] - self.data[0]) / int(number_of_bins)
+
+    ##############################################
+
     def bins(self, number_of_bins: int) -> np.ndarray:
-        """Return the bin edges given M number of bins"""
-        return np.linspace(self.data[0], self.data[-1], int(number_of_bins) + 1)
+        """Return the bin edges given M number of bins
+
+        On quantised data, the bin width is a whole number of grid cells and the edges are at the
+        middle of two grid values, thus every bin contains the same number of possible values.  The
+        last bin can extend beyond the maximum.
+
+        """
+        number_of_bins = int(number_of_bins)
+        if self.is_quantised:
+            lower = self.data[0] - .5*self._resolution
+            return lower + self.bin_width(number_of_bins) * np.arange(number_of_bins + 1)
+        return np.linspace(self.data[0], self.data[-1], number_of_bins + 1)
+
+    ##############################################
+
+    def counts(self, number_of_bins: int) -> np.ndarray:
+        """Return the bin counts, like :func:`numpy.histogram` the last bin is closed
+
+        Data are sorted, thus the counts are differences of the positions of the edges.
+
+        """
+        bins = self.bins(number_of_bins)
+        positions = np.empty(bins.size, dtype=np.int64)
+        positions[0] = 0
+        positions[1:-1] = np.searchsorted(self.data, bins[1:-1], side='left')
+        positions[-1] = self._number_of_elements
+        return np.diff(positions)
 
     ##############################################
 
@@ -320,15 +396,76 @@ class KnuthFunction:
         M = int(number_of_bins)
         if M <= 0:
             return np.inf
+        value = self._cache.get(M)
+        if value is not None:
+            return value
 
-        bins = self.bins(M)
-        nk, bins = np.histogram(self.data, bins)
+        nk = self.counts(M)
         N = self._number_of_elements
 
-        return -(
-            N * np.log(M)
+        # N log(M) is N log(V / w) for a range V, the range of quantised data depends on the bin width
+        if self.is_quantised:
+            log_m = np.log(self._number_of_cells * self._resolution / self.bin_width(M))
+        else:
+            log_m = np.log(M)
+        value = -(
+            N * log_m
             + self._gammaln(0.5 * M)
             - M * self._gammaln(0.5)
             - self._gammaln(N + 0.5 * M)
             + np.sum(self._gammaln(nk + 0.5))
         )
+        self._cache[M] = value
+        return value
+
+    ##############################################
+
+    @property
+    def max_number_of_bins(self) -> int:
+        """Number of bins having the width of the data resolution
+
+        On quantised data, e.g. integers, the likelihood keeps rising when the bins are narrower than
+        the quantisation step, thus the bins must not be narrower than the smallest gap between two
+        values.
+
+        """
+        if self._resolution is None:
+            return 1
+        if self.is_quantised:
+            return self._number_of_cells
+        # a float division can fall just under an integer
+        return max(1, int(np.floor((self.data[-1] - self.data[0]) / self._resolution * (1 + 1e-9))))
+
+    ##############################################
+
+    def candidates(self, max_number_of_bins: int) -> list[int]:
+        """Return the numbers of bins in [1, max_number_of_bins] to search
+
+        On quantised data, the bin width must be a whole number of grid cells, else the bins would
+        alternately contain n and n+1 possible values and the histogram would show a comb.  Thus
+        there is one candidate per number of cells per bin.
+
+        """
+        if not self.is_quantised:
+            return list(range(1, max_number_of_bins + 1))
+        number_of_cells = self._number_of_cells
+        numbers_of_bins = np.arange(1, max_number_of_bins + 1)
+        cells_per_bin = -(-number_of_cells // numbers_of_bins)
+        # keep the lowest number of bins for a width
+        return numbers_of_bins[-(-number_of_cells // cells_per_bin) == numbers_of_bins].tolist()
+
+    ##############################################
+
+    def optimum(self, max_number_of_bins: int=None) -> int:
+        """Return the number of bins in [1, max_number_of_bins] minimising the function
+
+        The search is also bounded by the data resolution, see :attr:`max_number_of_bins` and
+        :meth:`candidates`.  Ties are resolved by the lowest number of bins.
+
+        """
+        if max_number_of_bins is None:
+            max_number_of_bins = min(self._number_of_elements, self.MAX_NUMBER_OF_BINS)
+        max_number_of_bins = min(int(max_number_of_bins), self.max_number_of_bins)
+        candidates = self.candidates(max(1, max_number_of_bins))
+        values = [self.eval(_) for _ in candidates]
+        return candidates[int(np.argmin(values))]
@@ -25,6 +25,7 @@ __all__ = [
     'Histogram',
     'Histogram2D',
     'Interval',
+    'VariableBinning1D',
 ]
 
 ####################################################################################################
@@ -35,82 +36,202 @@ import os
 
 import numpy as np
 
-from .Binning import Binning1D, BinningND, Interval, NDMixin
+from .Binning import Binning1D, BinningND, Interval, NDMixin, VariableBinning1D
+
+####################################################################################################
+
+BINCOUNT_MAX_RANGE = 1 << 16
+MOMENT_CHUNK_SIZE = 1 << 20
+
+def _batch_moments(x: np.ndarray, weights: np.ndarray=None) -> tuple:
+    """Return (number of entries, sum of weights, sum of squared weights, mean, M2, M3, M4)
+
+    M_k is the sum of the weighted k-th powers of the deviations from the mean, they are computed in
+    two passes.  Unweighted integer arrays having a small range are reduced to the counts of the
+    values.
+
+    """
+    size = x.size
+    if weights is None:
+        if x.dtype.kind in 'iub':
+            x_min = int(x.min())
+            if int(x.max()) - x_min < BINCOUNT_MAX_RANGE:
+                counts = np.bincount(x.astype(np.intp) - x_min)
+                values = np.flatnonzero(counts)
+                weights = counts[values].astype(np.float64)
+                x = values.astype(np.float64) + x_min
+        sum_weight = sum_weight2 = float(size)
+    else:
+        sum_weight = float(weights.sum())
+        sum_weight2 = float(np.dot(weights, weights))
+        if not sum_weight:
+            return size, 0., 0., 0., 0., 0., 0.
+    x = x.astype(np.float64)
+    if weights is None:
+        mean = float(x.sum()) / sum_weight
+        d = x - mean
+        d2 = d * d
+        return size, sum_weight, sum_weight2, mean, float(d2.sum()), float(np.dot(d2, d)), float(np.dot(d2, d2))
+    mean = float(np.dot(weights, x)) / sum_weight
+    d = x - mean
+    wd2 = weights * d * d
+    return size, sum_weight, sum_weight2, mean, float(wd2.sum()), float(np.dot(wd2, d)), float(np.dot(wd2, d * d))
 
 ####################################################################################################
 
 class DataSetMoment:
 
+    """Mergeable moments of a weighted data set
+
+    The mean and the sums of the powers of the deviations from the mean are updated using the
+    pairwise formulas of Chan et al. and Pébay, thus moments are stable for values far from zero and
+    exact to merge for parallel reductions.  The unbiased variance uses the number of effective
+    entries, thus weights are reliability weights.
+
+    """
+
     ##############################################
 
-    def __init__(
-            self,
-            number_of_entries: int=0,
-            sum_x: float=0, sum_x2: float=0, sum_x3: float=0, sum_x4: float=0,
-    ) -> None:
-        self.number_of_entries = number_of_entries
-        self.sum_x = sum_x
-        self.sum_x2 = sum_x2
-        self.sum_x3 = sum_x3
-        self.sum_x4 = sum_x4 # unused
+    def __init__(self) -> None:
+        self.number_of_entries = 0
+        self.sum_weight = 0.
+        self.sum_weight2 = 0.
+        self._mean = 0.
+        # sums of w * (x - mean)**k
+        self._m2 = 0.
+        self._m3 = 0.
+        self._m4 = 0.
 
     ##############################################
 
     def clone(self) -> 'DataSetMoment':
-        return self.__class__(
-            self.number_of_entries,
-            self.sum_x, self.sum_x2, self.sum_x3, self.sum_x4,
-        )
+        obj = self.__class__()
+        obj.__dict__.update(self.__dict__)
+        return obj
 
     ##############################################
 
     def to_json(self) -> dict:
         return {
             'number_of_entries': self.number_of_entries,
-            'sum_x': self.sum_x,
-            'sum_x2': self.sum_x2,
-            'sum_x3': self.sum_x3,
-            'sum_x4': self.sum_x4,
+            'sum_weight': self.sum_weight,
+            'sum_weight2': self.sum_weight2,
+            'mean': self._mean,
+            'm2': self._m2,
+            'm3': self._m3,
+            'm4': self._m4,
         }
 
     ##############################################
 
     @classmethod
     def from_json(cls, data) -> 'DataSetMoment':
-        return cls(**data)
+        obj = cls()
+        n = data['number_of_entries']
+        obj.number_of_entries = n
+        if 'sum_x' in data:
+            # former format using power sums
+            obj.sum_weight = obj.sum_weight2 = float(n)
+            if n:
+                mean = data['sum_x'] / n
+                s2, s3, s4 = data['sum_x2'], data['sum_x3'], data['sum_x4']
+                obj._mean = mean
+                obj._m2 = s2 - n*mean**2
+                obj._m3 = s3 - 3*mean*s2 + 2*n*mean**3
+                obj._m4 = s4 - 4*mean*s3 + 6*mean**2*s2 - 3*n*mean**4
+        else:
+            obj.sum_weight = data['sum_weight']
+            obj.sum_weight2 = data['sum_weight2']
+            obj._mean = data['mean']
+            obj._m2 = data['m2']
+            obj._m3 = data['m3']
+            obj._m4 = data['m4']
+        return obj
 
     ##############################################
 
-    def fill(self, x: float) -> None:
-        self.number_of_entries += 1
-        self.sum_x += x
-        self.sum_x2 += x**2
-        self.sum_x3 += x**3
-        self.sum_x4 += x**4
+    def _merge(
+            self,
+            number_of_entries: int, sum_weight: float, sum_weight2: float,
+            mean: float, m2: float, m3: float, m4: float,
+    ) -> None:
+        """Merge the moments of another data set"""
+        if not sum_weight:
+            self.number_of_entries += number_of_entries
+            return
+        wa = self.sum_weight
+        wb = sum_weight
+        w = wa + wb
+        delta = mean - self._mean
+        delta_w = delta / w
+        m2a, m3a = self._m2, self._m3
+        self._m4 += (m4
+                     + delta*delta_w**3 * wa*wb * (wa*wa - wa*wb + wb*wb)
+                     + 6*delta_w**2 * (wa*wa*m2 + wb*wb*m2a)
+                     + 4*delta_w * (wa*m3 - wb*m3a))
+        self._m3 += (m3
+                     + delta*delta_w**2 * wa*wb * (wa - wb)
+                     + 3*delta_w * (wa*m2 - wb*m2a))
+        self._m2 += m2 + delta*delta_w * wa*wb
+        self._mean += delta_w * wb
+        self.number_of_entries += number_of_entries
+        self.sum_weight = w
+        self.sum_weight2 += sum_weight2
+
+    ##############################################
+
+    def fill(self, x: float, weight: float=1.) -> None:
+        weight = float(weight)
+        self._merge(1, weight, weight*weight, float(x), 0., 0., 0.)
+
+    ##############################################
+
+    def update(self, x: np.ndarray, weights: np.ndarray=None) -> None:
+        """Add an array of values, *weights* is an optional array of weights
+
+        Large arrays are processed by chunks to bound the temporary arrays.
+
+        """
+        x = np.asarray(x)
+        if x.ndim != 1:
+            raise ValueError("Values must be a 1D array")
+        if weights is not None:
+            weights = np.asarray(weights, dtype=np.float64)
+            if weights.shape != x.shape:
+                raise ValueError("Values and weights must have the same shape")
+        for start in range(0, x.size, MOMENT_CHUNK_SIZE):
+            stop = start + MOMENT_CHUNK_SIZE
+            self._merge(*_batch_moments(x[start:stop], None if weights is None else weights[start:stop]))
+
+    fill_array = update
 
     ##############################################
 
     def __iadd__(self, obj: 'DataSetMoment') -> 'DataSetMoment':
-        self.number_of_entries += obj.number_of_entries
-        self.sum_x += obj.sum_x
-        self.sum_x2 += obj.sum_x2
-        self.sum_x3 += obj.sum_x3
-        self.sum_x4 += obj.sum_x4
+        self._merge(
+            obj.number_of_entries, obj.sum_weight, obj.sum_weight2,
+            obj._mean, obj._m2, obj._m3, obj._m4,
+        )
         return self
 
     ##############################################
 
+    @property
+    def number_of_effective_entries(self) -> float:
+        return self.sum_weight**2 / self.sum_weight2
+
     @property
     def mean(self) -> float:
-        return self.sum_x / self.number_of_entries
+        return self._mean
 
     @property
     def biased_variance(self) -> float:
-        return self.sum_x2 / self.number_of_entries - self.mean**2
+        return self._m2 / self.sum_weight
 
     @property
     def unbiased_variance(self) -> float:
-        return self.number_of_entries / (self.number_of_entries -1) * self.biased_variance
+        # biased variance * n_eff / (n_eff - 1), reduces to n / (n-1) for unit weights
+        return self._m2 / (self.sum_weight - self.sum_weight2 / self.sum_weight)
 
     @property
     def biased_standard_deviation(self) -> float:
@@ -122,65 +243,119 @@ class DataSetMoment:
 
     @property
     def skew(self) -> float:
-        return ((self.sum_x3 / self.number_of_entries - 3*self.mean*self.biased_variance - self.mean**3)
-                / (self.biased_variance*self.biased_standard_deviation))
+        return (self._m3 / self.sum_weight) / self.biased_variance**1.5
 
     @property
     def kurtosis(self) -> float:
-        # Need an expansion in terms of sum_x**i
-        return NotImplementedError
+        """Excess kurtosis"""
+        return (self._m4 / self.sum_weight) / self.biased_variance**2 - 3
 
 ####################################################################################################
 
 class DataSetMomentND(NDMixin):
 
+    """Moments of each axis and co-moments of the axis pairs
+
+    The co-moment of the axes i < j is the sum of w * (x_i - mean_i) * (x_j - mean_j).
+
+    """
+
     ##############################################
 
     def __init__(self, dimension: int) -> None:
-        NDMixin.__init__(self, [DataSetMoment() for i in range(dimension)])
+        NDMixin.__init__(self, *[DataSetMoment() for i in range(dimension)])
+        self.co_moments = {(i, j): 0. for i in range(dimension) for j in range(i + 1, dimension)}
 
     ##############################################
 
-    def fill(self, *args) -> None:
-        pass
-        # Fixme:
-        # for data_set_moment, x in zip(self, args):
-        #     data_set_moment.fill(x)
+    def clone(self) -> 'DataSetMomentND':
+        obj = self.__class__(self.dimension)
+        obj += self
+        return obj
 
-####################################################################################################
+    ##############################################
+
+    def to_json(self) -> dict:
+        return {
+            'moments': [_.to_json() for _ in self],
+            'co_moments': [[i, j, value] for (i, j), value in self.co_moments.items()],
+        }
 
-class WeightedDataSetMoment:
+    @classmethod
+    def from_json(cls, data: dict) -> 'DataSetMomentND':
+        obj = cls(len(data['moments']))
+        obj._objs = [DataSetMoment.from_json(_) for _ in data['moments']]
+        for i, j, value in data['co_moments']:
+            obj.co_moments[(i, j)] = value
+        return obj
 
     ##############################################
 
-    def __init__(self) -> None:
-        self.sum_weight = 0
-        self.sum_weight2 = 0
-        self.sum_weight_x = 0
-        self.sum_weight_x2 = 0
-        self.sum_weight_x3 = 0
-        self.sum_weight_x4 = 0
+    def _merge_co_moments(self, sum_weight: float, means: list[float], co_moments: dict) -> None:
+        """Merge the co-moments of another data set, must be called before merging the axes"""
+        wa = self[0].sum_weight
+        w = wa + sum_weight
+        if not w:
+            return
+        for (i, j), value in co_moments.items():
+            delta_i = means[i] - self[i].mean
+            delta_j = means[j] - self[j].mean
+            self.co_moments[(i, j)] += value + delta_i * delta_j * wa * sum_weight / w
 
     ##############################################
 
-    def fill(self, x: float, weight: float=1.) -> None:
-        self.sum_weight += weight
-        self.sum_weight2 += weight**2
-        weight_x = weight * x
-        self.sum_weight_x += weight_x
-        self.sum_weight_x2 += weight_x**2
-        self.sum_weight_x3 += weight_x**3
-        self.sum_weight_x4 += weight_x**4
+    def fill(self, *args, weight: float=1.) -> None:
+        self.fill_array(*[np.array([_]) for _ in args], weights=np.array([weight], dtype=np.float64))
 
     ##############################################
 
-    @property
-    def number_of_effective_entries(self) -> float:
-        return self.sum_weight**2 / self.sum_weight2
+    def fill_array(self, *arrays: np.ndarray, weights: np.ndarray=None) -> None:
+        """Vectorised :meth:`fill`, an array per axis"""
+        arrays = [np.asarray(_, dtype=np.float64) for _ in arrays]
+        if not arrays[0].size:
+            return
+        batch = [DataSetMoment() for _ in arrays]
+        for moment, x in zip(batch, arrays):
+            moment.update(x, weights)
+        means = [_.mean for _ in batch]
+        co_moments = {}
+        for i, j in self.co_moments:
+            d_i = arrays[i] - means[i]
+            if weights is not None:
+                d_i = d_i * weights
+            co_moments[(i, j)] = float(np.dot(d_i, arrays[j] - means[j]))
+        self._merge_co_moments(batch[0].sum_weight, means, co_moments)
+        for moment, other in zip(self, batch):
+            moment += other
+
+    ##############################################
+
+    def __iadd__(self, obj: 'DataSetMomentND') -> 'DataSetMomentND':
+        self._merge_co_moments(obj[0].sum_weight, [_.mean for _ in obj], obj.co_moments)
+        for data_set_moment, other in zip(self, obj):
+            data_set_moment += other
+        return self
+
+    ##############################################
 
     @property
-    def mean(self) -> float:
-        return self.sum_weight_x / self.number_of_effective_entries
+    def number_of_entries(self) -> int:
+        return self[0].number_of_entries
+
+    ##############################################
+
+    def covariance(self, i: int=0, j: int=1) -> float:
+        """Unbiased covariance of the axes *i* and *j*"""
+        if i == j:
+            return self[i].unbiased_variance
+        if i > j:
+            i, j = j, i
+        moment = self[i]
+        return self.co_moments[(i, j)] / (moment.sum_weight - moment.sum_weight2 / moment.sum_weight)
+
+    def correlation(self, i: int=0, j: int=1) -> float:
+        """Pearson correlation coefficient of the axes *i* and *j*"""
+        return self.covariance(i, j) / (self[i].standard_deviation * self[j].standard_deviation)
 
 ####################################################################################################
 
@@ -204,11 +379,16 @@ class Histogram:
         self._unit = str(kwargs.get('unit', ''))
         self._y_unit = UnitType.COUNT
         self._make_array(self._binning.array_size)
-        self.data_set_moment = DataSetMoment()
+        self.data_set_moment = self._new_data_set_moment()
         self.clear_feature()
 
     ##############################################
 
+    def _new_data_set_moment(self) -> DataSetMoment:
+        return DataSetMoment()
+
+    ##############################################
+
     def _make_array(self, array_size: int) -> None:
         self._accumulator = np.zeros(array_size)
         self._sum_weight_square = np.zeros(array_size)
@@ -220,7 +400,7 @@ class Histogram:
         histogram = self.__class__(self._binning.clone())
         histogram += self
         for _ in ('_title', '_unit', '_y_unit'):
-            setattr(histogram, getattr(self, _))
+            setattr(histogram, _, getattr(self, _))
         return histogram
 
     ##############################################
@@ -238,7 +418,7 @@ class Histogram:
 
     @classmethod
     def from_json(cls, data: dict) -> 'Histogram':
-        binning = cls.from_json(data['binning'])
+        binning = Binning1D.from_json(data['binning'])
         histogram = Histogram(binning, title=data['title'])
         histogram.data_set_moment += DataSetMoment.from_json(data['data_set_moment'])
         histogram._accumulator[...] = data['accumulator']
@@ -250,7 +430,7 @@ class Histogram:
     def clear(self, value: float=.0) -> None:
         self._accumulator[:] = value
         self._sum_weight_square[:] = value**2
-        self.data_set_moment = DataSetMoment()
+        self.data_set_moment = self._new_data_set_moment()
         self.clear_feature()
 
     ##############################################
@@ -264,7 +444,7 @@ class Histogram:
     ##############################################
 
     def rebin(self, factor: int=2) -> 'Histogram':
-        histogram = self.__class__(Binning1D(self._binning.interval, bin_width=self._binning.bin_width*factor))
+        histogram = self.__class__(self._binning.rebin(factor))
         binning = histogram.binning
 
         # copy under/over flow bins
@@ -272,18 +452,15 @@ class Histogram:
             histogram._accumulator[i] = self._accumulator[i]
             histogram._sum_weight_square[i] = self._sum_weight_square[i]
 
-        start = 1
-        for i in binning.bin_iterator():
-            stop = min(start + factor, self.binning.number_of_bins)
-            histogram._accumulator[i] = np.sum(self._accumulator[start:stop])
-            histogram._sum_weight_square[i] = np.sum(self._sum_weight_square[start:stop])
-            start = stop
-
-        # Fixme: merge last bin when the rebin factor is not a multiple
-        over_flow_bin = self.binning.over_flow_bin
-        if stop < over_flow_bin:
-            histogram._accumulator[i] += np.sum(self._accumulator[stop:over_flow_bin])
-            histogram._sum_weight_square[i] += np.sum(self._sum_weight_square[stop:over_flow_bin])
+        # sum factor bins, the last bin merges the remaining bins when the rebin factor is not a
+        # multiple
+        bin_slice = self._binning.bin_slice()
+        starts = factor * np.arange(binning.number_of_bins)
+        for src, dst in (
+                (self._accumulator, histogram._accumulator),
+                (self._sum_weight_square, histogram._sum_weight_square),
+        ):
+            dst[binning.bin_slice()] = np.add.reduceat(src[bin_slice], starts)
 
         histogram.data_set_moment += self.data_set_moment
 
@@ -338,7 +515,7 @@ class Histogram:
 
     @property
     def x_values(self) -> np.ndarray:
-        return self._binning.bin_centers
+        return self._binning.bin_centers()
 
     @property
     def min(self) -> float:
@@ -475,7 +652,36 @@ class Histogram:
         self._accumulator[i] += weight
         # if weight == 1.: weight_square = 1.
         self._sum_weight_square[i] += weight**2
-        self.data_set_moment.fill(*values)
+        self.data_set_moment.fill(*values, weight=weight)
+        self.clear_feature()
+
+    ##############################################
+
+    def fill_array(self, values: np.ndarray, weights: np.ndarray=None) -> None:
+        """Fill an array of values at once, *weights* is an optional array of weights
+
+        The bins are computed by :meth:`Binning1D.find_bins` and accumulated using
+        :func:`numpy.bincount`.
+
+        """
+        values = np.asarray(values)
+        if values.ndim != 1:
+            raise ValueError("Values must be a 1D array")
+        array_size = self._binning.array_size
+        bins = self._binning.find_bins(values)
+        if weights is None:
+            counts = np.bincount(bins, minlength=array_size)
+            self._accumulator += counts
+            self._sum_weight_square += counts
+        else:
+            weights = np.asarray(weights, dtype=np.float64)
+            if weights.shape != values.shape:
+                raise ValueError("Values and weights must have the same shape")
+            if (weights < 0).any():
+                raise ValueError
+            self._accumulator += np.bincount(bins, weights=weights, minlength=array_size)
+            self._sum_weight_square += np.bincount(bins, weights=weights**2, minlength=array_size)
+        self.data_set_moment.fill_array(values, weights)
         self.clear_feature()
 
     ##############################################
@@ -514,8 +720,8 @@ class Histogram:
     @property
     def mean(self) -> float:
         if self._mean is None:
-            # if weighted: / self.number_of_effective_entries
-            self._mean = np.sum(self.binning_accumulator * self.x_values) / self.integral
+            # overflow bins don't have a center
+            self._mean = np.sum(self.binning_accumulator * self.x_values) / self.binning_accumulator.sum()
         return self._mean
 
     ##############################################
@@ -523,14 +729,17 @@ class Histogram:
     @property
     def biased_variance(self) -> float:
         if self._biased_variance is None:
-            self._biased_variance = np.sum(self.binning_accumulator * self.x_values**2) / self.integral - self.mean**2
+            self._biased_variance = (np.sum(self.binning_accumulator * (self.x_values - self.mean)**2)
+                                     / self.binning_accumulator.sum())
         return self._biased_variance
 
     ##############################################
 
     @property
     def unbiased_variance(self) -> float:
-        return self.integral / (self.integral -1) * self.biased_variance
+        # the number of entries for unit weights
+        number_of_effective_entries = self.number_of_effective_entries
+        return number_of_effective_entries / (number_of_effective_entries -1) * self.biased_variance
 
     ##############################################
 
@@ -550,14 +759,14 @@ class Histogram:
     def skew(self) -> float:
         # self.biased_variance * self.biased_standard_deviation
         return (np.sum(self.binning_accumulator * (self.x_values - self.mean)**3)
-                / (self.biased_standard_deviation**3 * self.integral))
+                / (self.biased_standard_deviation**3 * self.binning_accumulator.sum()))
 
     ##############################################
 
     @property
     def kurtosis(self) -> float:
         return (np.sum(self.binning_accumulator * (self.x_values - self.mean)**4)
-                / (self.biased_variance**2 * self.integral)
+                / (self.biased_variance**2 * self.binning_accumulator.sum())
                 -3)
 
     ##############################################
@@ -571,14 +780,16 @@ class Histogram:
     ##############################################
 
     def normalise(self, scale: float=1, clone: bool=True, to_percent: bool=False) -> 'Histogram':
+        """Scale the histogram so the integral is *scale*, errors are scaled as well"""
         if to_percent:
             scale = 100
+        histogram = self._clone(clone)
         match scale:
             case 1:
-                self._y_unit = UnitType.NORMALISED
+                histogram._y_unit = UnitType.NORMALISED
             case 100:
-                self._y_unit = UnitType.PERCENT
-        histogram = self._clone(clone)
+                histogram._y_unit = UnitType.PERCENT
+        # the sums of squared weights are scaled by scale**2
         histogram *= scale / histogram.integral
         histogram.clear_feature()
         return histogram
@@ -590,9 +801,11 @@ class Histogram:
             raise NotImplementedError
         histogram = self._clone(clone)
         histogram.clear_feature()
+        # the error of a cumulative bin is the square root of the cumulative sum of the squared weights
         histogram._accumulator = np.cumsum(histogram._accumulator)
         histogram._accumulator[-1] = 0   # clear cumsum on overflow bin
         histogram._sum_weight_square = np.cumsum(histogram._sum_weight_square)
+        histogram._sum_weight_square[-1] = 0
         if normalise:
             histogram *= 100 / histogram._accumulator[-2]
             histogram._y_unit = UnitType.PERCENT
@@ -672,8 +885,7 @@ class Histogram:
         else:
             x = binning.bin_lower_edges()
 
-        x_errors = np.empty(x.shape)
-        x_errors[:] = .5*binning.bin_width
+        x_errors = .5*binning.bin_widths()
 
         if non_null:
             indices = np.where(y != 0)
@@ -683,9 +895,7 @@ class Histogram:
             y_errors = y_errors[indices]
 
         if not non_null:
-            edges = np.zeros(len(y) +1)
-            edges[:-1] = binning.bin_lower_edges()
-            edges[-1] = binning.interval.sup
+            edges = np.append(binning.bin_lower_edges(), binning.interval.sup)
             return x, y, x_errors, y_errors, edges
         else:
             return x, y, x_errors, y_errors
@@ -698,10 +908,7 @@ class Histogram:
 Histogram 1D: {self._title}
   unit: {self._unit}
   y_unit: {self._y_unit}
-  interval: {binning._interval}
-  number of bins: {binning._number_of_bins}
-  bin width: {binning._bin_width:g}
-"""
+""" + binning._text_header()
         for i in binning.bin_iterator(xflow=True):
             accumulator = self._accumulator[i]
             if accumulator == 0:
@@ -769,6 +976,15 @@ class EnumHistogram(Histogram):
 
     ##############################################
 
+    def fill_array(self, values: np.ndarray, weights: np.ndarray=None) -> None:
+        """Fill an array of enumerate values, or of members"""
+        values = np.asarray(values)
+        if values.dtype == object:
+            values = np.array([_.value for _ in values], dtype=np.int64)
+        super().fill_array(values, weights)
+
+    ##############################################
+
     def bin_label(self, i: int) -> str:
         try:
             return self._map[i]
@@ -814,12 +1030,59 @@ class Histogram2D(Histogram):
         # self._y_unit = None
         array_size = [binning.array_size for binning in self._binning]
         self._make_array(array_size)
-        self.data_set_moment = DataSetMomentND(dimension=2)
+        self.data_set_moment = self._new_data_set_moment()
 
         # self.clear_feature()
 
     ##############################################
 
+    def _new_data_set_moment(self) -> DataSetMomentND:
+        return DataSetMomentND(dimension=2)
+
+    ##############################################
+
+    def fill_array(self, x: np.ndarray, y: np.ndarray, weights: np.ndarray=None) -> None:
+        """Fill arrays of values at once, *weights* is an optional array of weights
+
+        The 2D bins are flattened and accumulated using :func:`numpy.bincount`.
+
+        """
+        x = np.asarray(x)
+        y = np.asarray(y)
+        if x.ndim != 1 or x.shape != y.shape:
+            raise ValueError("x and y must be 1D arrays of the same size")
+        shape = self._accumulator.shape
+        size = shape[0] * shape[1]
+        bins = self._binning.x.find_bins(x) * shape[1] + self._binning.y.find_bins(y)
+        if weights is None:
+            counts = np.bincount(bins, minlength=size).reshape(shape)
+            self._accumulator += counts
+            self._sum_weight_square += counts
+        else:
+            weights = np.asarray(weights, dtype=np.float64)
+            if weights.shape != x.shape:
+                raise ValueError("Values and weights must have the same shape")
+            if (weights < 0).any():
+                raise ValueError
+            self._accumulator += np.bincount(bins, weights=weights, minlength=size).reshape(shape)
+            self._sum_weight_square += np.bincount(bins, weights=weights**2, minlength=size).reshape(shape)
+        self.data_set_moment.fill_array(x, y, weights=weights)
+        self.clear_feature()
+
+    ##############################################
+
+    @property
+    def covariance(self) -> float:
+        """Unbiased covariance of the filled values"""
+        return self.data_set_moment.covariance(0, 1)
+
+    @property
+    def correlation(self) -> float:
+        """Correlation coefficient of the filled values"""
+        return self.data_set_moment.correlation(0, 1)
+
+    ##############################################
+
     @property
     def x_label(self):
         return self._x_label
@@ -837,14 +1100,8 @@ class Histogram2D(Histogram):
         text = f"""
 Histogram 2D: {self._title}
 X
-  interval: {binning_x._interval}
-  number of bins: {binning_x._number_of_bins}
-  bin width: {binning_x._bin_width:g}
-Y
-  interval: {binning_y._interval}
-  number of bins_y: {binning_y._number_of_bins}
-  bin width: {binning_y._bin_width:g}
-"""
+{binning_x._text_header()}Y
+{binning_y._text_header()}"""
         # unit: {self._unit}
         # y_unit: {self._y_unit}
         text += ' '*24 + str(binning_y.bin_lower_edges()) + os.linesep
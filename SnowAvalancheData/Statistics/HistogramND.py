@@ -0,0 +1,279 @@
+####################################################################################################
+#
+# Avalanche -
+# Copyright (C) 2021 Fabrice Salvaire
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+####################################################################################################
+
+"""Module to implement a sparse N-dimensional histogram.
+
+Only the filled bins are stored, as a sorted array of flat bin indexes and the corresponding
+accumulators, thus cross tabulations of many axes don't allocate the mostly empty dense array.  Flat
+indexes are computed using :func:`numpy.ravel_multi_index` on the bin indexes of each axis,
+including the underflow and overflow bins.
+
+For example, to cross activity, orientation and month::
+
+    histogram = HistogramND(BinningND(
+        enum_binning(Activity),
+        enum_binning(Orientation),
+        Binning1D(Interval(1, 13), bin_width=1),
+    ))
+    histogram.fill_array(*register.vectorise_joint('activity', 'orientation', 'month'))
+    activity_month = histogram.project(0, 2).to_dense()
+
+"""
+
+####################################################################################################
+
+__all__ = [
+    'HistogramND',
+    'enum_binning',
+]
+
+####################################################################################################
+
+from enum import Enum
+
+import numpy as np
+
+from .Binning import Binning1D, BinningND, Interval
+from .Histogram import DataSetMomentND, Histogram, Histogram2D
+
+####################################################################################################
+
+def enum_binning(cls: type[Enum]) -> Binning1D:
+    """Return a binning having a bin per enumerate value, like :class:`EnumHistogram`"""
+    values = [_.value for _ in cls]
+    return Binning1D(Interval(min(values), max(values) + 1), bin_width=1)
+
+####################################################################################################
+
+class HistogramND:
+
+    """Sparse histogram of arbitrary dimension"""
+
+    ##############################################
+
+    def __init__(self, binning: BinningND | list[Binning1D], **kwargs) -> None:
+        if not isinstance(binning, BinningND):
+            binning = BinningND(*binning)
+        self._binning = binning
+        self._shape = tuple(_.array_size for _ in binning)
+        if np.prod(self._shape, dtype=np.float64) >= 2**63:
+            raise ValueError("Too many bins")
+        self._title = str(kwargs.get('title', ''))
+        self._labels = list(kwargs.get('labels', [''] * binning.dimension))
+        self._keys = np.zeros(0, dtype=np.int64)
+        self._accumulator = np.zeros(0)
+        self._sum_weight_square = np.zeros(0)
+        self.data_set_moment = DataSetMomentND(binning.dimension)
+
+    ##############################################
+
+    def _new(self, binning: BinningND, labels: list[str]) -> 'HistogramND':
+        return self.__class__(binning, title=self._title, labels=labels)
+
+    def clone(self) -> 'HistogramND':
+        histogram = self._new(BinningND(*[_.clone() for _ in self._binning]), self._labels)
+        histogram += self
+        return histogram
+
+    ##############################################
+
+    @property
+    def binning(self) -> BinningND:
+        return self._binning
+
+    @property
+    def dimension(self) -> int:
+        return self._binning.dimension
+
+    @property
+    def shape(self) -> tuple[int]:
+        """Shape of the dense array including the underflow and overflow bins"""
+        return self._shape
+
+    @property
+    def title(self) -> str:
+        return self._title
+
+    @property
+    def labels(self) -> list[str]:
+        return self._labels
+
+    ##############################################
+
+    def __len__(self) -> int:
+        """Number of filled bins"""
+        return self._keys.size
+
+    @property
+    def integral(self) -> float:
+        """Sum of the weights, overflow bins are summed"""
+        return self._accumulator.sum()
+
+    ##############################################
+
+    def _merge(self, keys: np.ndarray, accumulator: np.ndarray, sum_weight_square: np.ndarray) -> None:
+        """Add the accumulators of (unsorted, possibly duplicated) flat indexes"""
+        keys = np.concatenate((self._keys, keys))
+        self._keys, inverse = np.unique(keys, return_inverse=True)
+        size = self._keys.size
+        self._accumulator = np.bincount(
+            inverse, weights=np.concatenate((self._accumulator, accumulator)), minlength=size)
+        self._sum_weight_square = np.bincount(
+            inverse, weights=np.concatenate((self._sum_weight_square, sum_weight_square)), minlength=size)
+
+    ##############################################
+
+    def _check(self, obj: 'HistogramND') -> None:
+        if self.dimension != obj.dimension or any(a != b for a, b in zip(self._binning, obj._binning)):
+            raise ValueError("Histograms have different binning")
+
+    def __iadd__(self, obj: 'HistogramND') -> 'HistogramND':
+        self._check(obj)
+        self._merge(obj._keys, obj._accumulator, obj._sum_weight_square)
+        if self.data_set_moment is not None and obj.data_set_moment is not None:
+            self.data_set_moment += obj.data_set_moment
+        else:
+            self.data_set_moment = None
+        return self
+
+    ##############################################
+
+    def fill(self, *values: float, weight: float=1.) -> None:
+        self.fill_array(*[np.array([_]) for _ in values], weights=np.array([weight], dtype=np.float64))
+
+    ##############################################
+
+    def fill_array(self, *arrays: np.ndarray, weights: np.ndarray=None) -> None:
+        """Fill an array of values per axis, *weights* is an optional array of weights"""
+        if len(arrays) != self.dimension:
+            raise ValueError(f"Expected {self.dimension} arrays")
+        arrays = [np.asarray(_) for _ in arrays]
+        size = arrays[0].size
+        if any(_.ndim != 1 or _.size != size for _ in arrays):
+            raise ValueError("Arrays must be 1D arrays of the same size")
+        bins = [binning.find_bins(x) for binning, x in zip(self._binning, arrays)]
+        keys = np.ravel_multi_index(bins, self._shape)
+        if weights is None:
+            self._merge(keys, np.ones(size), np.ones(size))
+        else:
+            weights = np.asarray(weights, dtype=np.float64)
+            if weights.shape != (size,):
+                raise ValueError("Values and weights must have the same shape")
+            if (weights < 0).any():
+                raise ValueError
+            self._merge(keys, weights, weights**2)
+        if self.data_set_moment is not None:
+            self.data_set_moment.fill_array(*arrays, weights=weights)
+
+    ##############################################
+
+    def bin_indexes(self) -> np.ndarray:
+        """Return the bin indexes of the filled bins as a (number of bins, dimension) array"""
+        return np.stack(np.unravel_index(self._keys, self._shape), axis=1)
+
+    def values(self) -> np.ndarray:
+        return self._accumulator.copy()
+
+    def errors(self) -> np.ndarray:
+        return np.sqrt(self._sum_weight_square)
+
+    ##############################################
+
+    def __getitem__(self, index: tuple[int]) -> float:
+        """Return the accumulator of a bin"""
+        key = np.ravel_multi_index(tuple(index), self._shape)
+        i = np.searchsorted(self._keys, key)
+        if i < self._keys.size and self._keys[i] == key:
+            return float(self._accumulator[i])
+        return 0.
+
+    ##############################################
+
+    def project(self, *axes: int) -> 'HistogramND':
+        """Marginalise onto the given axes, in this order"""
+        if not axes or len(set(axes)) != len(axes):
+            raise ValueError("Invalid axes")
+        indexes = np.unravel_index(self._keys, self._shape)
+        binning = BinningND(*[self._binning[_].clone() for _ in axes])
+        histogram = self._new(binning, [self._labels[_] for _ in axes])
+        keys = np.ravel_multi_index([indexes[_] for _ in axes], histogram.shape)
+        histogram._merge(keys, self._accumulator, self._sum_weight_square)
+        if self.data_set_moment is None:
+            histogram.data_set_moment = None
+        else:
+            moment = histogram.data_set_moment
+            moment._objs = [self.data_set_moment[_].clone() for _ in axes]
+            for (i, j) in moment.co_moments:
+                a, b = sorted((axes[i], axes[j]))
+                moment.co_moments[(i, j)] = self.data_set_moment.co_moments[(a, b)]
+        return histogram
+
+    ##############################################
+
+    def slice(self, axis: int, start: int=None, stop: int=None) -> 'HistogramND':
+        """Keep the bins in [start, stop[ of an axis, indexes include the underflow bin
+
+        The moments are computed from the values and cannot be sliced, thus they are dropped.
+
+        """
+        indexes = np.unravel_index(self._keys, self._shape)[axis]
+        bin_slice = slice(start, stop)
+        start, stop, _ = bin_slice.indices(self._shape[axis])
+        selected = (start <= indexes) & (indexes < stop)
+        histogram = self._new(self._binning, self._labels)
+        histogram._keys = self._keys[selected]
+        histogram._accumulator = self._accumulator[selected]
+        histogram._sum_weight_square = self._sum_weight_square[selected]
+        histogram.data_set_moment = None
+        return histogram
+
+    ##############################################
+
+    def to_array(self) -> np.ndarray:
+        """Return the dense accumulator including the underflow and overflow bins"""
+        array = np.zeros(self._shape)
+        array.flat[self._keys] = self._accumulator
+        return array
+
+    ##############################################
+
+    def to_dense(self) -> Histogram | Histogram2D:
+        """Convert a 1D or 2D histogram to a dense :class:`Histogram` or :class:`Histogram2D`"""
+        match self.dimension:
+            case 1:
+                histogram = Histogram(self._binning[0].clone(), title=self._title or self._labels[0])
+            case 2:
+                histogram = Histogram2D(
+                    BinningND(*[_.clone() for _ in self._binning]),
+                    title=self._title,
+                    x_label=self._labels[0],
+                    y_label=self._labels[1],
+                )
+            case _:
+                raise ValueError("Only 1D and 2D histograms can be converted, use project")
+        histogram._accumulator.flat[self._keys] = self._accumulator
+        histogram._sum_weight_square.flat[self._keys] = self._sum_weight_square
+        if self.data_set_moment is not None:
+            if self.dimension == 1:
+                histogram.data_set_moment = self.data_set_moment[0].clone()
+            else:
+                histogram.data_set_moment = self.data_set_moment.clone()
+        histogram.clear_feature()
+        return histogram
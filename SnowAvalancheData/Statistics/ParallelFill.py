@@ -0,0 +1,197 @@
+####################################################################################################
+#
+# Avalanche -
+# Copyright (C) 2021 Fabrice Salvaire
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+####################################################################################################
+
+"""Module to fill a set of histograms in parallel using a map-reduce.
+
+The columns are split in chunks of a fixed size.  Each chunk fills empty copies of the histograms in
+a worker process (map), then the partial histograms are summed pairwise following a binary tree
+(reduce) and added to the histograms.  Since the chunks and the tree only depend on the chunk size,
+the result doesn't depend on the number of workers, floating point sums included.
+
+Workers receive the column arrays once, when the pool starts, then a task is only a row range, thus
+no accident object is serialised.  The histograms are filled using their ``fill_array`` method::
+
+    filler = HistogramFiller({
+        'altitude': (altitude_histogram, ('altitude',)),
+        'length/width': (length_width_histogram, ('length', 'width')),
+    })
+    filler.fill_register(register, max_workers=4)
+
+"""
+
+####################################################################################################
+
+__all__ = [
+    'HistogramFiller',
+]
+
+####################################################################################################
+
+from concurrent.futures import ProcessPoolExecutor
+import copy
+import logging
+
+import numpy as np
+
+from .Histogram import Histogram
+
+####################################################################################################
+
+_module_logger = logging.getLogger(__name__)
+
+####################################################################################################
+
+ColumnArrays = tuple[np.ndarray, np.ndarray]
+
+# worker state set by _initialise
+_worker_state = None
+
+def _initialise(templates: dict, columns: dict[str, ColumnArrays], weights: np.ndarray) -> None:
+    global _worker_state
+    _worker_state = (templates, columns, weights)
+
+def _fill_chunk(start: int, stop: int) -> dict[str, Histogram]:
+    templates, columns, weights = _worker_state
+    return HistogramFiller.fill_chunk(templates, columns, start, stop, weights)
+
+####################################################################################################
+
+class HistogramFiller:
+
+    DEFAULT_CHUNK_SIZE = 100_000
+
+    ##############################################
+
+    def __init__(self, histograms: dict[str, tuple[Histogram, tuple[str]]], chunk_size: int=DEFAULT_CHUNK_SIZE) -> None:
+        """*histograms* maps a name to a histogram and the attributes filling its axes"""
+        self._histograms = histograms
+        self._chunk_size = int(chunk_size)
+        if self._chunk_size <= 0:
+            raise ValueError("Chunk size must be positive")
+
+    ##############################################
+
+    @property
+    def attributes(self) -> set[str]:
+        return {attribute for _, attributes in self._histograms.values() for attribute in attributes}
+
+    ##############################################
+
+    @staticmethod
+    def _empty(histogram: Histogram) -> Histogram:
+        histogram = copy.deepcopy(histogram)
+        histogram.clear()
+        return histogram
+
+    ##############################################
+
+    @staticmethod
+    def fill_chunk(
+            templates: dict,
+            columns: dict[str, ColumnArrays],
+            start: int,
+            stop: int,
+            weights: np.ndarray=None,
+    ) -> dict[str, Histogram]:
+        """Fill copies of the empty *templates* with the rows [start, stop["""
+        histograms = {}
+        for name, (template, attributes) in templates.items():
+            histogram = copy.deepcopy(template)
+            arrays = [(columns[_][0][start:stop], columns[_][1][start:stop]) for _ in attributes]
+            mask = np.logical_and.reduce([_[1] for _ in arrays])
+            chunk_weights = None if weights is None else weights[start:stop][mask]
+            histogram.fill_array(*[data[mask] for data, _ in arrays], weights=chunk_weights)
+            histograms[name] = histogram
+        return histograms
+
+    ##############################################
+
+    @staticmethod
+    def _reduce(partials: list[dict[str, Histogram]]) -> dict[str, Histogram]:
+        """Sum the partial histograms pairwise, the tree only depends on the number of partials"""
+        while len(partials) > 1:
+            reduced = []
+            for i in range(0, len(partials) - 1, 2):
+                left, right = partials[i], partials[i + 1]
+                for name, histogram in left.items():
+                    histogram += right[name]
+                reduced.append(left)
+            if len(partials) % 2:
+                reduced.append(partials[-1])
+            partials = reduced
+        return partials[0]
+
+    ##############################################
+
+    def fill(self, columns: dict[str, ColumnArrays], max_workers: int=None, weights: np.ndarray=None) -> None:
+        """Fill the histograms from aligned (data, mask) column arrays
+
+        If *max_workers* is 1 the chunks are filled in this process, None means the number of CPUs.
+        *weights* is an optional array of weights aligned on the columns.
+
+        """
+        sizes = {_[0].shape[0] for _ in columns.values()}
+        if len(sizes) > 1:
+            raise ValueError("Columns must have the same size")
+        size = sizes.pop() if sizes else 0
+        if not size:
+            return
+        if weights is not None:
+            weights = np.asarray(weights, dtype=np.float64)
+            if weights.shape != (size,):
+                raise ValueError("Weights must be aligned on the columns")
+        templates = {
+            name: (self._empty(histogram), tuple(attributes))
+            for name, (histogram, attributes) in self._histograms.items()
+        }
+        # only ship the required columns
+        columns = {_: columns[_] for _ in self.attributes}
+        ranges = [(start, min(start + self._chunk_size, size)) for start in range(0, size, self._chunk_size)]
+        if max_workers == 1 or len(ranges) == 1:
+            partials = [self.fill_chunk(templates, columns, start, stop, weights) for start, stop in ranges]
+        else:
+            with ProcessPoolExecutor(
+                    max_workers=max_workers,
+                    initializer=_initialise,
+                    initargs=(templates, columns, weights),
+            ) as executor:
+                starts, stops = zip(*ranges)
+                # map preserves the order of the chunks
+                partials = list(executor.map(_fill_chunk, starts, stops))
+        _module_logger.info(f"Filled {len(ranges)} chunks")
+        for name, partial in self._reduce(partials).items():
+            histogram = self._histograms[name][0]
+            histogram += partial
+
+    ##############################################
+
+    def fill_register(
+            self,
+            register: 'AccidentRegisterMixin',
+            max_workers: int=None,
+            weights: np.ndarray=None,
+    ) -> None:
+        """Fill the histograms from a register or a view, values use the column representation
+
+        *weights* is an optional array of weights aligned on the register rows.
+
+        """
+        columns = {_: register.column_arrays(_) for _ in self.attributes}
+        self.fill(columns, max_workers, weights)
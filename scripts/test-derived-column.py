@@ -0,0 +1,31 @@
+import numpy as np
+
+from SnowAvalancheData.Data import AccidentRegister
+from SnowAvalancheData.Data.Accident import Accident
+from SnowAvalancheData.Data.DerivedColumn import DerivedColumn
+
+register = AccidentRegister()
+for i, altitude in enumerate((1000, 2000, None)):
+    register += Accident(code=f'test-{i}', altitude=altitude)
+
+def scaled(factor):
+    def function(columns):
+        data, mask = columns['altitude']
+        return data * factor, mask
+    return function
+
+DerivedColumn.register(Accident, DerivedColumn('alt2', ('altitude',), scaled(2)))
+print(register.vectorise('alt2'))
+assert (register.vectorise('alt2') == [2000, 4000]).all()
+
+# a replaced derived column must not be read from the cache
+DerivedColumn.register(Accident, DerivedColumn('alt2', ('altitude',), scaled(3)))
+print(register.vectorise('alt2'))
+assert (register.vectorise('alt2') == [3000, 6000]).all()
+
+# and neither a column derived from it
+DerivedColumn.register(Accident, DerivedColumn('alt4', ('alt2',), lambda columns: (columns['alt2'][0] * 2, columns['alt2'][1])))
+assert (register.vectorise('alt4') == [6000, 12000]).all()
+DerivedColumn.register(Accident, DerivedColumn('alt2', ('altitude',), scaled(1)))
+print(register.vectorise('alt4'))
+assert (register.vectorise('alt4') == [2000, 4000]).all()
@@ -0,0 +1,37 @@
+import json
+import tempfile
+import warnings
+from pathlib import Path
+
+from SnowAvalancheData.Data import AccidentRegister
+
+# the bulk loader must accept the same dates as the model and store the same values
+warnings.simplefilter('error', DeprecationWarning)
+
+def load(dates: list, bulk: bool) -> list:
+    with tempfile.TemporaryDirectory() as directory:
+        path = Path(directory, 'accidents.json')
+        with open(path, 'w') as fh:
+            json.dump([{'code': f'test-{i}', 'date': _} for i, _ in enumerate(dates)], fh)
+        register = AccidentRegister.load_json(path, bulk=bulk)
+        return [_.date for _ in register]
+
+valid_dates = (
+    ['2020-01-15T10:00:00', '2020-01-15 10:00', '2020-01-15T10:00:00.5'],
+    ['2020-01-15T10:00:00Z', '2020-01-15T10:00:00+02:00', '2020-01-15T10:00:00-0130', '2020-01-15T10:00:00+02'],
+    ['2020-1-5T1:2:3', '2020-01-15T10:00:00+02:00'],
+    [1579082400, '2020-01-15T10:00:00'],
+)
+for dates in valid_dates:
+    bulk_dates = load(dates, bulk=True)
+    print(bulk_dates)
+    assert bulk_dates == load(dates, bulk=False)
+
+for dates in (['2020-01-15'], ['2020-01-15T10:00:00', '2020-02-30T10:00:00']):
+    for bulk in (True, False):
+        try:
+            load(dates, bulk)
+        except ValueError as exception:
+            print(bulk, type(exception).__name__)
+        else:
+            raise AssertionError(f"{dates} accepted with bulk={bulk}")
@@ -0,0 +1,34 @@
+import numpy as np
+
+from SnowAvalancheData.Statistics.BinningAlgorithm import knuth_bin_width
+
+rng = np.random.default_rng(0)
+
+def check_quantised(data: np.ndarray, resolution: float) -> None:
+    """The bin width must be a whole multiple of the resolution and the bins hold the same number of
+    possible values, else the histogram shows a comb
+    """
+    bin_width, bins = knuth_bin_width(data, return_bins=True)
+    multiple = bin_width / resolution
+    print(bin_width, multiple, bins.size - 1)
+    assert multiple >= 1 - 1e-9
+    assert abs(multiple - round(multiple)) < 1e-6
+    grid = np.round(np.arange(data.min(), data.max() + resolution/2, resolution) / resolution) * resolution
+    counts = np.histogram(grid, bins)[0]
+    # the last bin can extend beyond the maximum
+    assert (counts[:-1] == round(multiple)).all() and 0 < counts[-1] <= round(multiple)
+    assert np.histogram(data, bins)[0].sum() == data.size
+
+# integer data like the register columns
+for sigma in (50, 20, 5):
+    check_quantised(np.round(rng.normal(200, sigma, 5000)), 1)
+check_quantised(rng.integers(0, 300, 5000), 1)
+check_quantised(np.round(rng.normal(2000, 500, 500) / 10) * 10, 10)
+
+# data quantised to 0.1
+check_quantised(np.round(rng.normal(2000, 300, 5000), 1), .1)
+
+# continuous data
+bin_width = knuth_bin_width(rng.normal(0, 1, 5000))
+print(bin_width)
+assert 0 < bin_width < 1
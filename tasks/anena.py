@@ -31,6 +31,7 @@ from pprint import pprint
 from invoke import task
 
 from SnowAvalancheData.Cartography.Ign import IgnApi
+from SnowAvalancheData.Data.BinarySnapshot import SNAPSHOT_SUFFIX
 from SnowAvalancheData.Importer.Anena import AccidentBook, AccidentRegister, Accident
 from SnowAvalancheData.Importer.Anena import XlsImporter
 
@@ -73,10 +74,19 @@ def to_json(
 
 ####################################################################################################
 
+@task
+def snapshot(ctx, json_path='anena-accidents.json'):
+    """Write the binary snapshot used by the analysis"""
+    accidents = AccidentRegister.load_json(json_path)
+    accidents.save_binary(Path(json_path).with_suffix(SNAPSHOT_SUFFIX))
+
+####################################################################################################
+
 @task
 def check(ctx, json_path='anena-accidents.json'):
     accidents = AccidentRegister.load_json(json_path)
-    for accident in accidents:
-        if not accident.check():
-            pprint(accident.dict())
-            print()
+    report = accidents.check_consistency()
+    print(f'{len(report)} violations')
+    pprint(report.counts())
+    for code, rule, values in report:
+        print(f'{code} {rule} {values}')